@@ -0,0 +1,36 @@
+-- SQLite port of create.sql for the embedded backend (db/Backend.py).
+-- IDENTITY becomes AUTOINCREMENT and text columns use NOCASE to match the
+-- case-insensitive default collation of Azure SQL.
+
+CREATE TABLE IF NOT EXISTS Patients (
+    Username VARCHAR(255) COLLATE NOCASE PRIMARY KEY,
+    Salt BINARY(16),
+    Hash BINARY(16)
+);
+
+CREATE TABLE IF NOT EXISTS Caregivers (
+    Username VARCHAR(255) COLLATE NOCASE PRIMARY KEY,
+    Salt BINARY(16),
+    Hash BINARY(16)
+);
+
+CREATE TABLE IF NOT EXISTS Availabilities (
+    Time DATE,
+    Username VARCHAR(255) COLLATE NOCASE REFERENCES Caregivers(Username),
+    Reserved BIT DEFAULT 0,
+    PRIMARY KEY (Time, Username)
+);
+
+CREATE TABLE IF NOT EXISTS Vaccines (
+    Name VARCHAR(255) COLLATE NOCASE PRIMARY KEY,
+    Doses INT
+);
+
+CREATE TABLE IF NOT EXISTS Appointments (
+    Appointment_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    Patient_Username VARCHAR(255) COLLATE NOCASE NOT NULL REFERENCES Patients(Username),
+    Caregiver_Username VARCHAR(255) COLLATE NOCASE NOT NULL REFERENCES Caregivers(Username),
+    Vaccine_Name VARCHAR(255) COLLATE NOCASE NOT NULL REFERENCES Vaccines(Name),
+    Date DATE NOT NULL,
+    FOREIGN KEY (Date, Caregiver_Username) REFERENCES Availabilities(Time, Username)
+);
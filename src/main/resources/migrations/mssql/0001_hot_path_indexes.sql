@@ -0,0 +1,17 @@
+-- reserve: open slots for a date, already in caregiver order
+CREATE NONCLUSTERED INDEX IX_Availabilities_Open
+    ON Availabilities (Time, Username)
+    WHERE Reserved = 0;
+
+-- show_appointments for a patient / caregiver, covering the listed columns
+CREATE NONCLUSTERED INDEX IX_Appointments_Patient
+    ON Appointments (Patient_Username, Appointment_ID)
+    INCLUDE (Date, Vaccine_Name, Caregiver_Username);
+
+CREATE NONCLUSTERED INDEX IX_Appointments_Caregiver
+    ON Appointments (Caregiver_Username, Appointment_ID)
+    INCLUDE (Date, Vaccine_Name, Patient_Username);
+
+-- cancel / foreign key checks back to Availabilities (Time, Username)
+CREATE NONCLUSTERED INDEX IX_Appointments_Slot
+    ON Appointments (Date, Caregiver_Username);
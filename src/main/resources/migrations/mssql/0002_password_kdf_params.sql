@@ -0,0 +1,4 @@
+-- KDF parameters per account, e.g. 'pbkdf2_sha256$100000'.
+-- NULL marks hashes written before parameters were stored (pbkdf2_sha256, 100000).
+ALTER TABLE Patients ADD Kdf VARCHAR(64) NULL;
+ALTER TABLE Caregivers ADD Kdf VARCHAR(64) NULL;
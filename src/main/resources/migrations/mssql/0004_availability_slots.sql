@@ -0,0 +1,23 @@
+-- An availability row becomes a window of Slots equal slots starting at
+-- Start_Minute (minutes after midnight), Slot_Minutes long. Booked counts the
+-- taken slots and Reserved is set once the window is full, so
+-- IX_Availabilities_Open keeps indexing exactly the rows with an open slot.
+-- Existing rows become one 09:00-17:00 slot.
+ALTER TABLE Availabilities ADD
+    Start_Minute INT NOT NULL CONSTRAINT DF_Availabilities_Start_Minute DEFAULT 540,
+    Slot_Minutes INT NOT NULL CONSTRAINT DF_Availabilities_Slot_Minutes DEFAULT 480,
+    Slots INT NOT NULL CONSTRAINT DF_Availabilities_Slots DEFAULT 1,
+    Booked INT NOT NULL CONSTRAINT DF_Availabilities_Booked DEFAULT 0;
+GO
+
+UPDATE Availabilities SET Booked = 1 WHERE Reserved = 1;
+
+-- Each appointment holds one slot, identified by its start time
+ALTER TABLE Appointments ADD
+    Slot_Minute INT NOT NULL CONSTRAINT DF_Appointments_Slot_Minute DEFAULT 540;
+GO
+
+DROP INDEX IX_Appointments_Slot ON Appointments;
+
+CREATE UNIQUE NONCLUSTERED INDEX UX_Appointments_Slot
+    ON Appointments (Date, Caregiver_Username, Slot_Minute);
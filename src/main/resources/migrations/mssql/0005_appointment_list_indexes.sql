@@ -0,0 +1,13 @@
+-- show_appointments also lists the slot time and filters on Date; keep both
+-- per-user indexes covering so paging never touches the base table.
+DROP INDEX IX_Appointments_Patient ON Appointments;
+
+CREATE NONCLUSTERED INDEX IX_Appointments_Patient
+    ON Appointments (Patient_Username, Appointment_ID)
+    INCLUDE (Date, Vaccine_Name, Caregiver_Username, Slot_Minute);
+
+DROP INDEX IX_Appointments_Caregiver ON Appointments;
+
+CREATE NONCLUSTERED INDEX IX_Appointments_Caregiver
+    ON Appointments (Caregiver_Username, Appointment_ID)
+    INCLUDE (Date, Vaccine_Name, Patient_Username, Slot_Minute);
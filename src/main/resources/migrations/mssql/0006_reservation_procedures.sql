@@ -0,0 +1,148 @@
+-- Server-side reserve and cancel for model/Appointment.py: one EXEC replaces
+-- the statement-per-step flow, which matters when every statement is a WAN
+-- round trip. Both procedures answer with a single row whose Status is
+--   0 = done, 1 = no caregiver available (reserve), 2 = not enough doses
+--   (reserve) / no such appointment (cancel)
+-- plus the vaccine row after the change, for the in-process inventory cache.
+-- They join the caller's transaction when there is one (through a savepoint)
+-- and leave the commit to the caller.
+CREATE PROCEDURE dbo.ReserveAppointment
+    @Patient VARCHAR(255),
+    @Date DATE,
+    @Vaccine VARCHAR(255),
+    @Strategy VARCHAR(32) = 'first',
+    @After VARCHAR(255) = ''
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @TranCount INT = @@TRANCOUNT;
+    DECLARE @Claimed TABLE (Username VARCHAR(255), Start_Minute INT, Slot_Minutes INT, Slots INT);
+    DECLARE @Dose TABLE (Name VARCHAR(255), Doses INT, Version INT);
+    DECLARE @Caregiver VARCHAR(255), @Start INT, @Length INT, @Slots INT, @Minute INT, @Id INT;
+
+    IF @TranCount = 0 BEGIN TRANSACTION;
+    ELSE SAVE TRANSACTION ReserveAppointment;
+
+    -- Claim a slot the way model/Assignment.py would
+    IF @Strategy = 'random'
+    BEGIN
+        ;WITH slot AS (
+            SELECT TOP (1) a.Username, a.Reserved, a.Booked, a.Slots, a.Start_Minute, a.Slot_Minutes
+            FROM Availabilities a WITH (UPDLOCK, ROWLOCK, READPAST)
+            WHERE a.Time = @Date AND a.Reserved = 0
+            ORDER BY NEWID()
+        )
+        UPDATE slot
+        SET Booked = Booked + 1, Reserved = CASE WHEN Booked + 1 >= Slots THEN 1 ELSE 0 END
+        OUTPUT INSERTED.Username, INSERTED.Start_Minute, INSERTED.Slot_Minutes, INSERTED.Slots INTO @Claimed;
+    END
+    ELSE
+    BEGIN
+        ;WITH slot AS (
+            SELECT TOP (1) a.Username, a.Reserved, a.Booked, a.Slots, a.Start_Minute, a.Slot_Minutes
+            FROM Availabilities a WITH (UPDLOCK, ROWLOCK)
+            WHERE a.Time = @Date AND a.Reserved = 0
+            ORDER BY
+                CASE WHEN @Strategy = 'least_loaded'
+                     THEN (SELECT COUNT(*) FROM Appointments ap WHERE ap.Caregiver_Username = a.Username) END,
+                CASE WHEN @Strategy = 'round_robin' AND a.Username <= @After THEN 1 ELSE 0 END,
+                a.Username
+        )
+        UPDATE slot
+        SET Booked = Booked + 1, Reserved = CASE WHEN Booked + 1 >= Slots THEN 1 ELSE 0 END
+        OUTPUT INSERTED.Username, INSERTED.Start_Minute, INSERTED.Slot_Minutes, INSERTED.Slots INTO @Claimed;
+    END
+
+    SELECT @Caregiver = Username, @Start = Start_Minute, @Length = Slot_Minutes, @Slots = Slots FROM @Claimed;
+    IF @Caregiver IS NULL
+    BEGIN
+        IF @TranCount = 0 ROLLBACK TRANSACTION;
+        ELSE ROLLBACK TRANSACTION ReserveAppointment;
+        SELECT 1 AS Status, NULL AS Appointment_ID, NULL AS Caregiver_Username, NULL AS Slot_Minute,
+               NULL AS Name, NULL AS Doses, NULL AS Version;
+        RETURN;
+    END
+
+    UPDATE Vaccines
+    SET Doses = Doses - 1, Version = Version + 1
+    OUTPUT INSERTED.Name, INSERTED.Doses, INSERTED.Version INTO @Dose
+    WHERE Name = @Vaccine AND Doses - 1 >= 0;
+    IF NOT EXISTS (SELECT 1 FROM @Dose)
+    BEGIN
+        IF @TranCount = 0 ROLLBACK TRANSACTION;
+        ELSE ROLLBACK TRANSACTION ReserveAppointment;
+        SELECT 2 AS Status, NULL AS Appointment_ID, NULL AS Caregiver_Username, NULL AS Slot_Minute,
+               NULL AS Name, NULL AS Doses, NULL AS Version;
+        RETURN;
+    END
+
+    -- Earliest slot of the window without an appointment; the Booked claim
+    -- above guarantees there is one
+    ;WITH minutes AS (
+        SELECT @Start AS Minute
+        UNION ALL
+        SELECT Minute + @Length FROM minutes WHERE Minute + @Length < @Start + @Slots * @Length
+    )
+    SELECT TOP (1) @Minute = Minute
+    FROM minutes
+    WHERE NOT EXISTS (
+        SELECT 1 FROM Appointments ap
+        WHERE ap.Date = @Date AND ap.Caregiver_Username = @Caregiver AND ap.Slot_Minute = minutes.Minute
+    )
+    ORDER BY Minute
+    OPTION (MAXRECURSION 1440);
+
+    INSERT INTO Appointments (Patient_Username, Caregiver_Username, Vaccine_Name, Date, Slot_Minute)
+    VALUES (@Patient, @Caregiver, @Vaccine, @Date, @Minute);
+    SET @Id = SCOPE_IDENTITY();
+
+    IF @TranCount = 0 COMMIT TRANSACTION;
+    SELECT 0 AS Status, @Id AS Appointment_ID, @Caregiver AS Caregiver_Username, @Minute AS Slot_Minute,
+           Name, Doses, Version
+    FROM @Dose;
+END
+GO
+
+CREATE PROCEDURE dbo.CancelAppointment
+    @Id INT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @TranCount INT = @@TRANCOUNT;
+    DECLARE @Deleted TABLE (Patient_Username VARCHAR(255), Caregiver_Username VARCHAR(255),
+                            Vaccine_Name VARCHAR(255), Date DATE, Slot_Minute INT);
+    DECLARE @Dose TABLE (Name VARCHAR(255), Doses INT, Version INT);
+
+    IF @TranCount = 0 BEGIN TRANSACTION;
+
+    DELETE FROM Appointments
+    OUTPUT DELETED.Patient_Username, DELETED.Caregiver_Username, DELETED.Vaccine_Name,
+           DELETED.Date, DELETED.Slot_Minute INTO @Deleted
+    WHERE Appointment_ID = @Id;
+
+    IF NOT EXISTS (SELECT 1 FROM @Deleted)
+    BEGIN
+        IF @TranCount = 0 COMMIT TRANSACTION;
+        SELECT 2 AS Status, NULL AS Patient_Username, NULL AS Caregiver_Username, NULL AS Vaccine_Name,
+               NULL AS Date, NULL AS Slot_Minute, NULL AS Name, NULL AS Doses, NULL AS Version;
+        RETURN;
+    END
+
+    UPDATE a
+    SET Booked = a.Booked - 1, Reserved = 0
+    FROM Availabilities a
+    JOIN @Deleted d ON a.Time = d.Date AND a.Username = d.Caregiver_Username
+    WHERE a.Booked > 0;
+
+    UPDATE v
+    SET Doses = v.Doses + 1, Version = v.Version + 1
+    OUTPUT INSERTED.Name, INSERTED.Doses, INSERTED.Version INTO @Dose
+    FROM Vaccines v
+    JOIN @Deleted d ON v.Name = d.Vaccine_Name;
+
+    IF @TranCount = 0 COMMIT TRANSACTION;
+    SELECT 0 AS Status, d.Patient_Username, d.Caregiver_Username, d.Vaccine_Name, d.Date, d.Slot_Minute,
+           v.Name, v.Doses, v.Version
+    FROM @Deleted d
+    LEFT JOIN @Dose v ON 1 = 1;
+END
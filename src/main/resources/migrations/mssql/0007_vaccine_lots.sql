@@ -0,0 +1,195 @@
+-- Dose inventory moves from one Vaccines.Doses counter per vaccine to
+-- VaccineLots. Each lot (a delivery, with an optional expiry date) is split
+-- over shard rows and a reservation takes its dose from any shard with
+-- stock, so concurrent bookings of one vaccine stop queueing on one row.
+-- Version is bumped on every change so in-process inventory caches
+-- (model/Vaccine.py) can tell newer rows from older ones. Existing stock
+-- becomes lot 'initial', shard 0.
+CREATE TABLE VaccineLots (
+    Vaccine_Name VARCHAR(255) NOT NULL REFERENCES Vaccines(Name),
+    Lot VARCHAR(64) NOT NULL,
+    Shard INT NOT NULL,
+    Expires DATE NULL,
+    Doses INT NOT NULL CONSTRAINT DF_VaccineLots_Doses DEFAULT 0
+        CONSTRAINT CK_VaccineLots_Doses CHECK (Doses >= 0),
+    Version INT NOT NULL CONSTRAINT DF_VaccineLots_Version DEFAULT 0,
+    CONSTRAINT PK_VaccineLots PRIMARY KEY (Vaccine_Name, Lot, Shard)
+);
+GO
+
+INSERT INTO VaccineLots (Vaccine_Name, Lot, Shard, Expires, Doses, Version)
+SELECT Name, 'initial', 0, NULL, Doses, Version FROM Vaccines WHERE Doses > 0;
+
+ALTER TABLE Vaccines DROP CONSTRAINT DF_Vaccines_Version;
+ALTER TABLE Vaccines DROP COLUMN Doses, Version;
+
+-- The lot shard an appointment's dose came from, so cancel can put it back
+ALTER TABLE Appointments ADD Lot VARCHAR(64) NULL, Dose_Shard INT NULL;
+GO
+
+-- The procedures of migration 0006, drawing doses from VaccineLots. Reserve
+-- takes the earliest-expiring lot that is still good on the appointment date
+-- and a random unlocked shard of it. Status 3 means every shard with stock
+-- was locked by other reservations; the caller retries. The vaccine columns
+-- of the result are the lot shard row after the change.
+CREATE OR ALTER PROCEDURE dbo.ReserveAppointment
+    @Patient VARCHAR(255),
+    @Date DATE,
+    @Vaccine VARCHAR(255),
+    @Strategy VARCHAR(32) = 'first',
+    @After VARCHAR(255) = ''
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @TranCount INT = @@TRANCOUNT;
+    DECLARE @Claimed TABLE (Username VARCHAR(255), Start_Minute INT, Slot_Minutes INT, Slots INT);
+    DECLARE @Dose TABLE (Name VARCHAR(255), Lot VARCHAR(64), Shard INT, Expires DATE, Doses INT, Version INT);
+    DECLARE @Caregiver VARCHAR(255), @Start INT, @Length INT, @Slots INT, @Minute INT, @Id INT, @Status INT;
+
+    IF @TranCount = 0 BEGIN TRANSACTION;
+    ELSE SAVE TRANSACTION ReserveAppointment;
+
+    -- Claim a slot the way model/Assignment.py would
+    IF @Strategy = 'random'
+    BEGIN
+        ;WITH slot AS (
+            SELECT TOP (1) a.Username, a.Reserved, a.Booked, a.Slots, a.Start_Minute, a.Slot_Minutes
+            FROM Availabilities a WITH (UPDLOCK, ROWLOCK, READPAST)
+            WHERE a.Time = @Date AND a.Reserved = 0
+            ORDER BY NEWID()
+        )
+        UPDATE slot
+        SET Booked = Booked + 1, Reserved = CASE WHEN Booked + 1 >= Slots THEN 1 ELSE 0 END
+        OUTPUT INSERTED.Username, INSERTED.Start_Minute, INSERTED.Slot_Minutes, INSERTED.Slots INTO @Claimed;
+    END
+    ELSE
+    BEGIN
+        ;WITH slot AS (
+            SELECT TOP (1) a.Username, a.Reserved, a.Booked, a.Slots, a.Start_Minute, a.Slot_Minutes
+            FROM Availabilities a WITH (UPDLOCK, ROWLOCK)
+            WHERE a.Time = @Date AND a.Reserved = 0
+            ORDER BY
+                CASE WHEN @Strategy = 'least_loaded'
+                     THEN (SELECT COUNT(*) FROM Appointments ap WHERE ap.Caregiver_Username = a.Username) END,
+                CASE WHEN @Strategy = 'round_robin' AND a.Username <= @After THEN 1 ELSE 0 END,
+                a.Username
+        )
+        UPDATE slot
+        SET Booked = Booked + 1, Reserved = CASE WHEN Booked + 1 >= Slots THEN 1 ELSE 0 END
+        OUTPUT INSERTED.Username, INSERTED.Start_Minute, INSERTED.Slot_Minutes, INSERTED.Slots INTO @Claimed;
+    END
+
+    SELECT @Caregiver = Username, @Start = Start_Minute, @Length = Slot_Minutes, @Slots = Slots FROM @Claimed;
+    IF @Caregiver IS NULL
+        SET @Status = 1;
+    ELSE
+    BEGIN
+        ;WITH dose AS (
+            SELECT TOP (1) l.Vaccine_Name, l.Lot, l.Shard, l.Expires, l.Doses, l.Version
+            FROM VaccineLots l WITH (UPDLOCK, ROWLOCK, READPAST)
+            WHERE l.Vaccine_Name = @Vaccine AND l.Doses > 0 AND (l.Expires IS NULL OR l.Expires >= @Date)
+            ORDER BY CASE WHEN l.Expires IS NULL THEN 1 ELSE 0 END, l.Expires, NEWID()
+        )
+        UPDATE dose
+        SET Doses = Doses - 1, Version = Version + 1
+        OUTPUT INSERTED.Vaccine_Name, INSERTED.Lot, INSERTED.Shard, INSERTED.Expires, INSERTED.Doses,
+               INSERTED.Version INTO @Dose;
+
+        IF NOT EXISTS (SELECT 1 FROM @Dose)
+            SET @Status = CASE WHEN EXISTS (
+                SELECT 1 FROM VaccineLots
+                WHERE Vaccine_Name = @Vaccine AND Doses > 0 AND (Expires IS NULL OR Expires >= @Date)
+            ) THEN 3 ELSE 2 END;
+    END
+
+    IF @Status IS NOT NULL
+    BEGIN
+        IF @TranCount = 0 ROLLBACK TRANSACTION;
+        ELSE ROLLBACK TRANSACTION ReserveAppointment;
+        SELECT @Status AS Status, NULL AS Appointment_ID, NULL AS Caregiver_Username, NULL AS Slot_Minute,
+               NULL AS Name, NULL AS Lot, NULL AS Shard, NULL AS Expires, NULL AS Doses, NULL AS Version;
+        RETURN;
+    END
+
+    -- Earliest slot of the window without an appointment; the Booked claim
+    -- above guarantees there is one
+    ;WITH minutes AS (
+        SELECT @Start AS Minute
+        UNION ALL
+        SELECT Minute + @Length FROM minutes WHERE Minute + @Length < @Start + @Slots * @Length
+    )
+    SELECT TOP (1) @Minute = Minute
+    FROM minutes
+    WHERE NOT EXISTS (
+        SELECT 1 FROM Appointments ap
+        WHERE ap.Date = @Date AND ap.Caregiver_Username = @Caregiver AND ap.Slot_Minute = minutes.Minute
+    )
+    ORDER BY Minute
+    OPTION (MAXRECURSION 1440);
+
+    INSERT INTO Appointments (Patient_Username, Caregiver_Username, Vaccine_Name, Date, Slot_Minute, Lot, Dose_Shard)
+    SELECT @Patient, @Caregiver, @Vaccine, @Date, @Minute, Lot, Shard FROM @Dose;
+    SET @Id = SCOPE_IDENTITY();
+
+    IF @TranCount = 0 COMMIT TRANSACTION;
+    SELECT 0 AS Status, @Id AS Appointment_ID, @Caregiver AS Caregiver_Username, @Minute AS Slot_Minute,
+           Name, Lot, Shard, Expires, Doses, Version
+    FROM @Dose;
+END
+GO
+
+-- Appointments booked before this migration return their dose to lot
+-- 'initial', shard 0
+CREATE OR ALTER PROCEDURE dbo.CancelAppointment
+    @Id INT
+AS
+BEGIN
+    SET NOCOUNT ON;
+    DECLARE @TranCount INT = @@TRANCOUNT;
+    DECLARE @Deleted TABLE (Patient_Username VARCHAR(255), Caregiver_Username VARCHAR(255),
+                            Vaccine_Name VARCHAR(255), Date DATE, Slot_Minute INT,
+                            Lot VARCHAR(64), Dose_Shard INT);
+    DECLARE @Dose TABLE (Name VARCHAR(255), Lot VARCHAR(64), Shard INT, Expires DATE, Doses INT, Version INT);
+
+    IF @TranCount = 0 BEGIN TRANSACTION;
+
+    DELETE FROM Appointments
+    OUTPUT DELETED.Patient_Username, DELETED.Caregiver_Username, DELETED.Vaccine_Name,
+           DELETED.Date, DELETED.Slot_Minute, COALESCE(DELETED.Lot, 'initial'),
+           COALESCE(DELETED.Dose_Shard, 0) INTO @Deleted
+    WHERE Appointment_ID = @Id;
+
+    IF NOT EXISTS (SELECT 1 FROM @Deleted)
+    BEGIN
+        IF @TranCount = 0 COMMIT TRANSACTION;
+        SELECT 2 AS Status, NULL AS Patient_Username, NULL AS Caregiver_Username, NULL AS Vaccine_Name,
+               NULL AS Date, NULL AS Slot_Minute, NULL AS Name, NULL AS Lot, NULL AS Shard, NULL AS Expires,
+               NULL AS Doses, NULL AS Version;
+        RETURN;
+    END
+
+    UPDATE a
+    SET Booked = a.Booked - 1, Reserved = 0
+    FROM Availabilities a
+    JOIN @Deleted d ON a.Time = d.Date AND a.Username = d.Caregiver_Username
+    WHERE a.Booked > 0;
+
+    UPDATE l
+    SET Doses = l.Doses + 1, Version = l.Version + 1
+    OUTPUT INSERTED.Vaccine_Name, INSERTED.Lot, INSERTED.Shard, INSERTED.Expires, INSERTED.Doses,
+           INSERTED.Version INTO @Dose
+    FROM VaccineLots l
+    JOIN @Deleted d ON l.Vaccine_Name = d.Vaccine_Name AND l.Lot = d.Lot AND l.Shard = d.Dose_Shard;
+
+    IF NOT EXISTS (SELECT 1 FROM @Dose)
+        INSERT INTO VaccineLots (Vaccine_Name, Lot, Shard, Doses)
+        OUTPUT INSERTED.Vaccine_Name, INSERTED.Lot, INSERTED.Shard, INSERTED.Expires, INSERTED.Doses,
+               INSERTED.Version INTO @Dose
+        SELECT Vaccine_Name, Lot, Dose_Shard, 1 FROM @Deleted;
+
+    IF @TranCount = 0 COMMIT TRANSACTION;
+    SELECT 0 AS Status, d.Patient_Username, d.Caregiver_Username, d.Vaccine_Name, d.Date, d.Slot_Minute,
+           v.Name, v.Lot, v.Shard, v.Expires, v.Doses, v.Version
+    FROM @Deleted d
+    LEFT JOIN @Dose v ON 1 = 1;
+END
@@ -0,0 +1,43 @@
+-- find_open_dates: open slots per day, kept current by a trigger on
+-- Availabilities so every writer (upload, reserve, cancel, the stored
+-- procedures, bulk loads) maintains it in its own transaction. A day's count
+-- is spread over the shards named by Availabilities.Open_Shard, so
+-- reservations on a busy day don't all update one row; readers add the
+-- shards up.
+ALTER TABLE Availabilities ADD
+    Open_Shard INT NOT NULL CONSTRAINT DF_Availabilities_Open_Shard DEFAULT 0;
+GO
+
+UPDATE Availabilities SET Open_Shard = ABS(CHECKSUM(Username)) % 8;
+
+CREATE TABLE OpenDays (
+    Time DATE NOT NULL,
+    Shard INT NOT NULL,
+    Open_Slots INT NOT NULL CONSTRAINT DF_OpenDays_Open_Slots DEFAULT 0,
+    CONSTRAINT PK_OpenDays PRIMARY KEY (Time, Shard)
+);
+
+INSERT INTO OpenDays (Time, Shard, Open_Slots)
+SELECT Time, Open_Shard, SUM(Slots - Booked) FROM Availabilities GROUP BY Time, Open_Shard;
+GO
+
+CREATE TRIGGER TR_Availabilities_OpenDays ON Availabilities
+AFTER INSERT, UPDATE, DELETE
+AS
+BEGIN
+    SET NOCOUNT ON;
+    WITH changes AS (
+        SELECT Time, Open_Shard, Slots - Booked AS Delta FROM inserted
+        UNION ALL
+        SELECT Time, Open_Shard, Booked - Slots FROM deleted
+    ), net AS (
+        SELECT Time, Open_Shard, SUM(Delta) AS Delta
+        FROM changes
+        GROUP BY Time, Open_Shard
+        HAVING SUM(Delta) <> 0
+    )
+    MERGE OpenDays WITH (HOLDLOCK) AS o
+    USING net AS n ON o.Time = n.Time AND o.Shard = n.Open_Shard
+    WHEN MATCHED THEN UPDATE SET Open_Slots = o.Open_Slots + n.Delta
+    WHEN NOT MATCHED THEN INSERT (Time, Shard, Open_Slots) VALUES (n.Time, n.Open_Shard, n.Delta);
+END
@@ -0,0 +1,20 @@
+-- reserve --wait: patients queued for a date and vaccine that had no
+-- caregiver or dose left. Whatever adds capacity (cancel, upload_availability,
+-- add_doses) books them in the same transaction, in Waitlist_ID order or by
+-- Priority first (WaitlistOrder).
+CREATE TABLE Waitlist (
+    Waitlist_ID INT IDENTITY(1,1) PRIMARY KEY,
+    Patient_Username VARCHAR(255) NOT NULL REFERENCES Patients(Username),
+    Vaccine_Name VARCHAR(255) NOT NULL REFERENCES Vaccines(Name),
+    Date DATE NOT NULL,
+    Priority INT NOT NULL CONSTRAINT DF_Waitlist_Priority DEFAULT 0,
+    Joined DATETIME2 NOT NULL CONSTRAINT DF_Waitlist_Joined DEFAULT SYSUTCDATETIME()
+);
+
+-- one place in line per patient, date and vaccine
+CREATE UNIQUE INDEX UX_Waitlist_Patient ON Waitlist (Patient_Username, Date, Vaccine_Name);
+
+-- backfill looks waiters up by the dates that gained slots or by the vaccine
+-- that gained doses
+CREATE INDEX IX_Waitlist_Date ON Waitlist (Date, Priority, Waitlist_ID);
+CREATE INDEX IX_Waitlist_Vaccine ON Waitlist (Vaccine_Name, Date);
@@ -0,0 +1,3 @@
+-- Bumped on every change to a vaccine row so in-process inventory caches
+-- (model/Vaccine.py) can tell newer rows from older ones.
+ALTER TABLE Vaccines ADD COLUMN Version INT NOT NULL DEFAULT 0;
@@ -0,0 +1,19 @@
+-- An availability row becomes a window of Slots equal slots starting at
+-- Start_Minute (minutes after midnight), Slot_Minutes long. Booked counts the
+-- taken slots and Reserved is set once the window is full. Existing rows
+-- become one 09:00-17:00 slot.
+
+ALTER TABLE Availabilities ADD COLUMN Start_Minute INT NOT NULL DEFAULT 540;
+ALTER TABLE Availabilities ADD COLUMN Slot_Minutes INT NOT NULL DEFAULT 480;
+ALTER TABLE Availabilities ADD COLUMN Slots INT NOT NULL DEFAULT 1;
+ALTER TABLE Availabilities ADD COLUMN Booked INT NOT NULL DEFAULT 0;
+
+UPDATE Availabilities SET Booked = 1 WHERE Reserved = 1;
+
+-- Each appointment holds one slot, identified by its start time
+ALTER TABLE Appointments ADD COLUMN Slot_Minute INT NOT NULL DEFAULT 540;
+
+DROP INDEX IF EXISTS IX_Appointments_Slot;
+
+CREATE UNIQUE INDEX IF NOT EXISTS UX_Appointments_Slot
+    ON Appointments (Date, Caregiver_Username, Slot_Minute);
@@ -0,0 +1,11 @@
+-- show_appointments also lists the slot time and filters on Date; keep both
+-- per-user indexes covering so paging never touches the base table.
+DROP INDEX IF EXISTS IX_Appointments_Patient;
+
+CREATE INDEX IF NOT EXISTS IX_Appointments_Patient
+    ON Appointments (Patient_Username, Appointment_ID, Date, Vaccine_Name, Caregiver_Username, Slot_Minute);
+
+DROP INDEX IF EXISTS IX_Appointments_Caregiver;
+
+CREATE INDEX IF NOT EXISTS IX_Appointments_Caregiver
+    ON Appointments (Caregiver_Username, Appointment_ID, Date, Vaccine_Name, Patient_Username, Slot_Minute);
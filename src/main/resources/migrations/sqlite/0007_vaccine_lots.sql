@@ -0,0 +1,27 @@
+-- Dose inventory moves from one Vaccines.Doses counter per vaccine to
+-- VaccineLots. Each lot (a delivery, with an optional expiry date) is split
+-- over shard rows and a reservation takes its dose from any shard with
+-- stock, so concurrent bookings of one vaccine stop queueing on one row.
+-- Version is bumped on every change so in-process inventory caches
+-- (model/Vaccine.py) can tell newer rows from older ones. Existing stock
+-- becomes lot 'initial', shard 0.
+
+CREATE TABLE IF NOT EXISTS VaccineLots (
+    Vaccine_Name VARCHAR(255) COLLATE NOCASE NOT NULL REFERENCES Vaccines(Name),
+    Lot VARCHAR(64) COLLATE NOCASE NOT NULL,
+    Shard INT NOT NULL,
+    Expires DATE,
+    Doses INT NOT NULL DEFAULT 0 CHECK (Doses >= 0),
+    Version INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (Vaccine_Name, Lot, Shard)
+);
+
+INSERT INTO VaccineLots (Vaccine_Name, Lot, Shard, Expires, Doses, Version)
+SELECT Name, 'initial', 0, NULL, Doses, Version FROM Vaccines WHERE Doses > 0;
+
+ALTER TABLE Vaccines DROP COLUMN Doses;
+ALTER TABLE Vaccines DROP COLUMN Version;
+
+-- The lot shard an appointment's dose came from, so cancel can put it back
+ALTER TABLE Appointments ADD COLUMN Lot VARCHAR(64) COLLATE NOCASE;
+ALTER TABLE Appointments ADD COLUMN Dose_Shard INT;
@@ -0,0 +1,42 @@
+-- find_open_dates: open slots per day, kept current by triggers on
+-- Availabilities so every writer (upload, reserve, cancel, bulk loads)
+-- maintains it in its own transaction. A day's count is spread over the
+-- shards named by Availabilities.Open_Shard, so reservations on a busy day
+-- don't all update one row; readers add the shards up.
+
+ALTER TABLE Availabilities ADD COLUMN Open_Shard INT NOT NULL DEFAULT 0;
+
+UPDATE Availabilities SET Open_Shard = rowid % 8;
+
+CREATE TABLE IF NOT EXISTS OpenDays (
+    Time DATE NOT NULL,
+    Shard INT NOT NULL,
+    Open_Slots INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (Time, Shard)
+);
+
+INSERT INTO OpenDays (Time, Shard, Open_Slots)
+SELECT Time, Open_Shard, SUM(Slots - Booked) FROM Availabilities GROUP BY Time, Open_Shard;
+
+CREATE TRIGGER IF NOT EXISTS TR_Availabilities_OpenDays_Insert
+AFTER INSERT ON Availabilities
+BEGIN
+    INSERT INTO OpenDays (Time, Shard, Open_Slots) VALUES (NEW.Time, NEW.Open_Shard, NEW.Slots - NEW.Booked)
+    ON CONFLICT (Time, Shard) DO UPDATE SET Open_Slots = Open_Slots + excluded.Open_Slots;
+END;
+
+CREATE TRIGGER IF NOT EXISTS TR_Availabilities_OpenDays_Update
+AFTER UPDATE OF Time, Slots, Booked, Open_Shard ON Availabilities
+BEGIN
+    UPDATE OpenDays SET Open_Slots = Open_Slots - (OLD.Slots - OLD.Booked)
+    WHERE Time = OLD.Time AND Shard = OLD.Open_Shard;
+    INSERT INTO OpenDays (Time, Shard, Open_Slots) VALUES (NEW.Time, NEW.Open_Shard, NEW.Slots - NEW.Booked)
+    ON CONFLICT (Time, Shard) DO UPDATE SET Open_Slots = Open_Slots + excluded.Open_Slots;
+END;
+
+CREATE TRIGGER IF NOT EXISTS TR_Availabilities_OpenDays_Delete
+AFTER DELETE ON Availabilities
+BEGIN
+    UPDATE OpenDays SET Open_Slots = Open_Slots - (OLD.Slots - OLD.Booked)
+    WHERE Time = OLD.Time AND Shard = OLD.Open_Shard;
+END;
@@ -0,0 +1,21 @@
+-- reserve --wait: patients queued for a date and vaccine that had no
+-- caregiver or dose left. Whatever adds capacity (cancel, upload_availability,
+-- add_doses) books them in the same transaction, in Waitlist_ID order or by
+-- Priority first (WaitlistOrder).
+
+CREATE TABLE IF NOT EXISTS Waitlist (
+    Waitlist_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+    Patient_Username VARCHAR(255) COLLATE NOCASE NOT NULL REFERENCES Patients(Username),
+    Vaccine_Name VARCHAR(255) COLLATE NOCASE NOT NULL REFERENCES Vaccines(Name),
+    Date DATE NOT NULL,
+    Priority INT NOT NULL DEFAULT 0,
+    Joined TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- one place in line per patient, date and vaccine
+CREATE UNIQUE INDEX IF NOT EXISTS UX_Waitlist_Patient ON Waitlist (Patient_Username, Date, Vaccine_Name);
+
+-- backfill looks waiters up by the dates that gained slots or by the vaccine
+-- that gained doses
+CREATE INDEX IF NOT EXISTS IX_Waitlist_Date ON Waitlist (Date, Priority, Waitlist_ID);
+CREATE INDEX IF NOT EXISTS IX_Waitlist_Vaccine ON Waitlist (Vaccine_Name, Date);
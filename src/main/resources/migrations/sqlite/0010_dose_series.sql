@@ -0,0 +1,17 @@
+-- Multi-dose vaccines: how many doses a series has and how many days apart
+-- they are. A series is booked as a whole; each follow-up appointment
+-- records its dose number and the date of the series' first dose, which
+-- links it to that appointment. First doses and single doses leave
+-- Series_Start NULL.
+
+ALTER TABLE Vaccines ADD COLUMN Series_Doses INT NOT NULL DEFAULT 1;
+ALTER TABLE Vaccines ADD COLUMN Dose_Interval_Days INT NOT NULL DEFAULT 0;
+
+ALTER TABLE Appointments ADD COLUMN Dose_Number INT NOT NULL DEFAULT 1;
+ALTER TABLE Appointments ADD COLUMN Series_Start DATE;
+
+-- each follow-up is booked once; also answers plan_follow_ups' "does this
+-- first dose have its follow-ups yet" probe
+CREATE UNIQUE INDEX IF NOT EXISTS UX_Appointments_Series
+    ON Appointments (Patient_Username, Vaccine_Name, Series_Start, Dose_Number)
+    WHERE Series_Start IS NOT NULL;
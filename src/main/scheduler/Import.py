@@ -0,0 +1,176 @@
+# Bulk account importer for onboarding a new site. Reads patients and
+# caregivers from CSV (header with username, password and optionally role) or
+# JSON Lines ({"username": ..., "password": ..., "role": ...}) and creates
+# them in batches with Patient.create_patients / Caregiver.create_caregivers,
+# which hash the passwords in parallel on the shared KdfPool and insert each
+# batch in one transaction. Usernames that already exist, repeat within the file or fail
+# the create_patient / create_caregiver password rules are reported instead of
+# imported.
+#
+#   cd src/main/scheduler
+#   python Import.py accounts.csv --role patient
+#   python Import.py staff.jsonl --role caregiver --report rejected.csv
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from db.Backend import DB_ERRORS
+from model.Caregiver import Caregiver
+from model.Patient import Patient
+from model.Usernames import Usernames
+from Scheduler import is_strong_password
+
+TABLES = Usernames.TABLES
+CREATE = {"patient": Patient.create_patients, "caregiver": Caregiver.create_caregivers}
+
+
+def read_accounts(path, default_role=None):
+    # Yields (line number, username, password, role); role comes from the row
+    # or default_role. JSON Lines is picked by a .jsonl / .ndjson extension.
+    with open(path, newline="") as f:
+        if os.path.splitext(path)[1].lower() in (".jsonl", ".ndjson"):
+            for line_no, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = {}
+                yield (line_no, str(record.get("username") or ""), str(record.get("password") or ""),
+                       record.get("role") or default_role)
+        else:
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield (reader.line_num, (record.get("username") or "").strip(), record.get("password") or "",
+                       (record.get("role") or "").strip() or default_role)
+
+
+class Importer:
+
+    def __init__(self, batch_size=500, progress_every=5000, out=sys.stdout):
+        self.batch_size = batch_size
+        self.progress_every = progress_every
+        self.out = out
+        self.created = 0
+        self.rejected = []  # (line number, username, reason)
+        self._seen = set()
+        self._started = None
+        self._processed = 0
+        self._next_progress = progress_every
+
+    def run(self, accounts):
+        self._started = time.perf_counter()
+        batch = []
+        for account in accounts:
+            batch.append(account)
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch)
+                batch = []
+        if batch:
+            self._import_batch(batch)
+        return self
+
+    def elapsed(self):
+        return time.perf_counter() - self._started
+
+    def summary(self):
+        reasons = {}
+        for _, _, reason in self.rejected:
+            reasons[reason] = reasons.get(reason, 0) + 1
+        lines = [f"Imported {self.created} accounts in {self.elapsed():.1f}s "
+                 f"({self.created / max(self.elapsed(), 1e-9):.1f} accounts/s)"]
+        lines += [f"  skipped {count}: {reason}" for reason, count in sorted(reasons.items())]
+        return "\n".join(lines)
+
+    def _import_batch(self, batch):
+        valid = []
+        for line_no, username, password, role in batch:
+            reason = self._check(username, password, role)
+            if reason:
+                self.rejected.append((line_no, username, reason))
+            else:
+                self._seen.add((role, username.lower()))
+                valid.append((line_no, username, password, role))
+
+        for role in TABLES:
+            accounts = [a for a in valid if a[3] == role]
+            if not accounts:
+                continue
+            existing = Usernames.existing(role, [a[1] for a in accounts])
+            new_accounts = []
+            for account in accounts:
+                if account[1].lower() in existing:
+                    self._reject(account, "username taken")
+                else:
+                    new_accounts.append(account)
+            self._create(role, new_accounts)
+
+        self._processed += len(batch)
+        if self._processed >= self._next_progress:
+            self._next_progress += self.progress_every
+            print(f"{self._processed} rows read, {self.created} imported, {len(self.rejected)} skipped "
+                  f"({self.created / self.elapsed():.1f} accounts/s)", file=self.out)
+
+    def _check(self, username, password, role):
+        if role not in TABLES:
+            return "missing or unknown role"
+        if not username or not password:
+            return "missing username or password"
+        if not is_strong_password(password):
+            return "weak password"
+        if (role, username.lower()) in self._seen:
+            return "duplicate in file"
+        return None
+
+    def _reject(self, account, reason):
+        self.rejected.append((account[0], account[1], reason))
+
+    def _create(self, role, accounts):
+        if not accounts:
+            return
+        # someone may have signed up with one of these names since the probe
+        taken = set(CREATE[role]([(username, password) for _, username, password, _ in accounts]))
+        for account in accounts:
+            if account[1] in taken:
+                self._reject(account, "username taken")
+            else:
+                self.created += 1
+
+
+def write_report(path, rejected):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["line", "username", "reason"])
+        writer.writerows(sorted(rejected))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import patient and caregiver accounts from CSV or JSON Lines")
+    parser.add_argument("file")
+    parser.add_argument("--role", choices=sorted(TABLES), help="role for rows without a role column")
+    parser.add_argument("--batch-size", type=int, default=500, help="accounts per insert transaction")
+    parser.add_argument("--progress-every", type=int, default=5000, help="rows between progress lines")
+    parser.add_argument("--report", metavar="CSV", help="write every skipped row and the reason to this file")
+    args = parser.parse_args()
+
+    importer = Importer(args.batch_size, args.progress_every)
+    try:
+        importer.run(read_accounts(args.file, args.role))
+    except OSError as e:
+        print(f"Cannot read {args.file}: {e}")
+        sys.exit(1)
+    except DB_ERRORS as e:
+        print(importer.summary())
+        print("Import stopped by a database error, batches before it were committed.")
+        print("Db-Error:", e)
+        sys.exit(1)
+
+    print(importer.summary())
+    for line_no, username, reason in sorted(importer.rejected)[:10]:
+        print(f"  line {line_no}: {username or '<blank>'}: {reason}")
+    if len(importer.rejected) > 10:
+        print(f"  ... and {len(importer.rejected) - 10} more" + ("" if args.report else " (see --report)"))
+    if args.report:
+        write_report(args.report, importer.rejected)
@@ -1,18 +1,34 @@
 from model.Vaccine import Vaccine
 from model.Caregiver import Caregiver
 from model.Patient import Patient
+from model.Appointment import Appointment, ReservationConflict, NoCaregiverAvailable, NoDosesAvailable, BatchFailed
+from model.Waitlist import Waitlist
+from model.Usernames import Usernames
 from util.Util import Util
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db import Queries
+from db.Backend import DB_ERRORS, stream_rows
+from util.Stats import LatencyStats, instrumentation
+import argparse
+import atexit
+import csv
 import datetime
 import re
+import sys
+import time
 
 
-session = {
-    "logged_in": False,
-    "username": None,
-    "role": None  # "patient" or "caregiver"
-}
+def new_session():
+    return {
+        "logged_in": False,
+        "username": None,
+        "role": None  # "patient" or "caregiver"
+    }
+
+
+# The interactive CLI has one user; Service.py gives each client its own
+# session and passes it to the commands explicitly.
+session = new_session()
 
 def is_strong_password(password):
     # Check for password strength
@@ -24,79 +40,113 @@ def is_strong_password(password):
         return True
     return False
 
-def create_patient(tokens):
+def split_options(tokens, options):
+    # Separates "--name value" options from positional tokens. `options` maps
+    # each accepted option to a converter, or to None for a bare flag.
+    args, values = [], {}
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if not token.startswith("--"):
+            args.append(token)
+        elif token not in options:
+            raise ValueError(f"Unknown option {token}")
+        elif options[token] is None:
+            values[token] = True
+        else:
+            if i + 1 >= len(tokens):
+                raise ValueError(f"Missing value for {token}")
+            values[token] = options[token](tokens[i + 1])
+            i += 1
+        i += 1
+    return args, values
+
+def create_patient(tokens, session=session):
     if len(tokens) != 3:
         print("Invalid arguments. Usage: create_patient <username> <password>")
-        return
+        return False
 
     username, password = tokens[1], tokens[2]
 
     if not is_strong_password(password):
         print("Password must be at least 8 characters long, contain uppercase and lowercase letters, "
               "include numbers, and at least one special character (!, @, #, ?).")
-        return
+        return False
+
+    # Check before paying for the password hash
+    taken = username_taken("patient", username)
+    if taken is None:
+        return False
+    if taken:
+        print("Username taken, try again!")
+        return False
 
     try:
         Patient.create_patient(username, password)
-        print(f"Created user {username}")
+    except ValueError as e:
+        print(e)
+        return False
     except Exception as e:
         print(e)
         print("Failed to create user.")
+        return False
+    print(f"Created user {username}")
+    return True
 
 
-def create_caregiver(tokens):
+def create_caregiver(tokens, session=session):
     if len(tokens) != 3:
         print("Invalid arguments. Usage: create_caregiver <username> <password>")
-        return
+        return False
 
     username, password = tokens[1], tokens[2]
 
     if not is_strong_password(password):
         print("Password must be at least 8 characters long, contain uppercase and lowercase letters, "
               "include numbers, and at least one special character (!, @, #, ?).")
-        return
+        return False
+
+    # Check before paying for the password hash
+    taken = username_taken("caregiver", username)
+    if taken is None:
+        return False
+    if taken:
+        print("Username taken, try again!")
+        return False
 
     try:
         Caregiver.create_caregiver(username, password)
-        print(f"Created user {username}")
+    except ValueError as e:
+        print(e)
+        return False
     except Exception as e:
         print(e)
         print("Failed to create user.")
+        return False
+    print(f"Created user {username}")
+    return True
 
 
 
 
-def username_exists_caregiver(username):
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-
-    select_username = "SELECT * FROM Caregivers WHERE Username = %s"
+def username_taken(role, username):
+    # True/False, or None after reporting a database error
     try:
-        cursor = conn.cursor(as_dict=True)
-        cursor.execute(select_username, username)
-    
-        for row in cursor:
-            return row['Username'] is not None
-    except pymssql.Error as e:
+        return Usernames.exists(role, username, use_filter=True)
+    except DB_ERRORS as e:
         print("Error occurred when checking username")
         print("Db-Error:", e)
-        quit()
-    except Exception as e:
-        print("Error occurred when checking username")
-        print("Error:", e)
-    finally:
-        cm.close_connection()
-    return False
+        return None
 
 
-def login_patient(tokens):
+def login_patient(tokens, session=session):
     if len(tokens) != 3:
         print("Invalid arguments. Usage: login_patient <username> <password>")
-        return
+        return False
 
     if session["logged_in"]:
         print("User already logged in.")
-        return
+        return False
 
     username, password = tokens[1], tokens[2]
     if Patient.login_patient(username, password):
@@ -104,19 +154,20 @@ def login_patient(tokens):
         session["username"] = username
         session["role"] = "patient"
         print(f"Logged in as: {username}")
-    else:
-        print("Login failed.")
+        return True
+    print("Login failed.")
+    return False
 
 
 
-def login_caregiver(tokens):
+def login_caregiver(tokens, session=session):
     if len(tokens) != 3:
         print("Invalid arguments. Usage: login_caregiver <username> <password>")
-        return
+        return False
 
     if session["logged_in"]:
         print("User already logged in.")
-        return
+        return False
 
     username, password = tokens[1], tokens[2]
     if Caregiver.login_caregiver(username, password):
@@ -124,357 +175,853 @@ def login_caregiver(tokens):
         session["username"] = username
         session["role"] = "caregiver"
         print(f"Logged in as: {username}")
-    else:
-        print("Login failed.")
+        return True
+    print("Login failed.")
+    return False
 
 
 
-def search_caregiver_schedule(tokens):
+def search_caregiver_schedule(tokens, session=session):
     if not session["logged_in"]:
         print("Please login first!")
-        return
+        return False
 
-    if len(tokens) != 2:
-        print("Invalid arguments. Usage: search_caregiver_schedule <date>")
-        return
+    usage = "Invalid arguments. Usage: search_caregiver_schedule <date> [--limit <n>] [--after <username> | --offset <n>]"
+    try:
+        args, options = split_options(tokens, {"--limit": int, "--after": str, "--offset": int})
+    except ValueError:
+        print(usage)
+        return False
+    if len(args) != 2 or ("--after" in options and "--offset" in options):
+        print(usage)
+        return False
 
-    date = tokens[1]
+    date = args[1]
     try:
-        datetime.datetime.strptime(date, "%m-%d-%Y")
+        parsed_date = datetime.datetime.strptime(date, "%m-%d-%Y").date()
     except ValueError:
         print("Invalid date format. Use MM-DD-YYYY.")
-        return
+        return False
+
+    limit = options.get("--limit")
+    if limit is not None and limit <= 0 or options.get("--offset", 0) < 0:
+        print("Limit must be positive and offset non-negative!")
+        return False
 
     cm = ConnectionManager()
     conn = cm.create_connection()
     cursor = conn.cursor()
 
-    query = """
-        SELECT Availabilities.Username, Vaccines.Name, Vaccines.Doses
-        FROM Availabilities
-        LEFT JOIN Vaccines ON 1=1
-        WHERE Availabilities.Time = %s
-        ORDER BY Availabilities.Username;
-    """
-    try:
-        cursor.execute(query, date)
-        rows = cursor.fetchall()
-        if not rows:
+    # Open slots and vaccine inventory are independent; list each once.
+    # --after is keyset paging: resume after the last caregiver of the
+    # previous page ("" sorts before every username). The page size and
+    # offset are bound parameters, so every page runs the same statement.
+    try:
+        Queries.AVAILABILITY_OPEN.execute(cursor, (parsed_date, options.get("--after", ""))
+                                          + Queries.page(limit, options.get("--offset", 0)))
+        shown = 0
+        last = None
+        for row in stream_rows(cursor):
+            if shown == 0:
+                print("Available caregivers:")
+            username, start_minute, slot_minutes, slots, booked = row
+            if slots == 1:
+                print(username)
+            else:
+                end_minute = start_minute + slots * slot_minutes
+                print(f"{username} ({slots - booked} of {slots} slots open, "
+                      f"{Util.format_time_of_day(start_minute)}-{Util.format_time_of_day(end_minute)}, "
+                      f"{slot_minutes} min)")
+            shown += 1
+            last = username
+        if shown == 0:
             print("No caregivers available on this date.")
-        for row in rows:
-            print(f"{row[0]} {row[1]} {row[2]}")
-    except pymssql.Error as e:
+            return True
+        if limit is not None and shown == limit:
+            print(f"More caregivers: search_caregiver_schedule {date} --after {last} --limit {limit}")
+
+        print("Vaccines:")
+        for vaccine in Vaccine.get_all():
+            print(f"{vaccine.get_vaccine_name()} {vaccine.get_available_doses()}")
+        return True
+    except DB_ERRORS as e:
         print("Please try again!")
         print("Db-Error:", e)
+        return False
     finally:
         cm.close_connection()
 
 
 
-def reserve(tokens):
+def find_open_dates(tokens, session=session):
+    if not session["logged_in"]:
+        print("Please login first!")
+        return False
+
+    if len(tokens) not in (3, 4):
+        print("Invalid arguments. Usage: find_open_dates <from> <to> [vaccine]")
+        return False
+
+    try:
+        first_date, last_date = parse_date(tokens[1]), parse_date(tokens[2])
+    except ValueError:
+        print("Invalid date format. Use MM-DD-YYYY.")
+        return False
+    if first_date > last_date:
+        print("The first date must not be after the last!")
+        return False
+
+    try:
+        if len(tokens) == 4:
+            # only dates the vaccine still has an unexpired dose for
+            good_until = Vaccine.last_good_date(tokens[3])
+            if good_until is None:
+                print("Not enough available doses!")
+                return False
+            last_date = min(last_date, good_until)
+
+        # One range read of the per-day open-slot counts
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        try:
+            cursor = conn.cursor()
+            Queries.OPEN_DAYS.execute(cursor, (first_date, last_date))
+            rows = cursor.fetchall()
+        finally:
+            cm.close_connection()
+    except DB_ERRORS as e:
+        print("Please try again!")
+        print("Db-Error:", e)
+        return False
+
+    if not rows:
+        print("No open dates found.")
+        return True
+    print("Open dates:")
+    for day, open_slots in rows:
+        print(f"{day.strftime('%m-%d-%Y')}: {open_slots} open slot{'s' if open_slots != 1 else ''}")
+    return True
+
+
+def reserve(tokens, session=session):
     if not session["logged_in"] or session["role"] != "patient":
         print("Please login as a patient!")
-        return
+        return False
 
-    if len(tokens) != 3:
-        print("Invalid arguments. Usage: reserve <date> <vaccine>")
-        return
+    usage = "Invalid arguments. Usage: reserve <date> <vaccine> [--wait]"
+    try:
+        args, options = split_options(tokens, {"--wait": None})
+    except ValueError:
+        print(usage)
+        return False
+    if len(args) != 3:
+        print(usage)
+        return False
 
-    date, vaccine_name = tokens[1], tokens[2]
+    date, vaccine_name = args[1], args[2]
     try:
         parsed_date = datetime.datetime.strptime(date, "%m-%d-%Y").date()
     except ValueError:
         print("Invalid date format. Use MM-DD-YYYY.")
-        return
+        return False
 
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor()
+    try:
+        appointment = Appointment.reserve(session["username"], parsed_date, vaccine_name)
+        print_appointment(appointment)
+        return True
+    except (NoCaregiverAvailable, NoDosesAvailable) as e:
+        print(e)
+        if "--wait" not in options:
+            return False
+    except (ValueError, ReservationConflict) as e:
+        print(e)
+        return False
+    except DB_ERRORS as e:
+        print(f"Failed to complete reservation: {e}")
+        return False
 
+    # --wait: queue up and get booked when a cancel, upload or delivery frees
+    # capacity, instead of re-running reserve
     try:
+        waitlist_id, appointment = Waitlist.join(session["username"], parsed_date, vaccine_name)
+    except (ValueError, ReservationConflict) as e:
+        print(e)
+        return False
+    except DB_ERRORS as e:
+        print(f"Failed to join the waitlist: {e}")
+        return False
+    if appointment is not None:
+        print_appointment(appointment)
+    else:
+        print(f"Added to the waitlist (Waitlist ID: {waitlist_id}). "
+              f"You will be booked as soon as a slot opens up.")
+    return True
 
-        # 1. Find caregiver
-        check_availability = """
-            SELECT Username 
-            FROM Availabilities
-            WHERE Time = %s AND Reserved = 0
-            ORDER BY Username;
-        """
-        cursor.execute(check_availability, (parsed_date,))
-        caregiver_row = cursor.fetchone()
-        if not caregiver_row:
-            print("No Caregiver is available!")
-            return
-        caregiver_username = caregiver_row[0]
-        print(f"Selected Caregiver: {caregiver_username}")
-
-        # 2. Check vaccine availability
-        check_vaccine = """
-            SELECT Doses 
-            FROM Vaccines
-            WHERE Name = %s;
-        """
-        cursor.execute(check_vaccine, (vaccine_name,))
-        vaccine_row = cursor.fetchone()
-        if not vaccine_row or vaccine_row[0] <= 0:
-            print("Not enough available doses!")
-            return
-        print(f"Available Doses for {vaccine_name}: {vaccine_row[0]}")
-
-        # 3. Create appointment
-        appointment_query = """
-            INSERT INTO Appointments (
-                Patient_Username, 
-                Caregiver_Username, 
-                Vaccine_Name, 
-                Date
-            ) VALUES (%s, %s, %s, %s);
-        """
-        cursor.execute(appointment_query, 
-                     (session["username"], caregiver_username, vaccine_name, parsed_date))
-
-        # 4. Update vaccine count
-        update_vaccine = """
-            UPDATE Vaccines 
-            SET Doses = Doses - 1 
-            WHERE Name = %s;
-        """
-        cursor.execute(update_vaccine, (vaccine_name,))
-
-        # 5. Mark availability as reserved
-        update_availability = """
-            UPDATE Availabilities 
-            SET Reserved = 1
-            WHERE Time = %s AND Username = %s;
-        """
-        cursor.execute(update_availability, (parsed_date, caregiver_username))
-
-        # Commit all changes
-        conn.commit()
-
-        print(f"Appointment ID: {cursor.lastrowid}, Caregiver username: {caregiver_username}")
-
-    except pymssql.Error as e:
-        print(f"Failed to complete reservation: {e}")
-        conn.rollback()
-    finally:
-        cm.close_connection()
+
+def reserve_batch(tokens, session=session):
+    # Group bookings: clinic staff book several patients at once, all or none
+    if not session["logged_in"] or session["role"] != "caregiver":
+        print("Please login as a caregiver first!")
+        return False
+
+    usage = "Invalid arguments. Usage: reserve_batch <patient>:<date>:<vaccine> ... | --file <bookings.csv>"
+    try:
+        args, options = split_options(tokens, {"--file": str})
+    except ValueError:
+        print(usage)
+        return False
+
+    if "--file" in options:
+        if len(args) != 1:
+            print(usage)
+            return False
+        try:
+            with open(options["--file"], newline="") as f:
+                rows = [(line_no, row) for line_no, row in enumerate(csv.reader(f), start=1)
+                        if row and row[0].strip() and not (line_no == 1 and row[0].strip().lower() == "patient")]
+        except OSError as e:
+            print(f"Cannot read {options['--file']}: {e}")
+            return False
+    else:
+        if len(args) < 2:
+            print(usage)
+            return False
+        rows = [(n, arg.split(":")) for n, arg in enumerate(args[1:], start=1)]
+
+    items, errors = [], []
+    for line_no, row in rows:
+        try:
+            patient_username, date, vaccine_name = (value.strip() for value in row)
+            items.append((patient_username, parse_date(date), vaccine_name))
+        except ValueError:
+            errors.append(f"{'line' if '--file' in options else 'item'} {line_no}: expected "
+                          f"<patient>:<MM-DD-YYYY>:<vaccine>, got {':'.join(row)!r}")
+    if errors:
+        print(f"Nothing booked, {len(errors)} invalid items:")
+        for error in errors:
+            print(error)
+        return False
+
+    labels = [f"{p} {d.strftime('%m-%d-%Y')} {v}" for p, d, v in items]
+    try:
+        appointments = Appointment.reserve_batch(items)
+    except BatchFailed as e:
+        print(e)
+        print_batch_report(labels, [e.errors.get(i, "ok") for i in range(len(items))])
+        return False
+    except (ValueError, ReservationConflict) as e:
+        print(e)
+        return False
+    except DB_ERRORS as e:
+        print(f"Failed to complete reservations: {e}")
+        return False
+
+    print(f"Booked {len(appointments)} appointment{'s' if len(appointments) != 1 else ''}:")
+    print_batch_report(labels, appointments)
+    return True
+
+
+def cancel_batch(tokens, session=session):
+    if not session["logged_in"]:
+        print("Please login first!")
+        return False
+
+    usage = "Invalid arguments. Usage: cancel_batch <appointment_id> ... | --file <ids.csv>"
+    try:
+        args, options = split_options(tokens, {"--file": str})
+    except ValueError:
+        print(usage)
+        return False
+
+    try:
+        if "--file" in options:
+            if len(args) != 1:
+                print(usage)
+                return False
+            with open(options["--file"], newline="") as f:
+                values = [row[0].strip() for row in csv.reader(f) if row and row[0].strip()]
+            if values and values[0].lower() == "appointment_id":
+                values = values[1:]
+        else:
+            values = args[1:]
+        appointment_ids = [int(value) for value in values]
+    except OSError as e:
+        print(f"Cannot read {options['--file']}: {e}")
+        return False
+    except ValueError:
+        print("Appointment IDs must be numbers.")
+        return False
+    if not appointment_ids:
+        print(usage)
+        return False
+
+    backfilled = []
+    try:
+        canceled = Appointment.cancel_batch(appointment_ids, backfilled)
+    except BatchFailed as e:
+        print(e)
+        print_batch_report([f"Appointment ID {i}" for i in appointment_ids],
+                           [e.errors.get(i, "ok") for i in range(len(appointment_ids))])
+        return False
+    except (ValueError, ReservationConflict) as e:
+        print(e)
+        return False
+    except DB_ERRORS as e:
+        print(f"Error canceling appointments: {e}")
+        return False
+
+    print(f"Canceled {len(canceled)} appointment{'s' if len(canceled) != 1 else ''}: "
+          f"{', '.join(str(a.get_appointment_id()) for a in canceled)}")
+    print_canceled_follow_ups(canceled)
+    print_backfilled(backfilled)
+    return True
+
+
+def print_canceled_follow_ups(canceled):
+    # Follow-ups canceled along with the first dose of their series
+    for appointment in canceled:
+        for follow_up in appointment.follow_ups:
+            print(f"Also canceled {format_follow_up(follow_up)}")
 
 
-def upload_availability(tokens):
+def print_batch_report(labels, results):
+    # One line per batch item: its appointment or why it failed
+    for number, (label, result) in enumerate(zip(labels, results), start=1):
+        print(f"{number}. {label}: {result}")
+        for follow_up in getattr(result, "follow_ups", ()):
+            print(f"   {format_follow_up(follow_up)}")
+
+
+def print_appointment(appointment):
+    # A booked appointment and, for a multi-dose vaccine, the rest of its series
+    print(appointment)
+    for follow_up in appointment.follow_ups:
+        print(format_follow_up(follow_up))
+
+
+def format_follow_up(appointment):
+    return f"Dose {appointment.dose_number} on {appointment.date.strftime('%m-%d-%Y')}: {appointment}"
+
+
+def set_series(tokens, session=session):
+    # Multi-dose vaccines: reserve books every dose of the series
     if not session["logged_in"] or session["role"] != "caregiver":
         print("Please login as a caregiver first!")
-        return
+        return False
 
-    if len(tokens) != 2:
-        print("Invalid arguments. Usage: upload_availability <date>")
-        return
+    if len(tokens) != 4:
+        print("Invalid arguments. Usage: set_series <vaccine> <doses> <interval_days>")
+        return False
 
-    date = tokens[1]
     try:
-        parsed_date = datetime.datetime.strptime(date, "%m-%d-%Y").date()
+        doses, interval_days = int(tokens[2]), int(tokens[3])
+    except ValueError:
+        print("Doses and interval must be numbers.")
+        return False
+
+    try:
+        Vaccine.set_series(tokens[1], doses, interval_days)
+    except ValueError as e:
+        print(e)
+        return False
+    except DB_ERRORS as e:
+        print(f"Failed to set the series: {e}")
+        return False
+    if doses == 1:
+        print(f"{tokens[1]} is a single dose.")
+    else:
+        print(f"{tokens[1]} is a series of {doses} doses, {interval_days} day{'s' if interval_days != 1 else ''} "
+              f"apart.")
+    return True
+
+
+def plan_follow_ups(tokens, session=session):
+    # Books the missing follow-ups of every series started between the dates
+    if not session["logged_in"] or session["role"] != "caregiver":
+        print("Please login as a caregiver first!")
+        return False
+
+    if len(tokens) != 3:
+        print("Invalid arguments. Usage: plan_follow_ups <from> <to>")
+        return False
+
+    try:
+        first_date, last_date = parse_date(tokens[1]), parse_date(tokens[2])
     except ValueError:
         print("Invalid date format. Use MM-DD-YYYY.")
-        return
+        return False
+    if first_date > last_date:
+        print("The start date must not be after the end date!")
+        return False
 
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor()
+    try:
+        booked, skipped = Appointment.plan_follow_ups(first_date, last_date)
+    except (ValueError, ReservationConflict) as e:
+        print(e)
+        return False
+    except DB_ERRORS as e:
+        print(f"Failed to plan follow-ups: {e}")
+        return False
+
+    print(f"Booked {len(booked)} follow-up dose{'s' if len(booked) != 1 else ''}.")
+    if skipped:
+        print(f"{len(skipped)} series could not be completed:")
+        for appointment_id, reason in skipped[:10]:
+            print(f"Appointment ID {appointment_id}: {reason}")
+        if len(skipped) > 10:
+            print(f"... and {len(skipped) - 10} more")
+    return True
+
+
+def parse_availability_file(path):
+    # One MM-DD-YYYY date per row (first column); a "date" header is allowed.
+    # Returns (dates, errors) so every bad row is reported before uploading.
+    dates, errors = [], []
+    with open(path, newline="") as f:
+        for line_no, row in enumerate(csv.reader(f), start=1):
+            if not row or not row[0].strip():
+                continue
+            value = row[0].strip()
+            if line_no == 1 and value.lower() == "date":
+                continue
+            try:
+                dates.append(datetime.datetime.strptime(value, "%m-%d-%Y").date())
+            except ValueError:
+                errors.append(f"line {line_no}: invalid date {value!r}")
+    return dates, errors
 
-    add_availability_query = "INSERT INTO Availabilities (Time, Username) VALUES (%s, %s)"
+
+def upload_availability(tokens, session=session):
+    if not session["logged_in"] or session["role"] != "caregiver":
+        print("Please login as a caregiver first!")
+        return False
+
+    usage = ("Invalid arguments. Usage: upload_availability <date> [<end_date> [--weekdays]] | --file <slots.csv> "
+             "[--from <HH:MM>] [--to <HH:MM>] [--slot <minutes>]")
+    try:
+        args, options = split_options(tokens, {"--weekdays": None, "--file": str, "--from": str, "--to": str,
+                                               "--slot": int})
+    except ValueError:
+        print(usage)
+        return False
+
+    # One slot for the whole window unless --slot splits it up
+    try:
+        start_minute = Util.parse_time_of_day(options.get("--from", "09:00"))
+        end_minute = Util.parse_time_of_day(options.get("--to", "17:00"))
+    except ValueError:
+        print("Invalid time format. Use HH:MM.")
+        return False
+    slot_minutes = options.get("--slot", end_minute - start_minute)
+    if end_minute <= start_minute or slot_minutes <= 0 or slot_minutes > end_minute - start_minute:
+        print("The window must end after it starts and hold at least one slot!")
+        return False
+    slots = (end_minute - start_minute) // slot_minutes
+
+    if "--file" in options:
+        if len(args) != 1 or "--weekdays" in options:
+            print(usage)
+            return False
+        try:
+            dates, errors = parse_availability_file(options["--file"])
+        except OSError as e:
+            print(f"Cannot read {options['--file']}: {e}")
+            return False
+        if errors:
+            print(f"Nothing uploaded, {len(errors)} invalid rows:")
+            for error in errors:
+                print(error)
+            return False
+    else:
+        if len(args) not in (2, 3) or ("--weekdays" in options and len(args) != 3):
+            print(usage)
+            return False
+        try:
+            start = datetime.datetime.strptime(args[1], "%m-%d-%Y").date()
+            end = datetime.datetime.strptime(args[-1], "%m-%d-%Y").date()
+        except ValueError:
+            print("Invalid date format. Use MM-DD-YYYY.")
+            return False
+        if end < start:
+            print("End date must not be before start date!")
+            return False
+        dates = [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+        if "--weekdays" in options:
+            dates = [d for d in dates if d.weekday() < 5]
+
+    if not dates:
+        print("No dates to upload.")
+        return False
+
+    backfilled = []
     try:
-        cursor.execute(add_availability_query, (parsed_date, session["username"]))
-        conn.commit()
-        print("Availability uploaded!")
-    except pymssql.Error as e:
+        caregiver = Caregiver(session["username"])
+        inserted, duplicates, timings = caregiver.upload_availabilities(
+            dates, start_minute=start_minute, slot_minutes=slot_minutes, slots=slots,
+            before_commit=lambda tx: backfilled.extend(Appointment.backfill(tx, dates)))
+    except DB_ERRORS as e:
         print("Error occurred while uploading availability. Please try again!")
         print("Db-Error:", e)
-    finally:
-        cm.close_connection()
+        return False
 
+    if len(dates) > 1:
+        for i, (count, seconds) in enumerate(timings, start=1):
+            print(f"Batch {i}: {count} dates in {seconds * 1000:.1f} ms")
+    if duplicates:
+        shown = ", ".join(d.strftime("%m-%d-%Y") for d in duplicates[:10])
+        more = f" and {len(duplicates) - 10} more" if len(duplicates) > 10 else ""
+        print(f"Skipped {len(duplicates)} already uploaded: {shown}{more}")
+    if inserted:
+        print("Availability uploaded!" if len(dates) == 1 else f"Availability uploaded for {len(inserted)} dates!")
+        if slots > 1:
+            print(f"{slots} slots of {slot_minutes} min per date")
+    print_backfilled(backfilled)
+    return True
 
 
 
-def cancel(tokens):
+
+def cancel(tokens, session=session):
     if len(tokens) != 2:
         print("Invalid arguments. Usage: cancel <appointment_id>")
-        return
+        return False
 
     if not session["logged_in"]:
         print("Please login first!")
-        return
+        return False
 
     try:
         appointment_id = int(tokens[1])
     except ValueError:
         print("Appointment ID must be a number.")
-        return
-
-    cm = ConnectionManager()
-    conn = cm.create_connection()
-    cursor = conn.cursor()
+        return False
 
     try:
-
-        # Fetch appointment details
-        appointment_query = """
-            SELECT Vaccine_Name, Date, Caregiver_Username
-            FROM Appointments
-            WHERE Appointment_ID = %s;
-        """
-        cursor.execute(appointment_query, (appointment_id,))
-        appointment = cursor.fetchone()
-
-        if not appointment:
+        backfilled = []
+        canceled = Appointment.cancel(appointment_id, backfilled)
+        if canceled is None:
             print("No such appointment exists.")
-            return
-
-        vaccine_name, appointment_date, caregiver_username = appointment
-
-        # Remove appointment
-        delete_appointment_query = """
-            DELETE FROM Appointments
-            WHERE Appointment_ID = %s;
-        """
-        cursor.execute(delete_appointment_query, (appointment_id,))
-
-        # Restore caregiver availability
-        update_availability_query = """
-            UPDATE Availabilities
-            SET Reserved = 0
-            WHERE Time = %s AND Username = %s;
-        """
-        cursor.execute(update_availability_query, (appointment_date, caregiver_username))
-
-        # Increment vaccine doses
-        update_vaccine_query = """
-            UPDATE Vaccines
-            SET Doses = Doses + 1
-            WHERE Name = %s;
-        """
-        cursor.execute(update_vaccine_query, (vaccine_name,))
-
-        # Commit the changes
-        conn.commit()
+            return False
         print(f"Appointment ID {appointment_id} has been canceled.")
-    except pymssql.Error as e:
+        print_canceled_follow_ups([canceled])
+        print_backfilled(backfilled)
+        return True
+    except ReservationConflict as e:
+        print(e)
+        return False
+    except DB_ERRORS as e:
         print(f"Error canceling appointment: {e}")
-        conn.rollback()
-    finally:
-        cm.close_connection()
+        return False
 
 
-def add_doses(tokens):
+def add_doses(tokens, session=session):
     if not session["logged_in"] or session["role"] != "caregiver":
         print("Please login as a caregiver first!")
-        return
-
-    if len(tokens) != 3:
-        print("Invalid arguments. Usage: add_doses <vaccine> <number>")
-        return
+        return False
 
-    vaccine_name = tokens[1]
+    usage = "Invalid arguments. Usage: add_doses <vaccine> <number> [--lot <lot>] [--expires <date>]"
     try:
-        doses = int(tokens[2])
+        args, options = split_options(tokens, {"--lot": str, "--expires": parse_date})
+    except ValueError:
+        print(usage)
+        return False
+    if len(args) != 3:
+        print(usage)
+        return False
+
+    vaccine_name = args[1]
+    lot = options.get("--lot", Vaccine.DEFAULT_LOT)
+    expires = options.get("--expires")
+    if expires is not None and expires < datetime.date.today():
+        print("Lot has already expired!")
+        return False
+    try:
+        doses = int(args[2])
         if doses <= 0:
             print("Number of doses must be positive!")
-            return
+            return False
     except ValueError:
         print("Invalid number of doses!")
-        return
+        return False
 
     vaccine = Vaccine(vaccine_name, doses)
+    backfilled = []
     try:
         existing_vaccine = vaccine.get()
         if existing_vaccine:
-            existing_vaccine.increase_available_doses(doses)
+            existing_vaccine.increase_available_doses(
+                doses, lot, expires,
+                before_commit=lambda tx: backfilled.extend(Appointment.backfill(tx, vaccine_name=vaccine_name)))
         else:
-            vaccine.save_to_db()
+            vaccine.save_to_db(lot, expires)
         print("Doses updated!")
+        print_backfilled(backfilled)
+        return True
     except Exception as e:
         print(f"Failed to add doses: {e}")
+        return False
 
 
+def print_backfilled(appointments):
+    # Waiting patients booked by the capacity a command just added
+    if appointments:
+        print(f"Booked {len(appointments)} waiting patient{'s' if len(appointments) != 1 else ''} "
+              f"from the waitlist.")
 
-def show_appointments(tokens):
+
+def show_waitlist(tokens, session=session):
     if not session["logged_in"]:
         print("Please login first!")
-        return
+        return False
+
+    if len(tokens) != 1:
+        print("Invalid arguments. Usage: show_waitlist")
+        return False
+
+    try:
+        entries = Waitlist.entries(session["role"], session["username"])
+    except (ValueError, *DB_ERRORS) as e:
+        print(f"Error retrieving waitlist: {e}")
+        return False
+
+    if not entries:
+        print("No one is waiting.")
+        return True
+    for waitlist_id, patient_username, vaccine_name, date, priority in entries:
+        text = (f"Waitlist ID: {waitlist_id}, Vaccine: {vaccine_name}, Date: {date.strftime('%Y-%m-%d')}, "
+                f"Priority: {priority}")
+        if session["role"] == "caregiver":
+            text += f", Patient: {patient_username}"
+        print(text)
+    return True
+
+
+def leave_waitlist(tokens, session=session):
+    if not session["logged_in"] or session["role"] != "patient":
+        print("Please login as a patient!")
+        return False
+
+    if len(tokens) != 2:
+        print("Invalid arguments. Usage: leave_waitlist <waitlist_id>")
+        return False
+
+    try:
+        waitlist_id = int(tokens[1])
+    except ValueError:
+        print("Waitlist ID must be a number.")
+        return False
+
+    try:
+        if Waitlist.leave(session["username"], waitlist_id):
+            print(f"Left waitlist entry {waitlist_id}.")
+            return True
+        print("No such waitlist entry.")
+        return False
+    except DB_ERRORS as e:
+        print("Please try again!")
+        print("Db-Error:", e)
+        return False
+
+
+def prioritize(tokens, session=session):
+    if not session["logged_in"] or session["role"] != "caregiver":
+        print("Please login as a caregiver first!")
+        return False
+
+    if len(tokens) != 3:
+        print("Invalid arguments. Usage: prioritize <waitlist_id> <priority>")
+        return False
+
+    try:
+        waitlist_id, priority = int(tokens[1]), int(tokens[2])
+    except ValueError:
+        print("Waitlist ID and priority must be numbers.")
+        return False
+
+    try:
+        if Waitlist.prioritize(waitlist_id, priority):
+            print(f"Waitlist entry {waitlist_id} now has priority {priority}.")
+            return True
+        print("No such waitlist entry.")
+        return False
+    except DB_ERRORS as e:
+        print("Please try again!")
+        print("Db-Error:", e)
+        return False
+
+
+
+def parse_date(text):
+    return datetime.datetime.strptime(text, "%m-%d-%Y").date()
+
+
+def show_appointments(tokens, session=session):
+    if not session["logged_in"]:
+        print("Please login first!")
+        return False
+
+    usage = ("Invalid arguments. Usage: show_appointments [--after <id>] [--limit <n>] "
+             "[--from <date>] [--to <date>] [--upcoming | --past]")
+    try:
+        args, options = split_options(tokens, {"--after": int, "--limit": int, "--from": parse_date,
+                                               "--to": parse_date, "--upcoming": None, "--past": None})
+    except ValueError:
+        print(usage)
+        return False
+    if len(args) != 1 or ("--upcoming" in options and "--past" in options):
+        print(usage)
+        return False
+
+    limit = options.get("--limit")
+    if limit is not None and limit <= 0:
+        print("Limit must be positive!")
+        return False
+
+    # Keyset paging over the covering (user, Appointment_ID) index; the date
+    # filters are checked on the index rows, so Appointments is never scanned.
+    # Missing filters (and a missing --limit) become bounds every row passes,
+    # so every combination of options runs the same statement.
+    after = options.get("--after", 0)
+    first_date = options.get("--from", datetime.date.min)
+    last_date = options.get("--to", datetime.date.max)
+    today = datetime.date.today()
+    if "--upcoming" in options:
+        first_date = max(first_date, today)
+    if "--past" in options:
+        last_date = min(last_date, today - datetime.timedelta(days=1))
 
     cm = ConnectionManager()
     conn = cm.create_connection()
-    
     try:
-        
         cursor = conn.cursor()
-        
-        if session["role"] == "patient":
-            query = """
-                SELECT Appointment_ID, Vaccine_Name, Date, Caregiver_Username
-                FROM Appointments
-                WHERE Patient_Username = %s
-                ORDER BY Appointment_ID;
-            """
-            cursor.execute(query, (session['username'],))
-            
-        elif session["role"] == "caregiver":
-            query = """
-                SELECT Appointment_ID, Vaccine_Name, Date, Patient_Username
-                FROM Appointments
-                WHERE Caregiver_Username = %s
-                ORDER BY Appointment_ID;
-            """
-            cursor.execute(query, (session["username"],))
-
-        rows = cursor.fetchall()
-        
-        if not rows:
+        Queries.APPOINTMENT_LIST[session["role"]].execute(
+            cursor, (session["username"], after, first_date, last_date) + Queries.page(limit))
+        shown = 0
+        last = None
+        for row in stream_rows(cursor):
+            date_str = row[2].strftime('%Y-%m-%d') if row[2] else 'N/A'
+            print(f"Appointment ID: {row[0]}, "
+                  f"Vaccine: {row[1]}, "
+                  f"Date: {date_str}, "
+                  f"Time: {Util.format_time_of_day(row[4])}, "
+                  f"Related User: {row[3]}")
+            shown += 1
+            last = row[0]
+
+        if shown == 0:
             print("No appointments found.")
-        else:
-            for row in rows:
-                date_str = row[2].strftime('%Y-%m-%d') if row[2] else 'N/A'
-                print(f"Appointment ID: {row[0]}, "
-                      f"Vaccine: {row[1]}, "
-                      f"Date: {date_str}, "
-                      f"Related User: {row[3]}")
-    except pymssql.Error as e:
+        elif limit is not None and shown == limit:
+            filters = "".join(f" {name} {tokens[tokens.index(name) + 1]}" for name in ("--from", "--to")
+                              if name in options)
+            filters += "".join(f" {name}" for name in ("--upcoming", "--past") if name in options)
+            print(f"More appointments: show_appointments --after {last} --limit {limit}{filters}")
+        return True
+    except DB_ERRORS as e:
         print(f"Error retrieving appointments: {e}")
+        return False
     finally:
         cm.close_connection()
 
 
-
-
-
-def logout(tokens):
+def logout(tokens, session=session):
     if not session["logged_in"]:
         print("You are not logged in!")
-        return
+        return False
 
     session["logged_in"] = False
     session["username"] = None
     session["role"] = None
     print("Successfully logged out!")
+    return True
+
+
+def show_stats(tokens, session=session):
+    if len(tokens) != 1:
+        print("Invalid arguments. Usage: stats")
+        return False
+    print_stats()
+    return True
+
+
+COMMANDS = {
+    "create_patient": create_patient,
+    "create_caregiver": create_caregiver,
+    "login_patient": login_patient,
+    "login_caregiver": login_caregiver,
+    "search_caregiver_schedule": search_caregiver_schedule,
+    "find_open_dates": find_open_dates,
+    "reserve": reserve,
+    "upload_availability": upload_availability,
+    "cancel": cancel,
+    "reserve_batch": reserve_batch,
+    "cancel_batch": cancel_batch,
+    "add_doses": add_doses,
+    "set_series": set_series,
+    "plan_follow_ups": plan_follow_ups,
+    "show_appointments": show_appointments,
+    "show_waitlist": show_waitlist,
+    "leave_waitlist": leave_waitlist,
+    "prioritize": prioritize,
+    "logout": logout,
+    "stats": show_stats,
+}
 
 
+def run_command(tokens, session=session):
+    # Dispatches one tokenized command. Returns whether it succeeded: False
+    # if the operation is unknown or the command reported a failure.
+    operation = tokens[0].lower()
+    command = COMMANDS.get(operation)
+    if command is None:
+        print("Invalid operation name! Please try again.")
+        return False
+    with instrumentation.command(operation):
+        return bool(command(tokens, session))
+
+
+def print_stats():
+    if not instrumentation.enabled:
+        print("Instrumentation is off; start with --stats or SchedulerStats=1.")
+        return
+    print(instrumentation.report())
+    print("connection pool:", format_counters(ConnectionManager.get_pool().stats()))
+    print("vaccine cache:", format_counters(Vaccine.cache_stats()))
+    print("reservations:", format_counters(Appointment.retry_stats()))
+    print()
+    print(Queries.report())
+
+
+def print_menu():
+    print()
+    print(" *** Please enter one of the following commands *** ")
+    print("> create_patient <username> <password>")
+    print("> create_caregiver <username> <password>")
+    print("> login_patient <username> <password>")
+    print("> login_caregiver <username> <password>")
+    print("> search_caregiver_schedule <date> [--limit <n>] [--after <username> | --offset <n>]")
+    print("> find_open_dates <from> <to> [vaccine]")
+    print("> reserve <date> <vaccine> [--wait]")
+    print("> upload_availability <date> [<end_date> [--weekdays]] | --file <slots.csv> "
+          "[--from <HH:MM>] [--to <HH:MM>] [--slot <minutes>]")
+    print("> cancel <appointment_id>")
+    print("> reserve_batch <patient>:<date>:<vaccine> ... | --file <bookings.csv>")
+    print("> cancel_batch <appointment_id> ... | --file <ids.csv>")
+    print("> add_doses <vaccine> <number> [--lot <lot>] [--expires <date>]")
+    print("> set_series <vaccine> <doses> <interval_days>")
+    print("> plan_follow_ups <from> <to>")
+    print("> show_appointments [--after <id>] [--limit <n>] [--from <date>] [--to <date>] [--upcoming | --past]")
+    print("> show_waitlist")
+    print("> leave_waitlist <waitlist_id>")
+    print("> prioritize <waitlist_id> <priority>")
+    print("> logout")
+    print("> stats")
+    print("> Quit")
+    print()
+
 
 def start():
     while True:
-        print()
-        print(" *** Please enter one of the following commands *** ")
-        print("> create_patient <username> <password>")
-        print("> create_caregiver <username> <password>")
-        print("> login_patient <username> <password>")
-        print("> login_caregiver <username> <password>")
-        print("> search_caregiver_schedule <date>")
-        print("> reserve <date> <vaccine>")
-        print("> upload_availability <date>")
-        print("> cancel <appointment_id>")
-        print("> add_doses <vaccine> <number>")
-        print("> show_appointments")
-        print("> logout")
-        print("> Quit")
-        print()
+        print_menu()
 
         try:
             response = input("> ").strip()
@@ -483,41 +1030,50 @@ def start():
                 print("No command entered. Please try again!")
                 continue
 
-            operation = tokens[0].lower()
-
-            if operation == "create_patient":
-                create_patient(tokens)
-            elif operation == "create_caregiver":
-                create_caregiver(tokens)
-            elif operation == "login_patient":
-                login_patient(tokens)
-            elif operation == "login_caregiver":
-                login_caregiver(tokens)
-            elif operation == "search_caregiver_schedule":
-                search_caregiver_schedule(tokens)
-            elif operation == "reserve":
-                reserve(tokens)
-            elif operation == "upload_availability":
-                upload_availability(tokens)
-            elif operation == "cancel":
-                cancel(tokens)
-            elif operation == "add_doses":
-                add_doses(tokens)
-            elif operation == "show_appointments":
-                show_appointments(tokens)
-            elif operation == "logout":
-                logout(tokens)
-            elif operation == "quit":
+            if tokens[0].lower() == "quit":
                 print("Bye!")
                 break
-            else:
-                print("Invalid operation name! Please try again.")
+            run_command(tokens)
         except ValueError as ve:
             print(f"Input error: {ve}. Please try again.")
         except Exception as e:
             print(f"An unexpected error occurred: {e}. Please try again.")
 
 
+def run_script(lines):
+    # Non-interactive mode: runs commands back to back without the menu, one
+    # per line (blank lines and # comments are skipped), then prints
+    # per-command latency and error counts.
+    stats = LatencyStats()
+    for line in lines:
+        tokens = line.split()
+        if not tokens or tokens[0].startswith("#"):
+            continue
+        operation = tokens[0].lower()
+        if operation == "quit":
+            break
+
+        started = time.perf_counter()
+        try:
+            ok = run_command(tokens)
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}.")
+            ok = False
+        stats.record(operation if operation in COMMANDS else "<invalid>", time.perf_counter() - started, error=not ok)
+
+    print()
+    print(stats.summary())
+    print("connection pool:", format_counters(ConnectionManager.get_pool().stats()))
+    print("vaccine cache:", format_counters(Vaccine.cache_stats()))
+    print("reservations:", format_counters(Appointment.retry_stats()))
+    print()
+    print(Queries.report())
+    return stats
+
+
+def format_counters(counters):
+    return ", ".join(f"{name}={value}" for name, value in counters.items())
+
 
 if __name__ == "__main__":
     '''
@@ -526,7 +1082,31 @@ if __name__ == "__main__":
     // for the simplicity of this assignment
     // and then construct a map of vaccineName -> vaccineObject
     '''
-    # start command line
-    print()
-    print("Welcome to the COVID-19 Vaccine Reservation Scheduling Application!")
-    start()
+    parser = argparse.ArgumentParser(description="COVID-19 Vaccine Reservation Scheduling Application")
+    parser.add_argument("--script", metavar="FILE",
+                        help="run the commands in FILE ('-' for stdin) without the interactive menu")
+    parser.add_argument("--stats", action="store_true",
+                        help="record per-command timings; dump them with 'stats' and at exit")
+    parser.add_argument("--profile", metavar="COMMANDS", default="",
+                        help="comma-separated commands to run under cProfile (implies --stats)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="record each command's peak allocation with tracemalloc (implies --stats)")
+    cli_args = parser.parse_args()
+
+    if cli_args.stats or cli_args.profile or cli_args.trace_memory:
+        instrumentation.enabled = True
+    instrumentation.profile_commands = {c.strip().lower() for c in cli_args.profile.split(",") if c.strip()}
+    instrumentation.trace_memory = cli_args.trace_memory
+    if instrumentation.enabled:
+        atexit.register(lambda: print(instrumentation.report(), file=sys.stderr))
+
+    if cli_args.script == "-":
+        run_script(sys.stdin)
+    elif cli_args.script:
+        with open(cli_args.script) as script:
+            run_script(script)
+    else:
+        # start command line
+        print()
+        print("Welcome to the COVID-19 Vaccine Reservation Scheduling Application!")
+        start()
@@ -0,0 +1,130 @@
+# asyncio front-end that serves the Scheduler commands to many concurrent
+# clients over a local TCP socket. Each line a client sends is one command
+# (same syntax as the CLI); each reply is one JSON line:
+#
+#   {"ok": true, "output": "Logged in as: alice\n", "ms": 41.7}
+#
+# Every connection has its own session. Commands run on a thread pool so
+# blocking database and KDF work never stalls the event loop.
+#
+#   cd src/main/scheduler
+#   DBBackend=sqlite SQLitePath=/tmp/scheduler.db python Service.py --port 8414
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import Scheduler
+
+
+class ThreadLocalStdout:
+    # Commands report through print(); while a command runs, its thread's
+    # output goes to a private buffer instead of the shared stdout.
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def capture(self):
+        self._local.buffer = io.StringIO()
+        return self._local.buffer
+
+    def release(self):
+        self._local.buffer = None
+
+    def write(self, text):
+        buffer = getattr(self._local, "buffer", None)
+        return (buffer or self._stream).write(text)
+
+    def flush(self):
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class SchedulerService:
+
+    def __init__(self, workers=None):
+        self.workers = workers or int(os.getenv("ServiceWorkers") or 32)
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix="service")
+        if not isinstance(sys.stdout, ThreadLocalStdout):
+            sys.stdout = ThreadLocalStdout(sys.stdout)
+        self.stdout = sys.stdout
+        self.clients = 0
+
+    def execute(self, tokens, session):
+        buffer = self.stdout.capture()
+        try:
+            ok = Scheduler.run_command(tokens, session)
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}.")
+            ok = False
+        finally:
+            self.stdout.release()
+        return ok, buffer.getvalue()
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        session = Scheduler.new_session()
+        self.clients += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                tokens = line.decode("utf-8", errors="replace").split()
+                if not tokens:
+                    continue
+                if tokens[0].lower() == "quit":
+                    writer.write(json.dumps({"ok": True, "output": "Bye!\n", "ms": 0.0}).encode() + b"\n")
+                    await writer.drain()
+                    break
+
+                started = time.perf_counter()
+                ok, output = await loop.run_in_executor(self.executor, self.execute, tokens, session)
+                reply = {"ok": ok, "output": output, "ms": round((time.perf_counter() - started) * 1000, 3)}
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=8414):
+        return await asyncio.start_server(self.handle, host, port)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+async def serve(host, port, workers):
+    service = SchedulerService(workers)
+    server = await service.start(host, port)
+    addresses = ", ".join(str(s.getsockname()) for s in server.sockets)
+    print(f"Scheduler service listening on {addresses}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scheduler service for concurrent clients")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8414)
+    parser.add_argument("--workers", type=int, default=None,
+                        help="threads for blocking command work (default: ServiceWorkers or 32)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,111 @@
+# Dose inventory contention: many threads take doses of one vaccine at once,
+# with its stock in a single row (--shards 1, the old Vaccines.Doses design)
+# and spread over lot shards. Every draw runs in its own reservation
+# transaction and keeps its row locked for --hold-ms before committing, which
+# stands in for the rest of a reservation's round trips. Reports throughput,
+# latency and lost races per shard count, and checks that no dose was handed
+# out twice.
+#
+# SQLite locks the whole database for every write transaction, so shard
+# counts only pull apart on a row-locking server such as Azure SQL. With
+# --use-env-backend the run creates (and afterwards deletes) its own
+# benchmark vaccines in the DBBackend database.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.DoseContention --threads 16 --shards 1,8,32
+#   DBBackend=mssql ... python -m benchmark.DoseContention --use-env-backend
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db.Backend import SQLiteBackend, get_backend
+from db.ConnectionManager import ConnectionManager
+from model.Appointment import Appointment
+from model.Vaccine import Vaccine
+from util.Stats import LatencyStats
+from benchmark import Seed
+
+
+def run(shards, threads, draws, hold):
+    name = f"contention-s{shards}-{os.getpid()}"
+    Vaccine.SHARDS = shards
+    Vaccine(name, draws).save_to_db()
+
+    def draw(_):
+        def work(tx):
+            row = Appointment._claim_dose(tx.cursor, tx.dialect, name, Seed.START_DATE)
+            if row is None:
+                raise ValueError("Not enough available doses!")
+            time.sleep(hold)
+            return row
+
+        started = time.perf_counter()
+        Appointment._transaction(work)
+        return time.perf_counter() - started
+
+    retries_before = Appointment.retry_stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(draw, range(draws)))
+    elapsed = time.perf_counter() - started
+    retries = {key: count - retries_before[key] for key, count in Appointment.retry_stats().items()}
+
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT SUM(Doses), COUNT(*) FROM VaccineLots WHERE Vaccine_Name = %s", (name,))
+        remaining, rows = cursor.fetchone()
+        cursor.execute("DELETE FROM VaccineLots WHERE Vaccine_Name = %s", (name,))
+        cursor.execute("DELETE FROM Vaccines WHERE Name = %s", (name,))
+        conn.commit()
+    finally:
+        cm.close_connection()
+
+    if remaining != 0:
+        print(f"FAIL: {remaining} doses left over {rows} rows after {draws} draws of {draws}")
+    return remaining == 0, {
+        "shards": shards,
+        "draws_s": draws / elapsed,
+        "p50_ms": LatencyStats.percentile(latencies, 50) * 1000,
+        "p99_ms": LatencyStats.percentile(latencies, 99) * 1000,
+        "conflicts": retries["conflicts"],
+        "transient": retries["transient_errors"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-row vs sharded dose inventory under concurrent reservations")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--draws", type=int, default=2000, help="doses taken per shard count")
+    parser.add_argument("--shards", default="1,8,32", help="comma-separated shard counts to compare")
+    parser.add_argument("--hold-ms", type=float, default=2.0, help="time each draw keeps its transaction open")
+    parser.add_argument("--use-env-backend", action="store_true",
+                        help="run against the DBBackend database instead of a temporary SQLite file")
+    args = parser.parse_args()
+
+    ok = True
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = get_backend() if args.use_env_backend else SQLiteBackend(os.path.join(tmp, "doses.db"))
+        ConnectionManager.configure(backend, max_size=args.threads)
+        for shards in (int(s) for s in args.shards.split(",")):
+            passed, result = run(shards, args.threads, args.draws, args.hold_ms / 1000)
+            ok = ok and passed
+            results.append(result)
+        ConnectionManager.get_pool().close()
+
+    print(f"{backend.dialect}: {args.draws} draws per run on {args.threads} threads, {args.hold_ms} ms hold")
+    print(f"{'shards':>6}{'draws/s':>10}{'p50 ms':>9}{'p99 ms':>9}{'lost races':>12}{'transient':>11}")
+    for r in results:
+        print(f"{r['shards']:>6}{r['draws_s']:>10.0f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{r['conflicts']:>12}{r['transient']:>11}")
+    if backend.dialect == "sqlite":
+        print("sqlite serializes all writers, so expect similar rows; compare shard counts on Azure SQL")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Follow-up doses for a cohort that already has its first dose: one reserve
+# per patient for the second dose (how staff book them by hand) against one
+# plan_follow_ups for the whole cohort. Every round trip is delayed by
+# --rtt-ms (benchmark.RoundTrips) to stand in for the link to Azure SQL.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.FollowUps --patients 500 --rtt-ms 5
+import argparse
+import datetime
+import os
+import tempfile
+import time
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from model.Appointment import Appointment
+from model.Vaccine import Vaccine
+from benchmark import Seed
+from benchmark.RoundTrips import SlowBackend, trips
+
+
+def timed(fn):
+    before, started = trips(), time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started, trips() - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Booking second doses one by one vs plan_follow_ups")
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--interval-days", type=int, default=21)
+    parser.add_argument("--rtt-ms", type=float, default=5.0, help="delay added to every round trip")
+    args = parser.parse_args()
+
+    vaccine_name = Seed.vaccine_name(0)
+    first_date = Seed.START_DATE
+    follow_up_date = first_date + datetime.timedelta(days=args.interval_days)
+    patients = [Seed.patient_name(i) for i in range(args.patients)]
+    chunks = [patients[i:i + Appointment.BATCH_MAX] for i in range(0, len(patients), Appointment.BATCH_MAX)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ConnectionManager.configure(SlowBackend(SQLiteBackend(os.path.join(tmp, "follow_ups.db")),
+                                                args.rtt_ms / 1000), max_size=1)
+        Seed.seed(caregivers=args.patients // 8 + 1, patients=args.patients, doses=args.patients * 3,
+                  days=args.interval_days + 1, slots=8, slot_minutes=30)
+        Vaccine.refresh_cache()
+        for chunk in chunks:
+            Appointment.reserve_batch([(p, first_date, vaccine_name) for p in chunk])
+
+        # before the vaccine has a series: one reserve per second dose
+        booked, by_hand_s, by_hand_trips = timed(
+            lambda: [Appointment.reserve(p, follow_up_date, vaccine_name) for p in patients])
+        ids = [a.get_appointment_id() for a in booked]
+        for i in range(0, len(ids), Appointment.BATCH_MAX):
+            Appointment.cancel_batch(ids[i:i + Appointment.BATCH_MAX])
+
+        Vaccine.set_series(vaccine_name, 2, args.interval_days)
+        (planned, skipped), plan_s, plan_trips = timed(lambda: Appointment.plan_follow_ups(first_date, first_date))
+        ConnectionManager.get_pool().close()
+
+    print(f"rtt {args.rtt_ms} ms, {args.patients} patients, second dose {args.interval_days} days later")
+    print(f"{'flow':<16}{'booked':>8}{'ms':>10}{'trips':>8}{'speedup':>9}")
+    print(f"{'one by one':<16}{len(booked):>8}{by_hand_s * 1000:>10.1f}{by_hand_trips:>8}{1:>8.1f}x")
+    print(f"{'plan_follow_ups':<16}{len(planned):>8}{plan_s * 1000:>10.1f}{plan_trips:>8}"
+          f"{by_hand_s / plan_s:>8.1f}x")
+    if skipped:
+        print(f"{len(skipped)} series could not be completed, e.g. {skipped[0][1]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Group bookings: a family or workplace group booked and canceled with one
+# reserve / cancel per patient (the only way before reserve_batch) against
+# one reserve_batch / cancel_batch for the whole group. Every round trip is
+# delayed by --rtt-ms (benchmark.RoundTrips) to stand in for the link to
+# Azure SQL; the report shows time and round trips per group.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.GroupBooking --sizes 5,25,100 --rtt-ms 5
+import argparse
+import os
+import tempfile
+import time
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from model.Appointment import Appointment
+from model.Vaccine import Vaccine
+from util.Stats import LatencyStats
+from benchmark import Seed
+from benchmark.RoundTrips import SlowBackend, trips
+
+
+def timed(fn):
+    before, started = trips(), time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - started, trips() - before
+
+
+def one_by_one(items):
+    booked, reserve_s, reserve_trips = timed(lambda: [Appointment.reserve(*item) for item in items])
+    _, cancel_s, cancel_trips = timed(lambda: [Appointment.cancel(a.get_appointment_id()) for a in booked])
+    return reserve_s, reserve_trips, cancel_s, cancel_trips
+
+
+def batched(items):
+    booked, reserve_s, reserve_trips = timed(lambda: Appointment.reserve_batch(items))
+    _, cancel_s, cancel_trips = timed(lambda: Appointment.cancel_batch([a.get_appointment_id() for a in booked]))
+    return reserve_s, reserve_trips, cancel_s, cancel_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Looping reserve / cancel vs reserve_batch / cancel_batch")
+    parser.add_argument("--sizes", default="5,25,100", help="comma-separated group sizes")
+    parser.add_argument("--rtt-ms", type=float, default=5.0, help="delay added to every round trip")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    if max(sizes) > Appointment.BATCH_MAX:
+        parser.error(f"groups are limited to {Appointment.BATCH_MAX} patients")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        ConnectionManager.configure(SlowBackend(SQLiteBackend(os.path.join(tmp, "groups.db")), args.rtt_ms / 1000),
+                                    max_size=1)
+        Seed.seed(caregivers=max(sizes) // 8 + 1, patients=max(sizes), doses=max(sizes) * 2, slots=8,
+                  slot_minutes=30)
+        Vaccine.refresh_cache()
+        for size in sizes:
+            items = [(Seed.patient_name(i), Seed.START_DATE, Seed.vaccine_name(0)) for i in range(size)]
+            for label, flow in (("one by one", one_by_one), ("batch", batched)):
+                results[(size, label)] = [flow(items) for _ in range(args.repeat)]
+        ConnectionManager.get_pool().close()
+
+    print(f"rtt {args.rtt_ms} ms, median of {args.repeat} runs per group")
+    print(f"{'size':>5}  {'flow':<11}{'reserve ms':>11}{'trips':>7}{'cancel ms':>11}{'trips':>7}{'speedup':>9}")
+    for size in sizes:
+        medians = {}
+        for label in ("one by one", "batch"):
+            runs = results[(size, label)]
+            medians[label] = [LatencyStats.percentile(sorted(run[column] for run in runs), 50)
+                              for column in range(4)]
+        for label, (reserve_s, reserve_trips, cancel_s, cancel_trips) in medians.items():
+            speedup = (medians["one by one"][0] + medians["one by one"][2]) / (reserve_s + cancel_s)
+            print(f"{size:>5}  {label:<11}{reserve_s * 1000:>11.1f}{reserve_trips:>7.0f}"
+                  f"{cancel_s * 1000:>11.1f}{cancel_trips:>7.0f}{speedup:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# Latency of the Availabilities / Appointments hot-path queries as the tables
+# grow, before and after the index migrations in resources/migrations.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.IndexLatency --sizes 1000,10000,100000,1000000
+import argparse
+import datetime
+import os
+import random
+import statistics
+import tempfile
+import time
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from benchmark import Seed
+
+DAYS = 365
+
+QUERIES = {
+    "reserve: open slot": """
+        SELECT Username FROM Availabilities
+        WHERE Time = %s AND Reserved = 0
+        ORDER BY Username;
+    """,
+    "show_appointments: patient": """
+        SELECT Appointment_ID, Vaccine_Name, Date, Caregiver_Username
+        FROM Appointments
+        WHERE Patient_Username = %s
+        ORDER BY Appointment_ID;
+    """,
+    "show_appointments: caregiver": """
+        SELECT Appointment_ID, Vaccine_Name, Date, Patient_Username
+        FROM Appointments
+        WHERE Caregiver_Username = %s
+        ORDER BY Appointment_ID;
+    """,
+    "cancel: slot appointments": """
+        SELECT Appointment_ID FROM Appointments
+        WHERE Date = %s AND Caregiver_Username = %s;
+    """,
+}
+
+
+def load(cursor, appointments):
+    # ~10% of slots stay open; every booked slot gets one appointment
+    caregivers = max(1, appointments * 10 // 9 // DAYS + 1)
+    patients = max(1, appointments // 10)
+    dates = [Seed.START_DATE + datetime.timedelta(days=d) for d in range(DAYS)]
+    slots = [(d, Seed.caregiver_name(c)) for c in range(caregivers) for d in dates]
+    booked = [slot for i, slot in enumerate(slots) if i % 10 != 0][:appointments]
+
+    Seed.insert_rows(cursor, "INSERT INTO Caregivers (Username, Salt, Hash) VALUES (%s, %s, %s)",
+                 ((Seed.caregiver_name(c), Seed.SEED_SALT, Seed.SEED_HASH) for c in range(caregivers)), 5000)
+    Seed.insert_rows(cursor, "INSERT INTO Patients (Username, Salt, Hash) VALUES (%s, %s, %s)",
+                 ((Seed.patient_name(p), Seed.SEED_SALT, Seed.SEED_HASH) for p in range(patients)), 5000)
+    cursor.execute("INSERT INTO Vaccines (Name) VALUES (%s)", (Seed.vaccine_name(0),))
+    booked_set = set(booked)
+    Seed.insert_rows(cursor, "INSERT INTO Availabilities (Time, Username, Reserved) VALUES (%s, %s, %d)",
+                 ((d, c, 1 if (d, c) in booked_set else 0) for d, c in slots), 5000)
+    Seed.insert_rows(cursor, """
+        INSERT INTO Appointments (Patient_Username, Caregiver_Username, Vaccine_Name, Date)
+        VALUES (%s, %s, %s, %s)
+    """, ((Seed.patient_name(i % patients), c, Seed.vaccine_name(0), d) for i, (d, c) in enumerate(booked)), 5000)
+    return dates, caregivers, patients
+
+
+def measure(cursor, dates, caregivers, patients, repeat):
+    rng = random.Random(414)
+    params = {
+        "reserve: open slot": lambda: (rng.choice(dates),),
+        "show_appointments: patient": lambda: (Seed.patient_name(rng.randrange(patients)),),
+        "show_appointments: caregiver": lambda: (Seed.caregiver_name(rng.randrange(caregivers)),),
+        "cancel: slot appointments": lambda: (rng.choice(dates), Seed.caregiver_name(rng.randrange(caregivers))),
+    }
+    results = {}
+    for name, query in QUERIES.items():
+        samples = []
+        for _ in range(repeat):
+            args = params[name]()
+            started = time.perf_counter()
+            cursor.execute(query, args)
+            cursor.fetchall()
+            samples.append(time.perf_counter() - started)
+        results[name] = statistics.median(samples) * 1e6
+    return results
+
+
+def run(size, repeat, tmp):
+    backend = SQLiteBackend(os.path.join(tmp, f"indexes-{size}.db"), create_schema=False)
+    backend.create_schema()
+    ConnectionManager.configure(backend, max_size=1)
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    try:
+        shape = load(cursor, size)
+        conn.commit()
+        cursor.execute("ANALYZE")
+        before = measure(cursor, *shape, repeat)
+        conn.commit()
+    finally:
+        cm.close_connection()
+
+    backend.migrate()
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("ANALYZE")
+        after = measure(cursor, *shape, repeat)
+    finally:
+        cm.close_connection()
+    ConnectionManager.get_pool().close()
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path query latency with and without indexes")
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="comma-separated Appointments row counts")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'appointments':>12}  {'query':<30} {'no index (us)':>14} {'indexed (us)':>13} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(",")):
+            before, after = run(size, args.repeat, tmp)
+            for name in QUERIES:
+                print(f"{size:>12}  {name:<30} {before[name]:>14.1f} {after[name]:>13.1f} "
+                      f"{before[name] / after[name]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
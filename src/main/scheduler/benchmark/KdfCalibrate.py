@@ -0,0 +1,51 @@
+# Picks the PBKDF2 iteration count that meets a target hashing latency on
+# this machine, to be exported as KdfIterations.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.KdfCalibrate --target-ms 50
+import argparse
+import statistics
+import time
+from util.Util import Util
+
+
+def time_hash(algorithm, iterations, repeat):
+    params = Util.format_params(algorithm, iterations)
+    salt = Util.generate_salt()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        Util.generate_hash("Calibrate#1", salt, params)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def calibrate(algorithm, target_seconds, repeat):
+    # PBKDF2 cost is linear in the iteration count: measure, scale, confirm
+    iterations = 10000
+    seconds = time_hash(algorithm, iterations, repeat)
+    for _ in range(3):
+        iterations = max(1000, int(iterations * target_seconds / seconds) // 1000 * 1000)
+        seconds = time_hash(algorithm, iterations, repeat)
+    return iterations, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the password KDF iteration count")
+    parser.add_argument("--target-ms", type=float, default=50.0)
+    parser.add_argument("--algorithm", default="pbkdf2_sha256", choices=sorted(Util.ALGORITHMS))
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    current = Util.current_params()
+    algorithm, iterations = Util.parse_params(current)
+    print(f"current {current}: {time_hash(algorithm, iterations, args.repeat) * 1000:.1f} ms")
+
+    iterations, seconds = calibrate(args.algorithm, args.target_ms / 1000, args.repeat)
+    print(f"{args.algorithm} with {iterations} iterations: {seconds * 1000:.1f} ms "
+          f"(target {args.target_ms:.0f} ms)")
+    print(f"export KdfAlgorithm={args.algorithm} KdfIterations={iterations}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Logins per second as the KDF pool grows from one worker to every core.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.LoginThroughput --logins 200 --kind thread
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from model.Patient import Patient
+from util import KdfPool
+from util.Util import Util
+from benchmark import Seed
+
+def measure(workers, kind, logins, accounts):
+    KdfPool.configure(workers=workers, kind=kind)
+    # more callers than workers so the pool, not the callers, is the limit
+    with ThreadPoolExecutor(max_workers=workers * 4) as callers:
+        started = time.perf_counter()
+        results = list(callers.map(lambda i: Patient.login_patient(Seed.patient_name(i % accounts), Seed.PASSWORD),
+                                   range(logins)))
+        elapsed = time.perf_counter() - started
+    assert all(results), "a benchmark login failed"
+    return logins / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login throughput against KDF pool size")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--kind", choices=("thread", "process"), default="thread")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    counts = sorted({1, args.max_workers} | {2 ** i for i in range(1, 8) if 2 ** i < args.max_workers})
+    with tempfile.TemporaryDirectory() as tmp:
+        ConnectionManager.configure(SQLiteBackend(os.path.join(tmp, "logins.db")), max_size=16)
+        Seed.seed(caregivers=0, patients=args.accounts, vaccines=0, days=0, loginable=True)
+        print(f"{Util.current_params()}, {args.kind} pool, {os.cpu_count()} cores")
+        baseline = None
+        for workers in counts:
+            rate = measure(workers, args.kind, args.logins, args.accounts)
+            baseline = baseline or rate
+            print(f"{workers:>4} workers: {rate:8.1f} logins/s  ({rate / baseline:.2f}x)")
+        KdfPool.get_pool().shutdown()
+        ConnectionManager.get_pool().close()
+
+
+if __name__ == "__main__":
+    main()
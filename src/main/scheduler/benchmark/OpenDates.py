@@ -0,0 +1,66 @@
+# Finding open dates over a month: one search_caregiver_schedule per day (the
+# only way before find_open_dates) against a single find_open_dates, which
+# reads the per-day open-slot counts of migration 0008. Commands run through
+# Scheduler.run_command on a seeded SQLite database with their output
+# discarded.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.OpenDates --caregivers 500 --days 30
+import argparse
+import contextlib
+import datetime
+import io
+import os
+import tempfile
+import time
+import Scheduler
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from util.Stats import LatencyStats
+from benchmark import Seed
+
+
+def timed(commands, repeat):
+    session = Scheduler.new_session()
+    session.update(logged_in=True, username=Seed.patient_name(0), role="patient")
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for tokens in commands:
+                Scheduler.run_command(tokens, session)
+        samples.append(time.perf_counter() - started)
+    return sorted(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-day searches vs find_open_dates over a date range")
+    parser.add_argument("--caregivers", type=int, default=500)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--slots", type=int, default=8, help="slots per caregiver per day")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ConnectionManager.configure(SQLiteBackend(os.path.join(tmp, "open.db")), max_size=2)
+        dates = Seed.seed(caregivers=args.caregivers, patients=1, days=args.days, slots=args.slots,
+                          slot_minutes=60)
+        first, last = (d.strftime("%m-%d-%Y") for d in (dates[0], dates[-1] + datetime.timedelta(days=7)))
+        flows = {
+            "search per day": [["search_caregiver_schedule", d.strftime("%m-%d-%Y")] for d in dates],
+            "search --limit 1": [["search_caregiver_schedule", d.strftime("%m-%d-%Y"), "--limit", "1"]
+                                 for d in dates],
+            "find_open_dates": [["find_open_dates", first, last]],
+        }
+        results = {label: timed(commands, args.repeat) for label, commands in flows.items()}
+        ConnectionManager.get_pool().close()
+
+    print(f"{args.caregivers} caregivers x {args.days} days, {args.slots} slots each")
+    print(f"{'flow':<18}{'commands':>9}{'p50 ms':>10}{'p99 ms':>10}")
+    for label, samples in results.items():
+        print(f"{label:<18}{len(flows[label]):>9}{LatencyStats.percentile(samples, 50) * 1000:>10.2f}"
+              f"{LatencyStats.percentile(samples, 99) * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
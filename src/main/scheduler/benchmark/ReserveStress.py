@@ -0,0 +1,145 @@
+# Multi-threaded reservation stress run: many patients race for fewer slots
+# and doses than they need, then the database is checked for double-booked
+# slots, negative inventory and appointments the engine did not report.
+# Each caregiver assignment strategy (model.Assignment) runs on a fresh
+# database, and the lost races, throughput and spread of bookings across
+# caregivers are compared at the end.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.ReserveStress --threads 32 --patients 2000
+#   python -m benchmark.ReserveStress --strategy round_robin --days 5
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from model import Assignment
+from model.Appointment import Appointment, ReservationConflict
+from model.Vaccine import Vaccine
+from benchmark import Seed
+
+
+def run(threads, caregivers, patients, doses, days, strategy):
+    dates = Seed.seed(caregivers=caregivers, patients=patients, doses=doses, days=days)
+    vaccine = Seed.vaccine_name(0)
+    booked = []
+    outcomes = Counter()
+    lock = threading.Lock()
+
+    def book(i):
+        try:
+            appointment = Appointment.reserve(Seed.patient_name(i), dates[i % days], vaccine, strategy)
+            with lock:
+                booked.append(appointment)
+                outcomes["booked"] += 1
+        except (ValueError, ReservationConflict) as e:
+            with lock:
+                outcomes[str(e)] += 1
+
+    retries_before = Appointment.retry_stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(book, range(patients)))
+    elapsed = time.perf_counter() - started
+    retries = {name: count - retries_before[name] for name, count in Appointment.retry_stats().items()}
+
+    print(f"[{strategy}] {patients} reservations on {threads} threads in {elapsed:.2f}s "
+          f"({patients / elapsed:.0f} req/s)")
+    for outcome, count in sorted(outcomes.items()):
+        print(f"  {outcome}: {count}")
+    per_caregiver = Counter(a.get_caregiver_username() for a in booked)
+    loads = [per_caregiver[Seed.caregiver_name(i)] for i in range(caregivers)]
+    result = {
+        "strategy": str(strategy),
+        "req_s": patients / elapsed,
+        "conflicts": retries["conflicts"],
+        "transient": retries["transient_errors"],
+        "min_load": min(loads),
+        "max_load": max(loads),
+    }
+    return verify(booked, caregivers * days, doses), result
+
+
+def verify(booked, slots, doses):
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    problems = []
+    try:
+        cursor.execute("""
+            SELECT Caregiver_Username, Date, COUNT(*)
+            FROM Appointments
+            GROUP BY Caregiver_Username, Date
+            HAVING COUNT(*) > 1
+        """)
+        for row in cursor.fetchall():
+            problems.append(f"caregiver {row[0]} double-booked on {row[1]} ({row[2]} appointments)")
+
+        cursor.execute("SELECT Appointment_ID FROM Appointments")
+        stored_ids = {row[0] for row in cursor.fetchall()}
+        reported_ids = [a.get_appointment_id() for a in booked]
+        if len(set(reported_ids)) != len(reported_ids):
+            problems.append("the same Appointment_ID was returned twice")
+        if set(reported_ids) != stored_ids:
+            problems.append("returned Appointment_IDs do not match the Appointments table")
+
+        cursor.execute("SELECT SUM(Doses) FROM VaccineLots")
+        remaining = cursor.fetchone()[0]
+        if remaining < 0 or remaining != doses - len(stored_ids):
+            problems.append(f"{remaining} doses left after {len(stored_ids)} bookings of {doses}")
+
+        cursor.execute("SELECT COUNT(*) FROM Availabilities WHERE Reserved = 1")
+        reserved = cursor.fetchone()[0]
+        if reserved != len(stored_ids):
+            problems.append(f"{reserved} slots marked reserved for {len(stored_ids)} appointments")
+
+        if len(stored_ids) != min(slots, doses):
+            problems.append(f"{len(stored_ids)} bookings, expected {min(slots, doses)}")
+    finally:
+        cm.close_connection()
+
+    for problem in problems:
+        print("FAIL:", problem)
+    if not problems:
+        print("OK: no double-booking, inventory consistent")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent reserve() stress test")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--caregivers", type=int, default=200)
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--doses", type=int, default=150)
+    parser.add_argument("--days", type=int, default=1, help="patients spread their bookings over this many days")
+    parser.add_argument("--strategy", choices=sorted(Assignment.STRATEGIES) + ["all"], default="all")
+    args = parser.parse_args()
+
+    names = sorted(Assignment.STRATEGIES) if args.strategy == "all" else [args.strategy]
+    ok = True
+    results = []
+    for name in names:
+        with tempfile.TemporaryDirectory() as tmp:
+            ConnectionManager.configure(SQLiteBackend(os.path.join(tmp, "stress.db")), max_size=args.threads)
+            Vaccine.invalidate_cache()
+            passed, result = run(args.threads, args.caregivers, args.patients, args.doses, args.days,
+                                 Assignment.create(name))
+            ConnectionManager.get_pool().close()
+        ok = ok and passed
+        results.append(result)
+
+    print()
+    print(f"{'strategy':<14}{'req/s':>8}{'lost races':>12}{'transient':>11}{'bookings/caregiver':>20}")
+    for r in results:
+        print(f"{r['strategy']:<14}{r['req_s']:>8.0f}{r['conflicts']:>12}{r['transient']:>11}"
+              f"{r['min_load']:>13}..{r['max_load']}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Round trips and latency of reserve / cancel over a slow link. Every
+# statement, commit and rollback the engine sends is delayed by --rtt-ms to
+# stand in for a WAN hop to Azure SQL, and counted. Runs the statement-per-step
+# flow and, on backends that have them (Azure SQL after migration 0006), the
+# stored procedures.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.RoundTrips --rtt-ms 20
+#   DBBackend=mssql ... python -m benchmark.RoundTrips --rtt-ms 0 --no-seed
+import argparse
+import os
+import tempfile
+import threading
+import time
+from db.Backend import SQLiteBackend, get_backend
+from db.ConnectionManager import ConnectionManager
+from model.Appointment import Appointment
+from model.Vaccine import Vaccine
+from util.Stats import LatencyStats
+from benchmark import Seed
+
+_trips = threading.local()
+
+
+def trips():
+    return getattr(_trips, "count", 0)
+
+
+def _trip(rtt):
+    _trips.count = trips() + 1
+    if rtt:
+        time.sleep(rtt)
+
+
+class SlowCursor:
+
+    def __init__(self, cursor, rtt):
+        self._cursor = cursor
+        self._rtt = rtt
+
+    def execute(self, *args):
+        _trip(self._rtt)
+        return self._cursor.execute(*args)
+
+    def executemany(self, *args):
+        _trip(self._rtt)
+        return self._cursor.executemany(*args)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+
+class SlowConnection:
+
+    def __init__(self, conn, rtt):
+        self._conn = conn
+        self._rtt = rtt
+
+    def cursor(self, *args, **kwargs):
+        return SlowCursor(self._conn.cursor(*args, **kwargs), self._rtt)
+
+    def commit(self):
+        _trip(self._rtt)
+        return self._conn.commit()
+
+    def rollback(self):
+        _trip(self._rtt)
+        return self._conn.rollback()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class SlowBackend:
+    # Delegates to a real backend, handing out delayed connections
+
+    def __init__(self, backend, rtt):
+        self._backend = backend
+        self._rtt = rtt
+
+    def connect(self):
+        return SlowConnection(self._backend.connect(), self._rtt)
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
+
+
+def timed(results, key, fn, *args):
+    before, started = trips(), time.perf_counter()
+    result = fn(*args)
+    results.setdefault(key, []).append((time.perf_counter() - started, trips() - before))
+    return result
+
+
+def measure(operations, date, vaccine, results, flow):
+    booked = [timed(results, (flow, "reserve"), Appointment.reserve, Seed.patient_name(i), date, vaccine)
+              for i in range(operations)]
+    for appointment in booked:
+        timed(results, (flow, "cancel"), Appointment.cancel, appointment.get_appointment_id())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reserve / cancel round trips over a simulated WAN link")
+    parser.add_argument("--rtt-ms", type=float, default=20.0, help="delay added to every round trip")
+    parser.add_argument("--operations", type=int, default=50)
+    parser.add_argument("--no-seed", action="store_true",
+                        help="use the DBBackend database as is (already seeded with benchmark.Seed)")
+    args = parser.parse_args()
+    rtt = args.rtt_ms / 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = get_backend() if args.no_seed else SQLiteBackend(os.path.join(tmp, "trips.db"))
+        ConnectionManager.configure(SlowBackend(backend, rtt), max_size=1)
+        if not args.no_seed:
+            Seed.seed(caregivers=args.operations, patients=args.operations, doses=args.operations * 2)
+        date, vaccine = Seed.START_DATE, Seed.vaccine_name(0)
+        Vaccine.refresh_cache()
+
+        results = {}
+        flows = [("statements", False)]
+        if Appointment._PROCEDURES["reserve"].supports(backend.dialect):
+            flows.append(("procedures", True))
+        for label, use_procedures in flows:
+            Appointment.USE_PROCEDURES = use_procedures
+            measure(args.operations, date, vaccine, results, label)
+        ConnectionManager.get_pool().close()
+
+    print(f"rtt {args.rtt_ms} ms, {args.operations} reservations and cancellations per flow")
+    print(f"{'flow':<12}{'command':<10}{'p50 ms':>9}{'p99 ms':>9}{'round trips':>13}")
+    for (flow, command), samples in results.items():
+        latencies = sorted(latency for latency, _ in samples)
+        round_trips = sum(count for _, count in samples) / len(samples)
+        print(f"{flow:<12}{command:<10}{LatencyStats.percentile(latencies, 50) * 1000:>9.2f}"
+              f"{LatencyStats.percentile(latencies, 99) * 1000:>9.2f}{round_trips:>13.1f}")
+    if len(flows) == 1:
+        print(f"{backend.dialect} has no stored procedures; run against Azure SQL for the procedure flow")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import datetime
+from db.ConnectionManager import ConnectionManager
+from model.Caregiver import Caregiver
+from model.Vaccine import Vaccine
+from util.Util import Util
+
+# Benchmarks seed accounts directly; hashing every password would dominate
+# setup. Accounts share either a dummy hash or one real hash of PASSWORD.
+SEED_SALT = bytes(16)
+SEED_HASH = bytes(16)
+PASSWORD = "Benchmark#1"
+START_DATE = datetime.date(2027, 1, 4)
+
+
+def caregiver_name(i):
+    return f"caregiver{i:06d}"
+
+
+def patient_name(i):
+    return f"patient{i:07d}"
+
+
+def vaccine_name(i):
+    return f"vaccine{i:03d}"
+
+
+def seed(caregivers=10, patients=100, vaccines=1, doses=1000, days=1, start=START_DATE, batch_size=5000,
+         loginable=False, slots=1, slot_minutes=480, start_minute=540, shards=None):
+    # Loads N caregivers, M patients, K vaccines and D consecutive days on which
+    # every caregiver is available for `slots` slots. Each vaccine's doses are
+    # one lot spread over `shards` shards (default Vaccine.SHARDS). With
+    # loginable=True every account's password is PASSWORD. Returns the list of
+    # seeded dates.
+    dates = [start + datetime.timedelta(days=d) for d in range(days)]
+    if loginable:
+        salt, hash_value, kdf = Util.hash_password(PASSWORD)
+    else:
+        salt, hash_value, kdf = SEED_SALT, SEED_HASH, None
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    try:
+        insert_rows(cursor, "INSERT INTO Caregivers (Username, Salt, Hash, Kdf) VALUES (%s, %s, %s, %s)",
+                    ((caregiver_name(i), salt, hash_value, kdf) for i in range(caregivers)), batch_size)
+        insert_rows(cursor, "INSERT INTO Patients (Username, Salt, Hash, Kdf) VALUES (%s, %s, %s, %s)",
+                    ((patient_name(i), salt, hash_value, kdf) for i in range(patients)), batch_size)
+        insert_rows(cursor, "INSERT INTO Vaccines (Name) VALUES (%s)",
+                    ((vaccine_name(i),) for i in range(vaccines)), batch_size)
+        shards = min(shards or Vaccine.SHARDS, max(doses, 1))
+        insert_rows(cursor, "INSERT INTO VaccineLots (Vaccine_Name, Lot, Shard, Doses) VALUES (%s, %s, %d, %d)",
+                    ((vaccine_name(i), Vaccine.DEFAULT_LOT, shard, doses // shards + (shard < doses % shards))
+                     for i in range(vaccines) for shard in range(shards)), batch_size)
+        insert_rows(cursor, """
+                        INSERT INTO Availabilities (Time, Username, Start_Minute, Slot_Minutes, Slots, Open_Shard)
+                        VALUES (%s, %s, %d, %d, %d, %d)
+                    """,
+                    ((d, caregiver_name(i), start_minute, slot_minutes, slots,
+                      Caregiver.open_day_shard(caregiver_name(i)))
+                     for d in dates for i in range(caregivers)), batch_size)
+        conn.commit()
+    finally:
+        cm.close_connection()
+    return dates
+
+
+def insert_rows(cursor, sql, rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(sql, batch)
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
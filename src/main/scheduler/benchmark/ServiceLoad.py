@@ -0,0 +1,85 @@
+# Load generator for Service.py: starts the service on a seeded SQLite file,
+# opens N concurrent client connections that each log in and replay a mix of
+# commands, then reports requests/sec and p50/p99 latency as seen by clients.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.ServiceLoad --clients 50 --requests 40
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from util.Stats import LatencyStats
+from benchmark import Seed
+from Service import SchedulerService
+
+async def client(i, port, requests, dates, stats):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    rng = random.Random(i)
+
+    async def send(command):
+        started = time.perf_counter()
+        writer.write(command.encode() + b"\n")
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        stats.record(command.split()[0], time.perf_counter() - started, error=not reply["ok"])
+
+    await send(f"login_patient {Seed.patient_name(i)} {Seed.PASSWORD}")
+    for _ in range(requests):
+        date = rng.choice(dates).strftime("%m-%d-%Y")
+        roll = rng.random()
+        if roll < 0.6:
+            await send(f"search_caregiver_schedule {date} --limit 20")
+        elif roll < 0.8:
+            await send("show_appointments")
+        else:
+            await send(f"reserve {date} {Seed.vaccine_name(0)}")
+    writer.write(b"quit\n")
+    await writer.drain()
+    await reader.readline()
+    writer.close()
+
+
+async def run(args, dates):
+    service = SchedulerService(args.workers)
+    server = await service.start("127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    stats = LatencyStats()
+    started = time.perf_counter()
+    async with server:
+        await asyncio.gather(*(client(i, port, args.requests, dates, stats) for i in range(args.clients)))
+    elapsed = time.perf_counter() - started
+    service.shutdown()
+    return stats, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent client load against Service.py")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=40, help="commands per client after login")
+    parser.add_argument("--caregivers", type=int, default=200)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ConnectionManager.configure(SQLiteBackend(os.path.join(tmp, "service.db")), max_size=args.workers)
+        dates = Seed.seed(caregivers=args.caregivers, patients=args.clients, doses=args.clients * 10,
+                          days=args.days, loginable=True)
+        stats, elapsed = asyncio.run(run(args, dates))
+        ConnectionManager.get_pool().close()
+
+    total = sum(len(s) for s in stats.samples.values())
+    everything = sorted(x for s in stats.samples.values() for x in s)
+    print(f"{args.clients} clients, {total} requests in {elapsed:.2f}s: {total / elapsed:.0f} req/s, "
+          f"p50 {LatencyStats.percentile(everything, 50) * 1000:.1f} ms, "
+          f"p99 {LatencyStats.percentile(everything, 99) * 1000:.1f} ms")
+    print(stats.summary())
+
+
+if __name__ == "__main__":
+    main()
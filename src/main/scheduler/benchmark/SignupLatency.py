@@ -0,0 +1,99 @@
+# Signup latency microbenchmark. Seeds a Patients table, then times
+#   - the username probe alone: the old SELECT * lookup, the keys-only EXISTS
+#     probe and the EXISTS probe behind the Bloom filter, for taken and free
+#     names, and
+#   - the whole create_patient command for new and for taken usernames, with
+#     and without the filter, and a taken username without any probe (hash
+#     first, then fail the INSERT).
+#
+#   cd src/main/scheduler
+#   python -m benchmark.SignupLatency --accounts 100000 --signups 200
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+import Scheduler
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from model.Patient import Patient
+from model.Usernames import Usernames
+from util.Stats import LatencyStats
+from benchmark import Seed
+
+
+def select_star(username):
+    # What Scheduler.username_exists_caregiver used to do
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    try:
+        cursor = conn.cursor(as_dict=True)
+        cursor.execute("SELECT * FROM Patients WHERE Username = %s", username)
+        return cursor.fetchone() is not None
+    finally:
+        cm.close_connection()
+
+
+def insert_only(username, password):
+    # The old signup path: hash, then let the INSERT find the duplicate
+    try:
+        Patient.create_patient(username, password)
+    except ValueError:
+        pass
+
+
+def timed(stats, name, fn, *args):
+    started = time.perf_counter()
+    fn(*args)
+    stats.record(name, time.perf_counter() - started)
+
+
+def run(accounts, probes, signups):
+    Seed.seed(caregivers=0, patients=accounts, vaccines=0, days=0)
+    stats = LatencyStats()
+    taken = [Seed.patient_name(i * accounts // probes) for i in range(probes)]
+    free = [f"newpatient{i:07d}" for i in range(probes)]
+
+    Usernames.FILTER_TTL = 300.0
+    for name, probe in (("probe: SELECT *", select_star),
+                        ("probe: EXISTS", lambda u: Usernames.exists("patient", u)),
+                        ("probe: EXISTS + filter", lambda u: Usernames.exists("patient", u, use_filter=True))):
+        for kind, usernames in (("taken", taken), ("free", free)):
+            for username in usernames:
+                timed(stats, f"{name} ({kind})", probe, username)
+
+    password = Seed.PASSWORD
+    for i in range(signups):
+        timed(stats, "create_patient taken, no probe", insert_only, taken[i % len(taken)], password)
+    for use_filter in (False, True):
+        Usernames.FILTER_TTL = 300.0 if use_filter else 0
+        Usernames.invalidate()
+        Usernames.exists("patient", "warmup", use_filter=True)
+        suffix = " + filter" if use_filter else ""
+        with contextlib.redirect_stdout(io.StringIO()):
+            for i in range(signups):
+                timed(stats, f"create_patient new{suffix}", Scheduler.create_patient,
+                      ["create_patient", f"signup{int(use_filter)}{i:06d}", password])
+                timed(stats, f"create_patient taken{suffix}", Scheduler.create_patient,
+                      ["create_patient", taken[i % len(taken)], password])
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Username probe and signup latency")
+    parser.add_argument("--accounts", type=int, default=100000, help="existing patients")
+    parser.add_argument("--probes", type=int, default=2000, help="lookups per probe variant")
+    parser.add_argument("--signups", type=int, default=100, help="create_patient calls per variant")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ConnectionManager.configure(SQLiteBackend(os.path.join(tmp, "signup.db")), max_size=4)
+        stats = run(args.accounts, args.probes, args.signups)
+        ConnectionManager.get_pool().close()
+    print(stats.summary())
+    print("username service:", Scheduler.format_counters(Usernames.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Booking throughput with many slots per caregiver per day. Every slot of
+# every day is booked by concurrent patients, once with one availability row
+# per caregiver and day holding all of its slots ("window"), and once with the
+# same capacity spread over one single-slot row per slot, as the old one-bit
+# schema required ("rows"). Both runs are checked for double-booked slots and
+# Booked counters that disagree with the appointments.
+#
+#   cd src/main/scheduler
+#   python -m benchmark.SlotThroughput --caregivers 20 --slot 15 --days 5
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from model.Appointment import Appointment
+from model.Vaccine import Vaccine
+from util.Util import Util
+from benchmark import Seed
+
+
+def run(layout, threads, caregivers, slots, slot_minutes, start_minute, days):
+    bookings = caregivers * slots * days
+    if layout == "window":
+        dates = Seed.seed(caregivers=caregivers, patients=bookings, doses=bookings, days=days,
+                          slots=slots, slot_minutes=slot_minutes, start_minute=start_minute)
+    else:
+        dates = Seed.seed(caregivers=caregivers * slots, patients=bookings, doses=bookings, days=days)
+    vaccine = Seed.vaccine_name(0)
+
+    def book(i):
+        return Appointment.reserve(Seed.patient_name(i), dates[i % days], vaccine)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        booked = list(pool.map(book, range(bookings)))
+    elapsed = time.perf_counter() - started
+
+    rows = caregivers * days * (1 if layout == "window" else slots)
+    print(f"[{layout}] {bookings} bookings over {days} days from {rows} availability rows "
+          f"in {elapsed:.2f}s: {bookings / elapsed:.0f} bookings/s")
+    return verify(len(booked)), bookings / elapsed
+
+
+def verify(booked):
+    cm = ConnectionManager()
+    conn = cm.create_connection()
+    cursor = conn.cursor()
+    problems = []
+    try:
+        cursor.execute("""
+            SELECT Caregiver_Username, Date, Slot_Minute
+            FROM Appointments
+            GROUP BY Caregiver_Username, Date, Slot_Minute
+            HAVING COUNT(*) > 1
+        """)
+        for row in cursor.fetchall():
+            problems.append(f"slot {Util.format_time_of_day(row[2])} of {row[0]} on {row[1]} booked twice")
+
+        cursor.execute("""
+            SELECT a.Username, a.Time, a.Booked, a.Slots, a.Reserved, COUNT(ap.Appointment_ID)
+            FROM Availabilities a
+            LEFT JOIN Appointments ap ON ap.Date = a.Time AND ap.Caregiver_Username = a.Username
+            GROUP BY a.Username, a.Time, a.Booked, a.Slots, a.Reserved
+        """)
+        for username, date, count, slots, reserved, appointments in cursor.fetchall():
+            if count != appointments or bool(reserved) != (count >= slots):
+                problems.append(f"{username} on {date}: Booked={count}, Reserved={reserved}, "
+                                f"{appointments} appointments of {slots} slots")
+
+        cursor.execute("SELECT COUNT(*) FROM Appointments")
+        stored = cursor.fetchone()[0]
+        if stored != booked:
+            problems.append(f"{stored} appointments stored, {booked} reported")
+    finally:
+        cm.close_connection()
+
+    for problem in problems[:20]:
+        print("FAIL:", problem)
+    if not problems:
+        print("OK: every slot booked once, counters consistent")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Booking throughput at realistic slot counts")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--caregivers", type=int, default=20)
+    parser.add_argument("--from", dest="start", default="08:00", help="first slot of the day (HH:MM)")
+    parser.add_argument("--to", dest="end", default="18:00", help="end of the last slot (HH:MM)")
+    parser.add_argument("--slot", type=int, default=15, help="slot length in minutes")
+    parser.add_argument("--days", type=int, default=5)
+    args = parser.parse_args()
+
+    start_minute = Util.parse_time_of_day(args.start)
+    slots = (Util.parse_time_of_day(args.end) - start_minute) // args.slot
+    if slots <= 0:
+        parser.error("the day must hold at least one slot")
+    print(f"{args.caregivers} caregivers x {slots} slots of {args.slot} min x {args.days} days")
+
+    ok = True
+    for layout in ("window", "rows"):
+        with tempfile.TemporaryDirectory() as tmp:
+            ConnectionManager.configure(SQLiteBackend(os.path.join(tmp, "slots.db")), max_size=args.threads)
+            Vaccine.invalidate_cache()
+            passed, _ = run(layout, args.threads, args.caregivers, slots, args.slot, start_minute, args.days)
+            ConnectionManager.get_pool().close()
+        ok = ok and passed
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
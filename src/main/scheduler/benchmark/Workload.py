@@ -0,0 +1,211 @@
+# End-to-end scheduler benchmark. Seeds N caregivers, M patients, K vaccines
+# and D days of availability, then replays a weighted mix of login_*,
+# search_caregiver_schedule, reserve, cancel and show_appointments through the
+# Scheduler commands from concurrent sessions. Reports throughput, latency
+# percentiles and memory, and writes them as JSON for release-to-release
+# comparison (--baseline prints the change against an earlier run).
+#
+#   cd src/main/scheduler
+#   python -m benchmark.Workload --patients 2000 --operations 5000 --output bench.json
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import Scheduler
+from Service import ThreadLocalStdout
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from db import Queries
+from model import Assignment
+from model.Vaccine import Vaccine
+from util.Stats import LatencyStats
+from util.Util import Util
+from benchmark import Seed
+
+DEFAULT_MIX = "login=5,search=40,reserve=20,cancel=10,show=25"
+
+# Output that marks a command as having done its job
+SUCCESS = {
+    "login": ("Logged in as",),
+    "search": ("Vaccines:",),
+    "reserve": ("Appointment ID:",),
+    "cancel": ("has been canceled",),
+    "show": ("Appointment ID:", "No appointments found."),
+}
+
+
+class Client:
+    # One simulated user with its own session; 1 in 10 are caregivers
+
+    def __init__(self, i, args, dates, rng):
+        self.caregiver = i % 10 == 9
+        self.username = Seed.caregiver_name(i % args.caregivers) if self.caregiver else Seed.patient_name(i)
+        self.session = Scheduler.new_session()
+        self.dates = dates
+        self.vaccines = args.vaccines
+        self.rng = rng
+        self.booked = []
+
+    def command(self, op):
+        if op == "login":
+            self.session.update(Scheduler.new_session())
+            role = "caregiver" if self.caregiver else "patient"
+            return ["login_" + role, self.username, Seed.PASSWORD]
+        if op == "reserve" and not self.caregiver:
+            date = self.rng.choice(self.dates).strftime("%m-%d-%Y")
+            return ["reserve", date, Seed.vaccine_name(self.rng.randrange(self.vaccines))]
+        if op == "cancel" and self.booked:
+            return ["cancel", str(self.booked.pop(self.rng.randrange(len(self.booked))))]
+        if op == "show":
+            return ["show_appointments"]
+        date = self.rng.choice(self.dates).strftime("%m-%d-%Y")
+        return ["search_caregiver_schedule", date, "--limit", "20"]
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        op, weight = part.split("=")
+        if op not in SUCCESS:
+            raise ValueError(f"Unknown operation {op!r} in mix")
+        mix[op] = float(weight)
+    return mix
+
+
+def run(args):
+    dates = Seed.seed(caregivers=args.caregivers, patients=args.patients, vaccines=args.vaccines,
+                      doses=args.doses, days=args.days, loginable=True)
+    clients = [Client(i, args, dates, random.Random(args.seed + i)) for i in range(args.clients)]
+    mix = parse_mix(args.mix)
+    ops, weights = list(mix), list(mix.values())
+    stats = LatencyStats()
+    stats_lock = threading.Lock()
+    stdout = sys.stdout if isinstance(sys.stdout, ThreadLocalStdout) else ThreadLocalStdout(sys.stdout)
+    sys.stdout = stdout
+
+    def execute(client, op, tokens):
+        buffer = stdout.capture()
+        started = time.perf_counter()
+        try:
+            Scheduler.run_command(tokens, client.session)
+        finally:
+            elapsed = time.perf_counter() - started
+            stdout.release()
+        output = buffer.getvalue()
+        succeeded = any(marker in output for marker in SUCCESS[op])
+        if op == "reserve" and succeeded:
+            client.booked.append(int(output.split("Appointment ID:")[1].split(",")[0]))
+        with stats_lock:
+            stats.record(tokens[0], elapsed, error=not succeeded)
+
+    def drive(client, count):
+        execute(client, "login", client.command("login"))
+        for _ in range(count):
+            op = client.rng.choices(ops, weights)[0]
+            tokens = client.command(op)
+            op = {"login_patient": "login", "login_caregiver": "login", "reserve": "reserve", "cancel": "cancel",
+                  "show_appointments": "show"}.get(tokens[0], "search")
+            execute(client, op, tokens)
+
+    per_client = max(1, args.operations // args.clients)
+    if args.trace_memory:
+        tracemalloc.start()
+    Queries.reset_stats()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda c: drive(c, per_client), clients))
+    elapsed = time.perf_counter() - started
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+    sys.stdout = stdout._stream
+
+    operations = sum(len(s) for s in stats.samples.values())
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "backend": ConnectionManager.get_backend().dialect,
+            "kdf": Util.current_params(),
+            "assignment": str(Assignment.get_strategy()),
+        },
+        "elapsed_s": elapsed,
+        "operations": operations,
+        "throughput_ops_s": operations / elapsed,
+        "commands": stats.to_dict(),
+        "memory": {
+            "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            "traced_peak_kib": traced_peak / 1024 if traced_peak is not None else None,
+        },
+        "connection_pool": ConnectionManager.get_pool().stats(),
+        "vaccine_cache": Vaccine.cache_stats(),
+        "queries": {name: {"executions": executions, "total_ms": seconds * 1000}
+                    for name, (executions, seconds) in sorted(Queries.stats().items())},
+    }
+
+
+def report(result, baseline=None):
+    print(f"{result['operations']} operations in {result['elapsed_s']:.2f}s: "
+          f"{result['throughput_ops_s']:.1f} ops/s, max RSS {result['memory']['max_rss_kib'] / 1024:.1f} MiB")
+    if baseline:
+        change = result["throughput_ops_s"] / baseline["throughput_ops_s"] - 1
+        print(f"throughput vs baseline: {change:+.1%}")
+    print(f"{'command':<28}{'count':>7}{'failed':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          + (f"{'p99 vs base':>13}" if baseline else ""))
+    for command, row in result["commands"].items():
+        line = (f"{command:<28}{row['count']:>7}{row['errors']:>8}"
+                f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}")
+        base = (baseline or {}).get("commands", {}).get(command)
+        if base:
+            line += f"{row['p99_ms'] / base['p99_ms'] - 1:>+13.1%}"
+        print(line)
+    print()
+    print(Queries.report())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end vaccine scheduler workload benchmark")
+    parser.add_argument("--caregivers", type=int, default=100)
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--vaccines", type=int, default=3)
+    parser.add_argument("--doses", type=int, default=100000, help="doses per vaccine")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--clients", type=int, default=50, help="concurrent sessions (<= patients)")
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"weighted operations (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=414)
+    parser.add_argument("--sqlite-path", help="database file (default: a temporary file)")
+    parser.add_argument("--trace-memory", action="store_true", help="also report the tracemalloc peak")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+    if args.clients > args.patients:
+        parser.error("--clients cannot exceed --patients")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.sqlite_path or os.path.join(tmp, "workload.db")
+        ConnectionManager.configure(SQLiteBackend(path), max_size=args.threads)
+        result = run(args)
+        ConnectionManager.get_pool().close()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(result, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
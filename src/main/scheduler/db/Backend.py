@@ -0,0 +1,301 @@
+import datetime
+import itertools
+import os
+import re
+import sqlite3
+
+try:
+    import pymssql
+except ImportError:  # only needed for the Azure SQL backend
+    pymssql = None
+
+
+# Catch this instead of pymssql.Error so callers work on every backend
+DB_ERRORS = (sqlite3.Error,) + ((pymssql.Error,) if pymssql is not None else ())
+
+# SQL Server deadlock victim / lock timeout, SQLite busy database
+_TRANSIENT_CODES = (1205, 1222)
+_TRANSIENT_MESSAGES = ("database is locked", "database table is locked")
+
+
+def is_transient(err):
+    # True for errors that go away if the transaction is simply retried
+    if err.args and err.args[0] in _TRANSIENT_CODES:
+        return True
+    return any(m in str(err) for m in _TRANSIENT_MESSAGES)
+
+
+# SQL Server unique index / primary key violations, SQLite UNIQUE failures
+_DUPLICATE_KEY_CODES = (2601, 2627)
+_DUPLICATE_KEY_MESSAGES = ("UNIQUE constraint failed",)
+
+
+def is_duplicate_key(err):
+    # True when an INSERT collided with an existing key
+    if err.args and err.args[0] in _DUPLICATE_KEY_CODES:
+        return True
+    return any(m in str(err) for m in _DUPLICATE_KEY_MESSAGES)
+
+
+def stream_rows(cursor, batch_size=500):
+    # Yields rows in fetchmany() batches instead of materializing fetchall()
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
+RESOURCES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "resources")
+
+
+class Backend:
+    # A storage backend knows its SQL dialect, how to open a DB-API connection
+    # and which scripts build and migrate its tables.
+    dialect = None
+    schema_file = None
+    migrations_table = None
+
+    def connect(self):
+        raise NotImplementedError
+
+    def run_script(self, conn, script):
+        raise NotImplementedError
+
+    def create_schema(self):
+        conn = self.connect()
+        try:
+            with open(os.path.join(RESOURCES_DIR, self.schema_file)) as f:
+                self.run_script(conn, f.read())
+            conn.commit()
+        finally:
+            conn.close()
+
+    def migrate(self):
+        # Applies resources/migrations/<dialect>/*.sql in name order, each once.
+        # Returns the names of the migrations applied by this call.
+        migrations_dir = os.path.join(RESOURCES_DIR, "migrations", self.dialect)
+        applied_now = []
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.migrations_table)
+            conn.commit()
+            cursor.execute("SELECT Version FROM SchemaMigrations")
+            applied = {row[0] for row in cursor.fetchall()}
+            for name in sorted(os.listdir(migrations_dir)):
+                if not name.endswith(".sql") or name in applied:
+                    continue
+                with open(os.path.join(migrations_dir, name)) as f:
+                    self.run_script(conn, f.read())
+                cursor = conn.cursor()
+                cursor.execute("INSERT INTO SchemaMigrations (Version) VALUES (%s)", name)
+                conn.commit()
+                applied_now.append(name)
+        finally:
+            conn.close()
+        return applied_now
+
+    def __str__(self):
+        return self.dialect
+
+
+class MSSQLBackend(Backend):
+    dialect = "mssql"
+    schema_file = "create.sql"
+    migrations_table = """
+        IF OBJECT_ID('SchemaMigrations') IS NULL
+            CREATE TABLE SchemaMigrations (
+                Version VARCHAR(255) PRIMARY KEY,
+                Applied DATETIME DEFAULT GETDATE()
+            );
+    """
+
+    def __init__(self, server, database, user, password):
+        if pymssql is None:
+            raise RuntimeError("pymssql is required for the mssql backend")
+        self.server = server
+        self.database = database
+        self.user = user
+        self.password = password
+
+    @staticmethod
+    def from_env():
+        return MSSQLBackend(server=os.getenv("Server") + ".database.windows.net",
+                            database=os.getenv("DBName"),
+                            user=os.getenv("UserID"),
+                            password=os.getenv("Password"))
+
+    def connect(self):
+        return pymssql.connect(server=self.server, user=self.user, password=self.password, database=self.database)
+
+    def run_script(self, conn, script):
+        # pymssql sends one batch per execute(); GO separates batches like sqlcmd
+        cursor = conn.cursor()
+        for batch in re.split(r"^\s*GO\s*$", script, flags=re.MULTILINE | re.IGNORECASE):
+            if batch.strip():
+                cursor.execute(batch)
+
+    def __str__(self):
+        return f"mssql://{self.server}/{self.database}"
+
+
+_PARAM = re.compile(r"%[sd%]")
+_translated = {}
+
+
+def _translate(sql):
+    # pymssql uses %s / %d placeholders, sqlite3 uses qmark style
+    query = _translated.get(sql)
+    if query is None:
+        query = _PARAM.sub(lambda m: "%" if m.group(0) == "%%" else "?", sql)
+        _translated[sql] = query
+    return query
+
+
+def _params(params):
+    # pymssql accepts a bare scalar for a single parameter
+    if params is None:
+        return ()
+    if isinstance(params, (tuple, list, dict)):
+        return params
+    return (params,)
+
+
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(" "))
+sqlite3.register_converter("DATE", lambda b: datetime.date.fromisoformat(b.decode()))
+
+
+class SQLiteCursor:
+    # Gives a sqlite3 cursor the subset of the pymssql cursor API the
+    # scheduler relies on: %s placeholders, scalar parameters and as_dict rows.
+
+    def __init__(self, cursor, as_dict=False):
+        self._cursor = cursor
+        self.as_dict = as_dict
+
+    def execute(self, sql, params=None):
+        self._cursor.execute(_translate(sql), _params(params))
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._cursor.executemany(_translate(sql), [_params(p) for p in seq_of_params])
+        return self
+
+    def _row(self, row):
+        if row is None or not self.as_dict:
+            return row
+        return dict(zip((d[0] for d in self._cursor.description), row))
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size=None):
+        rows = self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+        return [self._row(r) for r in rows]
+
+    def fetchall(self):
+        return [self._row(r) for r in self._cursor.fetchall()]
+
+    def __iter__(self):
+        return (self._row(r) for r in self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+
+class SQLiteConnection:
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self, as_dict=False):
+        return SQLiteCursor(self._conn.cursor(), as_dict)
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def executescript(self, script):
+        self._conn.executescript(script)
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteBackend(Backend):
+    # Embedded backend for local, CI and benchmark runs. path=":memory:" gives a
+    # private in-memory database shared by every pooled connection of this
+    # backend; it lives as long as the backend object does.
+    dialect = "sqlite"
+    schema_file = "create_sqlite.sql"
+    migrations_table = """
+        CREATE TABLE IF NOT EXISTS SchemaMigrations (
+            Version VARCHAR(255) PRIMARY KEY,
+            Applied DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+    # Prepared statements each connection keeps, keyed by SQL text; every
+    # statement in db.Queries fits, so none is recompiled after its first use
+    STATEMENT_CACHE = 256
+
+    _memory_ids = itertools.count()
+
+    def __init__(self, path=":memory:", create_schema=True):
+        self.path = path
+        self._anchor = None
+        if path == ":memory:":
+            self._target = f"file:scheduler-{os.getpid()}-{next(self._memory_ids)}?mode=memory&cache=shared"
+            # in-memory databases vanish with their last connection
+            self._anchor = self.connect()
+        else:
+            self._target = "file:" + os.path.abspath(path)
+            conn = sqlite3.connect(self._target, uri=True)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.close()
+        if create_schema:
+            self.create_schema()
+            self.migrate()
+
+    def connect(self):
+        conn = sqlite3.connect(self._target, uri=True, timeout=30.0,
+                               detect_types=sqlite3.PARSE_DECLTYPES,
+                               isolation_level="IMMEDIATE",
+                               check_same_thread=False,
+                               cached_statements=self.STATEMENT_CACHE)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return SQLiteConnection(conn)
+
+    def run_script(self, conn, script):
+        conn.executescript(script)
+
+    def __str__(self):
+        return f"sqlite://{self.path}"
+
+
+def get_backend():
+    # DBBackend selects the engine: "mssql" (default, Azure SQL via the
+    # Server/DBName/UserID/Password variables) or "sqlite" (SQLitePath,
+    # defaulting to an in-memory database).
+    name = (os.getenv("DBBackend") or "mssql").lower()
+    if name == "mssql":
+        return MSSQLBackend.from_env()
+    if name == "sqlite":
+        return SQLiteBackend(os.getenv("SQLitePath") or ":memory:")
+    raise ValueError(f"Unknown DBBackend: {name}")
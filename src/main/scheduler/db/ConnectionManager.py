@@ -1,29 +1,220 @@
-import pymssql
 import os
+import threading
+import time
+from collections import deque
+from db.Backend import DB_ERRORS, get_backend
+from db.Instrumented import InstrumentedConnection
+from util.Stats import instrumentation
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ConnectionPool:
+    # A bounded, thread-safe pool of DB-API connections. `connect` is any
+    # zero-argument callable returning a new connection, so the pool can be
+    # exercised against a local stand-in backend as well as Azure SQL.
+
+    def __init__(self, connect, max_size=10, timeout=5.0, check_after=30.0, max_lifetime=1800.0):
+        if max_size <= 0:
+            raise ValueError("Pool size must be positive!")
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (conn, created_at, last_used_at)
+        self._in_use = {}  # id(conn) -> created_at
+        self._size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.recycled = 0
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            entry = None
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    if not waited:
+                        self.waits += 1
+                        waited = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(f"Timed out after {self.timeout}s waiting for a database connection")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    # LIFO keeps the most recently used connections warm
+                    entry = self._idle.pop()
+                else:
+                    self._size += 1
+
+            if entry is None:
+                return self._open()
+
+            conn, created_at, last_used_at = entry
+            now = time.monotonic()
+            if now - created_at > self.max_lifetime or \
+                    (now - last_used_at > self.check_after and not self._is_healthy(conn)):
+                self._discard(conn)
+                continue
+
+            with self._cond:
+                self.hits += 1
+                self._in_use[id(conn)] = created_at
+            return conn
+
+    def release(self, conn):
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+        if created_at is None:
+            return
+
+        # Never hand an open transaction to the next caller
+        try:
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+        for conn, _, _ in idle:
+            self._discard(conn, recycled=False)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "waits": self.waits,
+                "timeouts": self.timeouts,
+                "recycled": self.recycled,
+            }
+
+    def _open(self):
+        instrumentation.connection_opened()
+        try:
+            conn = self.connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.misses += 1
+            self._in_use[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn, recycled=True):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            if recycled:
+                self.recycled += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+
+def _env_number(name, default, cast):
+    value = os.getenv(name)
+    return cast(value) if value else default
 
 
 class ConnectionManager:
+    # Connections are checked out of a process-wide pool by create_connection()
+    # and returned to it by close_connection(), so callers keep the usual
+    # open/close pattern without paying for a new login each time. The pool
+    # sits on top of a db.Backend chosen by the DBBackend variable unless
+    # configure() is given one explicitly.
+
+    _backend = None
+    _pool = None
+    _pool_lock = threading.Lock()
 
     def __init__(self):
-        self.server_name = os.getenv("Server") + ".database.windows.net"
-        self.db_name = os.getenv("DBName")
-        self.user = os.getenv("UserID")
-        self.password = os.getenv("Password")
         self.conn = None
 
+    @classmethod
+    def configure(cls, backend=None, **options):
+        options.setdefault("max_size", _env_number("PoolSize", 10, int))
+        options.setdefault("timeout", _env_number("PoolTimeout", 5.0, float))
+        with cls._pool_lock:
+            if cls._pool is not None:
+                cls._pool.close()
+            cls._backend = backend if backend is not None else get_backend()
+            cls._pool = ConnectionPool(cls._backend.connect, **options)
+        return cls._pool
+
+    @classmethod
+    def get_pool(cls):
+        if cls._pool is None:
+            with cls._pool_lock:
+                if cls._pool is None:
+                    cls._backend = get_backend()
+                    cls._pool = ConnectionPool(cls._backend.connect,
+                                               max_size=_env_number("PoolSize", 10, int),
+                                               timeout=_env_number("PoolTimeout", 5.0, float))
+        return cls._pool
+
+    @classmethod
+    def get_backend(cls):
+        cls.get_pool()
+        return cls._backend
+
+    @property
+    def dialect(self):
+        return self.get_backend().dialect
+
     def create_connection(self):
         try:
-            self.conn = pymssql.connect(server=self.server_name, user=self.user, password=self.password, database=self.db_name)
-        except pymssql.Error as db_err:
+            with instrumentation.phase("connect"):
+                self.conn = self.get_pool().acquire()
+        except DB_ERRORS as db_err:
+            # reported here, handled by the caller; never take the process down
             print("Database Programming Error in SQL connection processing! ")
             print(db_err)
-            quit()
+            raise
+        if instrumentation.current() is not None:
+            self.conn = InstrumentedConnection(self.conn)
         return self.conn
 
     def close_connection(self):
-        try:
-            self.conn.close()
-        except pymssql.Error as db_err:
-            print("Database Programming Error in SQL connection processing! ")
-            print(db_err)
-            quit()
+        # Safe to call more than once; only the first call returns the connection
+        if self.conn is None:
+            return
+        conn, self.conn = self.conn, None
+        if isinstance(conn, InstrumentedConnection):
+            conn = conn.raw
+        self.get_pool().release(conn)
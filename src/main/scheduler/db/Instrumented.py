@@ -0,0 +1,67 @@
+from util.Stats import instrumentation
+
+
+class InstrumentedCursor:
+    # Charges execute/fetch time to the "query" phase of the running command
+    # and counts the rows it fetches
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=None):
+        with instrumentation.phase("query"):
+            if params is None:
+                self._cursor.execute(sql)
+            else:
+                self._cursor.execute(sql, params)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        with instrumentation.phase("query"):
+            self._cursor.executemany(sql, seq_of_params)
+        return self
+
+    def fetchone(self):
+        with instrumentation.phase("query"):
+            row = self._cursor.fetchone()
+        if row is not None:
+            instrumentation.add_rows(1)
+        return row
+
+    def fetchmany(self, size=None):
+        with instrumentation.phase("query"):
+            rows = self._cursor.fetchmany(size) if size else self._cursor.fetchmany()
+        instrumentation.add_rows(len(rows))
+        return rows
+
+    def fetchall(self):
+        with instrumentation.phase("query"):
+            rows = self._cursor.fetchall()
+        instrumentation.add_rows(len(rows))
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self.raw.cursor(*args, **kwargs))
+
+    def commit(self):
+        with instrumentation.phase("commit"):
+            self.raw.commit()
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
@@ -0,0 +1,16 @@
+# Brings the database selected by DBBackend up to date with
+# resources/migrations/<dialect>.
+#
+#   cd src/main/scheduler
+#   python -m db.Migrate
+from db.Backend import get_backend
+
+
+if __name__ == "__main__":
+    backend = get_backend()
+    applied = backend.migrate()
+    if applied:
+        for name in applied:
+            print(f"Applied {name}")
+    else:
+        print(f"{backend} is up to date.")
@@ -0,0 +1,659 @@
+import re
+import threading
+import time
+from db.ConnectionManager import ConnectionManager
+
+# Every SQL statement the scheduler sends, in one place. A Query knows its
+# text per dialect and the SQL type of each parameter. On Azure SQL it is
+# sent through sp_executesql with those types, so the server caches one plan
+# per statement instead of compiling each literal-filled variant; SQLite
+# connections keep a prepared statement per query text
+# (SQLiteBackend.STATEMENT_CACHE). Each execution is counted and timed per
+# query name; see stats() and report().
+
+_PLACEHOLDER = re.compile(r"%[sd%]")
+
+_stats = {}  # name -> [executions, seconds]
+_stats_lock = threading.Lock()
+
+
+class Query:
+
+    def __init__(self, name, sql, types=()):
+        # sql is a string or a {dialect: string} dict and may contain
+        # str.format fields filled in at execution time. types is a tuple with
+        # one SQL type per parameter, a single type shared by all of them, or
+        # None to send the text unchanged (e.g. stored procedure calls).
+        self.name = name
+        self.sql = sql
+        self.types = types
+        self._texts = {}  # (dialect, fields, types) -> text to execute
+
+    def execute(self, cursor, params=(), types=None, **fields):
+        text = self.text(ConnectionManager.get_backend().dialect, types, **fields)
+        started = time.perf_counter()
+        try:
+            return cursor.execute(text, params)
+        finally:
+            _record(self.name, 1, time.perf_counter() - started)
+
+    def executemany(self, cursor, seq_of_params, types=None, **fields):
+        seq_of_params = list(seq_of_params)
+        text = self.text(ConnectionManager.get_backend().dialect, types, **fields)
+        started = time.perf_counter()
+        try:
+            return cursor.executemany(text, seq_of_params)
+        finally:
+            _record(self.name, len(seq_of_params), time.perf_counter() - started)
+
+    def supports(self, dialect):
+        return not isinstance(self.sql, dict) or dialect in self.sql
+
+    def text(self, dialect, types=None, **fields):
+        types = self.types if types is None else types
+        key = (dialect, tuple(sorted(fields.items())), types)
+        text = self._texts.get(key)
+        if text is None:
+            sql = self.sql[dialect] if isinstance(self.sql, dict) else self.sql
+            if fields:
+                sql = sql.format(**fields)
+            text = _parameterize(sql, types) if dialect == "mssql" and types is not None else sql
+            self._texts[key] = text
+        return text
+
+
+def _parameterize(sql, types):
+    # "... WHERE a = %s AND b = %d" becomes
+    # "EXEC sp_executesql N'... WHERE a = @p1 AND b = @p2', N'@p1 <type>, @p2 <type>', %s, %d"
+    placeholders = [m.group(0) for m in _PLACEHOLDER.finditer(sql) if m.group(0) != "%%"]
+    if not placeholders:
+        return sql
+    if isinstance(types, str):
+        types = (types,) * len(placeholders)
+    if len(types) != len(placeholders):
+        raise ValueError(f"{len(placeholders)} parameters but {len(types)} types for: {sql.strip()}")
+
+    numbers = iter(range(1, len(placeholders) + 1))
+    body = _PLACEHOLDER.sub(lambda m: "%%" if m.group(0) == "%%" else f"@p{next(numbers)}", sql)
+    declarations = ", ".join(f"@p{i} {t}" for i, t in enumerate(types, start=1))
+    return (f"EXEC sp_executesql N'{body.strip().replace(chr(39), chr(39) * 2)}', "
+            f"N'{declarations}', {', '.join(placeholders)}")
+
+
+def _record(name, executions, seconds):
+    with _stats_lock:
+        entry = _stats.setdefault(name, [0, 0.0])
+        entry[0] += executions
+        entry[1] += seconds
+
+
+def stats():
+    # {query name: (executions, seconds)}
+    with _stats_lock:
+        return {name: tuple(entry) for name, entry in _stats.items()}
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def report(top=10):
+    # The queries with the most total execution time
+    rows = sorted(stats().items(), key=lambda item: item[1][1], reverse=True)[:top]
+    lines = [f"{'query':<36}{'executions':>12}{'total ms':>11}{'mean ms':>10}"]
+    for name, (executions, seconds) in rows:
+        lines.append(f"{name:<36}{executions:>12}{seconds * 1000:>11.1f}"
+                     f"{seconds * 1000 / max(executions, 1):>10.3f}")
+    return "\n".join(lines)
+
+
+USERNAME = "VARCHAR(255)"
+ACCOUNT_TABLES = {"patient": "Patients", "caregiver": "Caregivers"}
+
+
+# Paging clause that replaces {limit} after an ORDER BY. Offset and limit are
+# bound as two INT parameters (see page()), so every page size and offset
+# runs the same statement text and cached plan.
+PAGE = {"mssql": "OFFSET %d ROWS FETCH NEXT %d ROWS ONLY", "sqlite": "LIMIT %d, %d"}
+PAGE_TYPES = ("INT", "INT")
+NO_LIMIT = 2 ** 31 - 1
+
+
+def paged(sql):
+    # sql (a string or {dialect: string}) with {limit} filled in per dialect
+    if not isinstance(sql, dict):
+        sql = dict.fromkeys(PAGE, sql)
+    return {dialect: text.replace("{limit}", PAGE[dialect]) for dialect, text in sql.items()}
+
+
+def page(limit=None, offset=0):
+    # The parameters of a paged() query's clause, appended after the others
+    return int(offset), int(limit if limit is not None else NO_LIMIT)
+
+
+def _per_role(name, sql, types=()):
+    return {role: Query(f"{role}.{name}", sql.format(table=table), types)
+            for role, table in ACCOUNT_TABLES.items()}
+
+
+# Accounts
+
+ACCOUNT_EXISTS = _per_role("exists", "SELECT 1 WHERE EXISTS (SELECT 1 FROM {table} WHERE Username = %s)",
+                           (USERNAME,))
+
+ACCOUNT_CREDENTIALS = _per_role("credentials", "SELECT Salt, Hash, Kdf FROM {table} WHERE Username = %s",
+                                (USERNAME,))
+
+ACCOUNT_INSERT = _per_role("insert", "INSERT INTO {table} (Username, Salt, Hash, Kdf) VALUES (%s, %s, %s, %s)",
+                           (USERNAME, "BINARY(16)", "BINARY(16)", "VARCHAR(64)"))
+
+ACCOUNT_UPDATE_HASH = _per_role("update_hash", "UPDATE {table} SET Salt = %s, Hash = %s, Kdf = %s WHERE Username = %s",
+                                ("BINARY(16)", "BINARY(16)", "VARCHAR(64)", USERNAME))
+
+ACCOUNT_COUNT = _per_role("count", "SELECT COUNT(*) FROM {table}")
+
+ACCOUNT_USERNAMES = _per_role("usernames", "SELECT Username FROM {table}")
+
+# {{placeholders}} survives _per_role's format as {placeholders}
+ACCOUNT_USERNAMES_IN = _per_role("usernames_in", "SELECT Username FROM {table} WHERE Username IN ({{placeholders}})",
+                                 USERNAME)
+
+# Availabilities
+
+AVAILABILITY_EXISTING = Query("availability.existing", """
+    SELECT Time FROM Availabilities
+    WHERE Username = %s AND Time BETWEEN %s AND %s
+""", (USERNAME, "DATE", "DATE"))
+
+AVAILABILITY_INSERT = Query("availability.insert", """
+    INSERT INTO Availabilities (Time, Username, Start_Minute, Slot_Minutes, Slots, Open_Shard)
+    VALUES (%s, %s, %d, %d, %d, %d)
+""", ("DATE", USERNAME, "INT", "INT", "INT", "INT"))
+
+# Days between two dates with at least one open slot, from the per-day
+# counts that triggers on Availabilities maintain (migration 0008)
+OPEN_DAYS = Query("availability.open_days", """
+    SELECT Time, SUM(Open_Slots)
+    FROM OpenDays
+    WHERE Time BETWEEN %s AND %s
+    GROUP BY Time
+    HAVING SUM(Open_Slots) > 0
+    ORDER BY Time
+""", ("DATE", "DATE"))
+
+# Open windows of a date after a caregiver ("" for the first page)
+AVAILABILITY_OPEN = Query("availability.open", paged("""
+    SELECT Username, Start_Minute, Slot_Minutes, Slots, Booked
+    FROM Availabilities
+    WHERE Time = %s AND Reserved = 0 AND Username > %s
+    ORDER BY Username
+    {limit}
+"""), ("DATE", USERNAME) + PAGE_TYPES)
+
+# Vaccines and their dose lots (migration 0007). A lot is split over shard
+# rows; every query returning a lot row returns
+# (Vaccine_Name, Lot, Shard, Expires, Doses, Version).
+
+LOT = "VARCHAR(64)"
+
+VACCINE_INSERT = Query("vaccine.insert", "INSERT INTO Vaccines (Name) VALUES (%s)", (USERNAME,))
+
+# Every vaccine with its shards that are still good on a date (NULLs for a
+# vaccine without any), and its dose series (migration 0010)
+VACCINE_ALL = Query("vaccine.all", """
+    SELECT v.Name, l.Lot, l.Shard, l.Expires, l.Doses, l.Version, v.Series_Doses, v.Dose_Interval_Days
+    FROM Vaccines v
+    LEFT JOIN VaccineLots l
+        ON l.Vaccine_Name = v.Name AND (l.Expires IS NULL OR l.Expires >= %s)
+""", ("DATE",))
+
+VACCINE_SET_SERIES = Query("vaccine.set_series", """
+    UPDATE Vaccines SET Series_Doses = %d, Dose_Interval_Days = %d WHERE Name = %s;
+""", ("INT", "INT", USERNAME))
+
+# Adds delta doses to one shard and moves the lot's expiry date when one is
+# given; returns the new row, or none if the shard does not exist yet
+LOT_ADD_DOSES = Query("lot.add_doses", {
+    "mssql": """
+        UPDATE VaccineLots
+        SET Doses = Doses + %d, Version = Version + 1, Expires = COALESCE(%s, Expires)
+        OUTPUT INSERTED.Vaccine_Name, INSERTED.Lot, INSERTED.Shard, INSERTED.Expires, INSERTED.Doses,
+               INSERTED.Version
+        WHERE Vaccine_Name = %s AND Lot = %s AND Shard = %d;
+    """,
+    "sqlite": """
+        UPDATE VaccineLots
+        SET Doses = Doses + %d, Version = Version + 1, Expires = COALESCE(%s, Expires)
+        WHERE Vaccine_Name = %s AND Lot = %s AND Shard = %d
+        RETURNING Vaccine_Name, Lot, Shard, Expires, Doses, Version;
+    """,
+}, ("INT", "DATE", USERNAME, LOT, "INT"))
+
+# Moves the expiry of every shard of a lot; returns the changed rows
+LOT_SET_EXPIRES = Query("lot.set_expires", {
+    "mssql": """
+        UPDATE VaccineLots
+        SET Expires = %s, Version = Version + 1
+        OUTPUT INSERTED.Vaccine_Name, INSERTED.Lot, INSERTED.Shard, INSERTED.Expires, INSERTED.Doses,
+               INSERTED.Version
+        WHERE Vaccine_Name = %s AND Lot = %s AND (Expires IS NULL OR Expires <> %s);
+    """,
+    "sqlite": """
+        UPDATE VaccineLots
+        SET Expires = %s, Version = Version + 1
+        WHERE Vaccine_Name = %s AND Lot = %s AND (Expires IS NULL OR Expires <> %s)
+        RETURNING Vaccine_Name, Lot, Shard, Expires, Doses, Version;
+    """,
+}, ("DATE", USERNAME, LOT, "DATE"))
+
+LOT_INSERT = Query("lot.insert", """
+    INSERT INTO VaccineLots (Vaccine_Name, Lot, Shard, Expires, Doses, Version)
+    VALUES (%s, %s, %d, %s, %d, 0);
+""", (USERNAME, LOT, "INT", "DATE", "INT"))
+
+# Takes count doses from one shard if it has them; returns the new row
+LOT_TAKE_DOSES = Query("lot.take_doses", {
+    "mssql": """
+        UPDATE VaccineLots
+        SET Doses = Doses - %d, Version = Version + 1
+        OUTPUT INSERTED.Vaccine_Name, INSERTED.Lot, INSERTED.Shard, INSERTED.Expires, INSERTED.Doses,
+               INSERTED.Version
+        WHERE Vaccine_Name = %s AND Lot = %s AND Shard = %d AND Doses >= %d;
+    """,
+    "sqlite": """
+        UPDATE VaccineLots
+        SET Doses = Doses - %d, Version = Version + 1
+        WHERE Vaccine_Name = %s AND Lot = %s AND Shard = %d AND Doses >= %d
+        RETURNING Vaccine_Name, Lot, Shard, Expires, Doses, Version;
+    """,
+}, ("INT", USERNAME, LOT, "INT", "INT"))
+
+# Shards with stock that is still good on a date: earliest expiry first,
+# shards of a lot in random order so concurrent reservations spread out
+LOT_STOCKED = Query("lot.stocked", paged({
+    "mssql": """
+        SELECT Lot, Shard, Doses
+        FROM VaccineLots
+        WHERE Vaccine_Name = %s AND Doses > 0 AND (Expires IS NULL OR Expires >= %s)
+        ORDER BY CASE WHEN Expires IS NULL THEN 1 ELSE 0 END, Expires, NEWID()
+        {limit};
+    """,
+    "sqlite": """
+        SELECT Lot, Shard, Doses
+        FROM VaccineLots
+        WHERE Vaccine_Name = %s AND Doses > 0 AND (Expires IS NULL OR Expires >= %s)
+        ORDER BY CASE WHEN Expires IS NULL THEN 1 ELSE 0 END, Expires, RANDOM()
+        {limit};
+    """,
+}), (USERNAME, "DATE") + PAGE_TYPES)
+
+# Azure SQL takes a dose in one statement; READPAST skips shards other
+# reservations hold, so they never wait on each other for inventory
+LOT_CLAIM_DOSE = Query("lot.claim_dose", {
+    "mssql": """
+        WITH dose AS (
+            SELECT TOP (1) l.Vaccine_Name, l.Lot, l.Shard, l.Expires, l.Doses, l.Version
+            FROM VaccineLots l WITH (UPDLOCK, ROWLOCK, READPAST)
+            WHERE l.Vaccine_Name = %s AND l.Doses > 0 AND (l.Expires IS NULL OR l.Expires >= %s)
+            ORDER BY CASE WHEN l.Expires IS NULL THEN 1 ELSE 0 END, l.Expires, NEWID()
+        )
+        UPDATE dose
+        SET Doses = Doses - 1, Version = Version + 1
+        OUTPUT INSERTED.Vaccine_Name, INSERTED.Lot, INSERTED.Shard, INSERTED.Expires, INSERTED.Doses,
+               INSERTED.Version;
+    """,
+}, (USERNAME, "DATE"))
+
+LOT_HAS_STOCK = Query("lot.has_stock", """
+    SELECT 1 WHERE EXISTS (
+        SELECT 1 FROM VaccineLots
+        WHERE Vaccine_Name = %s AND Doses > 0 AND (Expires IS NULL OR Expires >= %s)
+    )
+""", (USERNAME, "DATE"))
+
+# Appointments
+
+# Azure SQL claims a slot in a single statement; UPDLOCK makes concurrent
+# claimers queue on the row instead of both reading it as free. Which open
+# slot is taken is up to the assignment strategy (model.Assignment).
+# Availabilities has a trigger (migration 0008), so OUTPUT needs an INTO.
+APPOINTMENT_CLAIM_SLOT = Query("appointment.claim_slot", {
+    "mssql": """
+        DECLARE @claimed TABLE (Username VARCHAR(255), Start_Minute INT, Slot_Minutes INT, Slots INT);
+        WITH slot AS (
+            SELECT TOP (1) a.Username, a.Reserved, a.Booked, a.Slots, a.Start_Minute, a.Slot_Minutes
+            FROM Availabilities a WITH ({hints})
+            WHERE a.Time = %s AND a.Reserved = 0
+            ORDER BY {order}
+        )
+        UPDATE slot
+        SET Booked = Booked + 1, Reserved = CASE WHEN Booked + 1 >= Slots THEN 1 ELSE 0 END
+        OUTPUT INSERTED.Username, INSERTED.Start_Minute, INSERTED.Slot_Minutes, INSERTED.Slots INTO @claimed;
+        SELECT Username, Start_Minute, Slot_Minutes, Slots FROM @claimed;
+    """,
+}, ("DATE",))
+
+APPOINTMENT_FIND_SLOT = Query("appointment.find_slot", paged("""
+    SELECT a.Username, a.Start_Minute, a.Slot_Minutes, a.Slots
+    FROM Availabilities a
+    WHERE a.Time = %s AND a.Reserved = 0
+    ORDER BY {order}
+    {limit};
+"""), ("DATE",) + PAGE_TYPES)
+
+APPOINTMENT_CLAIM_FOUND_SLOT = Query("appointment.claim_found_slot", """
+    UPDATE Availabilities
+    SET Booked = Booked + 1, Reserved = CASE WHEN Booked + 1 >= Slots THEN 1 ELSE 0 END
+    WHERE Time = %s AND Username = %s AND Reserved = 0;
+""", ("DATE", USERNAME))
+
+APPOINTMENT_USED_SLOTS = Query("appointment.used_slots", """
+    SELECT Slot_Minute
+    FROM Appointments
+    WHERE Date = %s AND Caregiver_Username = %s;
+""", ("DATE", USERNAME))
+
+APPOINTMENT_INSERT = Query("appointment.insert", {
+    "mssql": """
+        INSERT INTO Appointments (Patient_Username, Caregiver_Username, Vaccine_Name, Date, Slot_Minute,
+                                  Lot, Dose_Shard)
+        OUTPUT INSERTED.Appointment_ID
+        VALUES (%s, %s, %s, %s, %d, %s, %d);
+    """,
+    "sqlite": """
+        INSERT INTO Appointments (Patient_Username, Caregiver_Username, Vaccine_Name, Date, Slot_Minute,
+                                  Lot, Dose_Shard)
+        VALUES (%s, %s, %s, %s, %d, %s, %d);
+    """,
+}, (USERNAME, USERNAME, USERNAME, "DATE", "INT", LOT, "INT"))
+
+APPOINTMENT_DELETE = Query("appointment.delete", "DELETE FROM Appointments WHERE Appointment_ID = %d;", ("INT",))
+
+APPOINTMENT_RELEASE_SLOT = Query("appointment.release_slot", """
+    UPDATE Availabilities
+    SET Booked = Booked - 1, Reserved = 0
+    WHERE Time = %s AND Username = %s AND Booked > 0;
+""", ("DATE", USERNAME))
+
+# Server-side reserve() and cancel() (migration 0006), one round trip each
+APPOINTMENT_RESERVE_PROCEDURE = Query("appointment.reserve_procedure", {
+    "mssql": "EXEC dbo.ReserveAppointment %s, %s, %s, %s, %s;",
+}, None)
+
+APPOINTMENT_CANCEL_PROCEDURE = Query("appointment.cancel_procedure", {
+    "mssql": "EXEC dbo.CancelAppointment %d;",
+}, None)
+
+# Follow-ups left behind once CancelAppointment removed the first dose of
+# their series, in the BATCH_FIND columns
+APPOINTMENT_ORPHANED_FOLLOW_UPS = Query("appointment.orphaned_follow_ups", {
+    "mssql": """
+        SELECT f.Appointment_ID, f.Patient_Username, f.Caregiver_Username, f.Vaccine_Name, f.Date, f.Slot_Minute,
+               f.Lot, f.Dose_Shard, f.Dose_Number, f.Series_Start
+        FROM Appointments f WITH (UPDLOCK, ROWLOCK)
+        WHERE f.Patient_Username = %s AND f.Vaccine_Name = %s AND f.Series_Start = %s
+            AND NOT EXISTS (SELECT 1 FROM Appointments a
+                            WHERE a.Patient_Username = f.Patient_Username AND a.Vaccine_Name = f.Vaccine_Name
+                                AND a.Date = f.Series_Start AND a.Series_Start IS NULL);
+    """,
+}, (USERNAME, USERNAME, "DATE"))
+
+# show_appointments: one page of a user's appointments between two dates,
+# after an Appointment_ID, from the covering per-user index
+APPOINTMENT_LIST = {
+    role: Query(f"appointment.list_{role}", paged(f"""
+        SELECT Appointment_ID, Vaccine_Name, Date, {related}, Slot_Minute
+        FROM Appointments
+        WHERE {owner} = %s AND Appointment_ID > %d AND Date >= %s AND Date <= %s
+        ORDER BY Appointment_ID
+        {{limit}}
+    """), (USERNAME, "INT", "DATE", "DATE") + PAGE_TYPES)
+    for role, owner, related in (("patient", "Patient_Username", "Caregiver_Username"),
+                                 ("caregiver", "Caregiver_Username", "Patient_Username"))
+}
+
+# Group bookings (reserve_batch / cancel_batch): one statement per step for
+# the whole batch. {dates}, {names} and {ids} expand to one placeholder per
+# distinct value and {rows} to one VALUES row per item (see values()), so
+# these are typed at the call site. Azure SQL locks the rows read until
+# commit; every write is guarded on what was read, so on SQLite a lost race
+# shows up as a short rowcount.
+BATCH_OPEN_WINDOWS = Query("batch.open_windows", {
+    "mssql": """
+        SELECT a.Time, a.Username, a.Start_Minute, a.Slot_Minutes, a.Slots, a.Booked
+        FROM Availabilities a WITH (UPDLOCK, ROWLOCK)
+        WHERE a.Time IN ({dates}) AND a.Reserved = 0
+        ORDER BY a.Time, {order};
+    """,
+    "sqlite": """
+        SELECT a.Time, a.Username, a.Start_Minute, a.Slot_Minutes, a.Slots, a.Booked
+        FROM Availabilities a
+        WHERE a.Time IN ({dates}) AND a.Reserved = 0
+        ORDER BY a.Time, {order};
+    """,
+})
+
+BATCH_USED_SLOTS = Query("batch.used_slots", """
+    SELECT Date, Caregiver_Username, Slot_Minute
+    FROM Appointments
+    WHERE Date IN ({dates}) AND Caregiver_Username IN ({names});
+""")
+
+# rows: (Time, Username, slots taken, Booked as read)
+BATCH_BOOK_WINDOWS = Query("batch.book_windows", {
+    "mssql": """
+        UPDATE a
+        SET Booked = a.Booked + v.Take, Reserved = CASE WHEN a.Booked + v.Take >= a.Slots THEN 1 ELSE 0 END
+        FROM Availabilities a
+        JOIN (VALUES {rows}) AS v (Time, Username, Take, Booked)
+            ON a.Time = v.Time AND a.Username = v.Username AND a.Booked = v.Booked;
+    """,
+    "sqlite": """
+        UPDATE Availabilities
+        SET Booked = Booked + v.column3, Reserved = CASE WHEN Booked + v.column3 >= Slots THEN 1 ELSE 0 END
+        FROM (VALUES {rows}) AS v
+        WHERE Availabilities.Time = v.column1 AND Availabilities.Username = v.column2
+            AND Availabilities.Booked = v.column4;
+    """,
+})
+
+# rows: (Time, Username, slots freed)
+BATCH_RELEASE_WINDOWS = Query("batch.release_windows", {
+    "mssql": """
+        UPDATE a
+        SET Booked = a.Booked - v.Freed, Reserved = 0
+        FROM Availabilities a
+        JOIN (VALUES {rows}) AS v (Time, Username, Freed)
+            ON a.Time = v.Time AND a.Username = v.Username AND a.Booked >= v.Freed;
+    """,
+    "sqlite": """
+        UPDATE Availabilities
+        SET Booked = Booked - v.column3, Reserved = 0
+        FROM (VALUES {rows}) AS v
+        WHERE Availabilities.Time = v.column1 AND Availabilities.Username = v.column2
+            AND Availabilities.Booked >= v.column3;
+    """,
+})
+
+# Shards of the named vaccines with stock still good on the first date,
+# earliest expiry first
+BATCH_STOCKED = Query("batch.stocked", {
+    "mssql": """
+        SELECT Vaccine_Name, Lot, Shard, Expires, Doses, Version
+        FROM VaccineLots WITH (UPDLOCK, ROWLOCK)
+        WHERE Vaccine_Name IN ({names}) AND Doses > 0 AND (Expires IS NULL OR Expires >= %s)
+        ORDER BY CASE WHEN Expires IS NULL THEN 1 ELSE 0 END, Expires, Lot, Shard;
+    """,
+    "sqlite": """
+        SELECT Vaccine_Name, Lot, Shard, Expires, Doses, Version
+        FROM VaccineLots
+        WHERE Vaccine_Name IN ({names}) AND Doses > 0 AND (Expires IS NULL OR Expires >= %s)
+        ORDER BY CASE WHEN Expires IS NULL THEN 1 ELSE 0 END, Expires, Lot, Shard;
+    """,
+})
+
+# rows: (Vaccine_Name, Lot, Shard, doses taken, Version as read)
+BATCH_TAKE_DOSES = Query("batch.take_doses", {
+    "mssql": """
+        UPDATE l
+        SET Doses = l.Doses - v.Take, Version = l.Version + 1
+        FROM VaccineLots l
+        JOIN (VALUES {rows}) AS v (Vaccine_Name, Lot, Shard, Take, Version)
+            ON l.Vaccine_Name = v.Vaccine_Name AND l.Lot = v.Lot AND l.Shard = v.Shard
+            AND l.Version = v.Version AND l.Doses >= v.Take;
+    """,
+    "sqlite": """
+        UPDATE VaccineLots
+        SET Doses = Doses - v.column4, Version = Version + 1
+        FROM (VALUES {rows}) AS v
+        WHERE VaccineLots.Vaccine_Name = v.column1 AND VaccineLots.Lot = v.column2
+            AND VaccineLots.Shard = v.column3 AND VaccineLots.Version = v.column5
+            AND VaccineLots.Doses >= v.column4;
+    """,
+})
+
+BATCH_INSERT = Query("batch.insert", {
+    "mssql": """
+        INSERT INTO Appointments (Patient_Username, Caregiver_Username, Vaccine_Name, Date, Slot_Minute,
+                                  Lot, Dose_Shard, Dose_Number, Series_Start)
+        OUTPUT INSERTED.Appointment_ID, INSERTED.Date, INSERTED.Caregiver_Username, INSERTED.Slot_Minute
+        VALUES {rows};
+    """,
+    "sqlite": """
+        INSERT INTO Appointments (Patient_Username, Caregiver_Username, Vaccine_Name, Date, Slot_Minute,
+                                  Lot, Dose_Shard, Dose_Number, Series_Start)
+        VALUES {rows}
+        RETURNING Appointment_ID, Date, Caregiver_Username, Slot_Minute;
+    """,
+})
+
+# The listed appointments, then the follow-ups of every listed first dose
+# (same patient and vaccine, Series_Start on its date); the ids are bound
+# twice and a follow-up that is listed too comes back twice
+BATCH_FIND = Query("batch.find", {
+    "mssql": """
+        SELECT Appointment_ID, Patient_Username, Caregiver_Username, Vaccine_Name, Date, Slot_Minute, Lot,
+               Dose_Shard, Dose_Number, Series_Start
+        FROM Appointments WITH (UPDLOCK, ROWLOCK)
+        WHERE Appointment_ID IN ({ids})
+        UNION ALL
+        SELECT f.Appointment_ID, f.Patient_Username, f.Caregiver_Username, f.Vaccine_Name, f.Date, f.Slot_Minute,
+               f.Lot, f.Dose_Shard, f.Dose_Number, f.Series_Start
+        FROM Appointments a
+        JOIN Appointments f WITH (UPDLOCK, ROWLOCK)
+            ON f.Patient_Username = a.Patient_Username AND f.Vaccine_Name = a.Vaccine_Name
+                AND f.Series_Start = a.Date
+        WHERE a.Appointment_ID IN ({ids}) AND a.Series_Start IS NULL;
+    """,
+    "sqlite": """
+        SELECT Appointment_ID, Patient_Username, Caregiver_Username, Vaccine_Name, Date, Slot_Minute, Lot,
+               Dose_Shard, Dose_Number, Series_Start
+        FROM Appointments
+        WHERE Appointment_ID IN ({ids})
+        UNION ALL
+        SELECT f.Appointment_ID, f.Patient_Username, f.Caregiver_Username, f.Vaccine_Name, f.Date, f.Slot_Minute,
+               f.Lot, f.Dose_Shard, f.Dose_Number, f.Series_Start
+        FROM Appointments a
+        JOIN Appointments f
+            ON f.Patient_Username = a.Patient_Username AND f.Vaccine_Name = a.Vaccine_Name
+                AND f.Series_Start = a.Date
+        WHERE a.Appointment_ID IN ({ids}) AND a.Series_Start IS NULL;
+    """,
+}, "INT")
+
+# plan_follow_ups: one page, in Appointment_ID order, of first doses of
+# multi-dose vaccines on dates in a range that have no follow-ups booked
+APPOINTMENT_SERIES_MISSING = Query("appointment.series_missing", paged("""
+    SELECT a.Appointment_ID, a.Patient_Username, a.Vaccine_Name, a.Date, v.Series_Doses, v.Dose_Interval_Days
+    FROM Appointments a
+    JOIN Vaccines v ON v.Name = a.Vaccine_Name
+    WHERE a.Appointment_ID > %d AND a.Date BETWEEN %s AND %s AND a.Dose_Number = 1 AND v.Series_Doses > 1
+        AND NOT EXISTS (SELECT 1 FROM Appointments f
+                        WHERE f.Patient_Username = a.Patient_Username AND f.Vaccine_Name = a.Vaccine_Name
+                            AND f.Series_Start = a.Date)
+    ORDER BY a.Appointment_ID
+    {limit};
+"""), ("INT", "DATE", "DATE") + PAGE_TYPES)
+
+BATCH_DELETE = Query("batch.delete", "DELETE FROM Appointments WHERE Appointment_ID IN ({ids});", "INT")
+
+
+def values(types, count):
+    # {rows} text and parameter types for count VALUES rows of types
+    row = "(" + ", ".join("%d" if t == "INT" else "%s" for t in types) + ")"
+    return ", ".join([row] * count), tuple(types) * count
+
+
+def placeholders(count, mark="%s"):
+    return ", ".join([mark] * count)
+
+
+# Waitlist (migration 0009)
+WAITLIST_INSERT = Query("waitlist.insert", {
+    "mssql": """
+        INSERT INTO Waitlist (Patient_Username, Vaccine_Name, Date)
+        OUTPUT INSERTED.Waitlist_ID
+        VALUES (%s, %s, %s);
+    """,
+    "sqlite": """
+        INSERT INTO Waitlist (Patient_Username, Vaccine_Name, Date)
+        VALUES (%s, %s, %s);
+    """,
+}, (USERNAME, USERNAME, "DATE"))
+
+# Waiters to backfill, with their vaccine's series: from today on, on a date
+# in a range or for a vaccine.
+# An empty range or vaccine name matches nothing, so one statement serves
+# every caller.
+WAITLIST_NEXT = Query("waitlist.next", paged("""
+    SELECT w.Waitlist_ID, w.Patient_Username, w.Vaccine_Name, w.Date, v.Series_Doses, v.Dose_Interval_Days
+    FROM Waitlist w
+    JOIN Vaccines v ON v.Name = w.Vaccine_Name
+    WHERE w.Date >= %s AND (w.Date BETWEEN %s AND %s OR w.Vaccine_Name = %s)
+    ORDER BY {order}
+    {limit};
+"""), ("DATE", "DATE", "DATE", USERNAME) + PAGE_TYPES)
+
+WAITLIST_DELETE = Query("waitlist.delete", "DELETE FROM Waitlist WHERE Waitlist_ID = %d;", ("INT",))
+
+WAITLIST_LEAVE = Query("waitlist.leave", """
+    DELETE FROM Waitlist WHERE Waitlist_ID = %d AND Patient_Username = %s;
+""", ("INT", USERNAME))
+
+WAITLIST_PRIORITIZE = Query("waitlist.prioritize", """
+    UPDATE Waitlist SET Priority = %d WHERE Waitlist_ID = %d;
+""", ("INT", "INT"))
+
+# show_waitlist: a patient's own entries, or every upcoming one for caregivers
+WAITLIST_LIST = {
+    "patient": Query("waitlist.list_patient", """
+        SELECT Waitlist_ID, Patient_Username, Vaccine_Name, Date, Priority
+        FROM Waitlist
+        WHERE Patient_Username = %s AND Date >= %s
+        ORDER BY Date, {order};
+    """, (USERNAME, "DATE")),
+    "caregiver": Query("waitlist.list_caregiver", """
+        SELECT Waitlist_ID, Patient_Username, Vaccine_Name, Date, Priority
+        FROM Waitlist
+        WHERE Date >= %s
+        ORDER BY Date, {order};
+    """, ("DATE",)),
+}
+
+# Each backfilled booking runs under a savepoint so one that comes up short
+# is undone on its own. SQL Server has no RELEASE; its savepoints end with
+# the transaction.
+SAVEPOINT = Query("savepoint.set", {
+    "mssql": "SAVE TRANSACTION backfill;",
+    "sqlite": "SAVEPOINT backfill;",
+}, None)
+
+SAVEPOINT_ROLLBACK = Query("savepoint.rollback", {
+    "mssql": "ROLLBACK TRANSACTION backfill;",
+    "sqlite": "ROLLBACK TO backfill;",
+}, None)
+
+SAVEPOINT_RELEASE = Query("savepoint.release", {
+    "sqlite": "RELEASE backfill;",
+}, None)
@@ -0,0 +1,17 @@
+class Transaction:
+    # A cursor inside an open transaction, plus work to run once it commits
+    # (cache write-throughs and the like). Model methods that take a
+    # before_commit hook pass it one of these, so the hook's statements land
+    # in the same transaction.
+
+    def __init__(self, cursor, dialect):
+        self.cursor = cursor
+        self.dialect = dialect
+        self.callbacks = []
+
+    def after_commit(self, callback):
+        self.callbacks.append(callback)
+
+    def committed(self):
+        for callback in self.callbacks:
+            callback()
@@ -0,0 +1,793 @@
+import datetime
+import os
+import random
+import threading
+import time
+from collections import Counter
+from db.ConnectionManager import ConnectionManager
+from db import Queries
+from db.Backend import DB_ERRORS, is_transient, is_duplicate_key
+from db.Transaction import Transaction
+from model.Vaccine import Vaccine
+from model import Assignment
+from util.Util import Util
+
+
+class ReservationConflict(Exception):
+    pass
+
+
+class NoCaregiverAvailable(ValueError):
+    pass
+
+
+class NoDosesAvailable(ValueError):
+    pass
+
+
+class SeriesUnavailable(ValueError):
+    # The first dose could be booked but a follow-up of its series could not
+    pass
+
+
+class BatchFailed(ValueError):
+    # Nothing in the batch was changed; errors maps the index of each item
+    # that could not be processed to the reason
+
+    def __init__(self, errors, size):
+        super().__init__(f"{len(errors)} of {size} items failed, nothing was changed.")
+        self.errors = errors
+
+
+class Appointment:
+    # Reservation engine. A reservation claims a caregiver slot and a vaccine
+    # dose with conditional updates inside one transaction, so concurrent
+    # patients can never share a slot or drive Doses below zero. Lost races
+    # are retried with bounded, jittered exponential backoff.
+    #
+    # Doses come from the vaccine's lot shards (model.Vaccine); the dose taken
+    # is recorded on the appointment so cancel can return it.
+    #
+    # A caregiver's availability for a day is a window of equal slots. The
+    # claim increments the window's Booked counter (setting Reserved once it
+    # is full), which locks the row, so the earliest free slot time can then
+    # be picked without racing other reservations for the same window.
+    #
+    # Patients waiting for a date and vaccine (model.Waitlist) are booked by
+    # backfill() inside the transaction that added capacity: cancel() here,
+    # and upload_availability and add_doses through their before_commit hooks.
+    #
+    # A multi-dose vaccine (Vaccine.series) is booked a whole series at a
+    # time: the first dose and every follow-up, each the vaccine's interval
+    # after the one before, or none of them.
+
+    MAX_ATTEMPTS = 8
+    BACKOFF_BASE = 0.005
+    BACKOFF_CAP = 0.2
+    DOSE_CANDIDATES = 4
+
+    _stats = {"transactions": 0, "conflicts": 0, "transient_errors": 0}
+    _stats_lock = threading.Lock()
+
+    # Server-side versions of reserve() and cancel() (migration 0006), one
+    # round trip each. ReservationProcedures=0 falls back to the statements.
+    _PROCEDURES = {
+        "reserve": Queries.APPOINTMENT_RESERVE_PROCEDURE,
+        "cancel": Queries.APPOINTMENT_CANCEL_PROCEDURE,
+    }
+    USE_PROCEDURES = os.getenv("ReservationProcedures") != "0"
+
+    # Order waiting patients are booked in (WaitlistOrder): "fifo" by when
+    # they joined, or "priority", highest Priority first and FIFO among equals
+    WAITLIST_ORDERS = {"fifo": "Waitlist_ID", "priority": "Priority DESC, Waitlist_ID"}
+    WAITLIST_ORDER = os.getenv("WaitlistOrder") or "fifo"
+    BACKFILL_BATCH = 50
+
+    # Items per reserve_batch / cancel_batch, which keeps the set-based
+    # statements under Azure SQL's 2100 parameters
+    BATCH_MAX = 200
+    # First doses plan_follow_ups() reads per transaction
+    PLAN_CHUNK = 100
+
+    NO_CAREGIVER = "No Caregiver is available!"
+    NO_DOSES = "Not enough available doses!"
+
+    def __init__(self, appointment_id, patient_username, caregiver_username, vaccine_name, date, slot_minute=None,
+                 dose_number=1):
+        self.appointment_id = appointment_id
+        self.patient_username = patient_username
+        self.caregiver_username = caregiver_username
+        self.vaccine_name = vaccine_name
+        self.date = date
+        self.slot_minute = slot_minute
+        self.dose_number = dose_number
+        # the rest of the series, when this first dose was booked with it
+        self.follow_ups = []
+
+    # Getters
+    def get_appointment_id(self):
+        return self.appointment_id
+
+    def get_caregiver_username(self):
+        return self.caregiver_username
+
+    def get_slot_minute(self):
+        return self.slot_minute
+
+    @staticmethod
+    def reserve(patient_username, date, vaccine_name, strategy=None):
+        # Returns the booked Appointment. Raises ValueError when no caregiver or
+        # dose is left, ReservationConflict when every attempt lost a race.
+        # strategy defaults to Assignment.get_strategy().
+        strategy = strategy or Assignment.get_strategy()
+
+        def procedure(tx):
+            Queries.APPOINTMENT_RESERVE_PROCEDURE.execute(
+                tx.cursor, (patient_username, date, vaccine_name) + strategy.procedure_params())
+            status, appointment_id, caregiver_username, slot_minute, *vaccine_row = tx.cursor.fetchone()
+            if status == 1:
+                raise NoCaregiverAvailable(Appointment.NO_CAREGIVER)
+            if status == 2:
+                raise NoDosesAvailable(Appointment.NO_DOSES)
+            if status == 3:
+                raise ReservationConflict()
+            tx.after_commit(lambda: Vaccine.cache_store(*vaccine_row))
+            tx.after_commit(lambda: strategy.claimed(caregiver_username))
+            return Appointment(appointment_id, patient_username, caregiver_username, vaccine_name, date,
+                               slot_minute)
+
+        def statements(tx):
+            return Appointment._book_series(tx, strategy, patient_username, vaccine_name, date, vaccine_series)
+
+        # read before the transaction opens: a cache reload would check out a
+        # second pooled connection while tx holds its locks
+        vaccine_series = Vaccine.series(vaccine_name)
+        # the stored procedure books single doses only
+        if vaccine_series[0] > 1:
+            return Appointment._transaction(statements)
+        return Appointment._transaction(Appointment._choose("reserve", procedure, statements))
+
+    @staticmethod
+    def _book(tx, strategy, patient_username, vaccine_name, date):
+        # The statement flow of a reservation, inside tx. Cache updates are
+        # only queued once nothing can fail any more.
+        window = Appointment._claim_slot(tx.cursor, tx.dialect, date, strategy)
+        if window is None:
+            raise NoCaregiverAvailable(Appointment.NO_CAREGIVER)
+        caregiver_username = window[0]
+        slot_minute = Appointment._free_slot(tx.cursor, date, *window)
+
+        vaccine_row = Appointment._claim_dose(tx.cursor, tx.dialect, vaccine_name, date)
+        if vaccine_row is None:
+            raise NoDosesAvailable(Appointment.NO_DOSES)
+
+        appointment_id = Appointment._insert(tx.cursor, tx.dialect, patient_username, caregiver_username,
+                                             vaccine_name, date, slot_minute, vaccine_row[1], vaccine_row[2])
+        tx.after_commit(lambda: Vaccine.cache_store(*vaccine_row))
+        tx.after_commit(lambda: strategy.claimed(caregiver_username))
+        return Appointment(appointment_id, patient_username, caregiver_username, vaccine_name, date, slot_minute)
+
+    @staticmethod
+    def _book_series(tx, strategy, patient_username, vaccine_name, date, vaccine_series):
+        # _book() for any vaccine: a multi-dose vaccine's whole series goes
+        # through the batch statements. vaccine_series is the vaccine's
+        # (doses in the series, days between doses). Returns the first dose,
+        # with the follow-ups in its follow_ups.
+        if vaccine_series[0] == 1:
+            return Appointment._book(tx, strategy, patient_username, vaccine_name, date)
+
+        items, series, _ = Appointment._series_items([(patient_username, date, vaccine_name)],
+                                                     lambda _: vaccine_series)
+        try:
+            first, *follow_ups = Appointment._book_batch(tx, items, strategy, series)
+        except BatchFailed as e:
+            i = min(e.errors)
+            if i == 0 and e.errors[i] == Appointment.NO_CAREGIVER:
+                raise NoCaregiverAvailable(e.errors[i])
+            if i == 0 and e.errors[i] == Appointment.NO_DOSES:
+                raise NoDosesAvailable(e.errors[i])
+            raise SeriesUnavailable("Cannot book the series, "
+                                    + Appointment._dose_error(items[i], series[i], e.errors[i]))
+        first.follow_ups = follow_ups
+        return first
+
+    @staticmethod
+    def _series_items(items, series_of=None):
+        # Every dose of the series the (patient, date, vaccine) items start:
+        # (dose items, their (dose number, series start), index of the item
+        # each dose belongs to). A first dose has no series start. series_of
+        # maps a vaccine name to its series (default Vaccine.series).
+        series_of = series_of or Vaccine.series
+        doses, series, owner = [], [], []
+        for i, (patient_username, date, vaccine_name) in enumerate(items):
+            count, interval_days = series_of(vaccine_name)
+            for n in range(count):
+                doses.append((patient_username, date + datetime.timedelta(days=n * interval_days), vaccine_name))
+                series.append((n + 1, date if n else None))
+                owner.append(i)
+        return doses, series, owner
+
+    @staticmethod
+    def _dose_error(item, series, error):
+        return f"dose {series[0]} on {item[1].strftime('%m-%d-%Y')}: {error}"
+
+    @staticmethod
+    def cancel(appointment_id, backfilled=None):
+        # Returns the canceled Appointment, or None if it does not exist.
+        # Cancelling the first dose of a series cancels its follow-ups too;
+        # they are returned in its follow_ups. The freed slots and doses go
+        # to waiting patients in the same transaction; their appointments are
+        # added to the backfilled list, if given.
+        def procedure(tx):
+            Queries.APPOINTMENT_CANCEL_PROCEDURE.execute(tx.cursor, (appointment_id,))
+            status, patient_username, caregiver_username, vaccine_name, date, slot_minute, *vaccine_row = \
+                tx.cursor.fetchone()
+            if status != 0:
+                return None
+            if vaccine_row[0] is not None:
+                tx.after_commit(lambda: Vaccine.cache_store(*vaccine_row))
+            appointment = Appointment(appointment_id, patient_username, caregiver_username, vaccine_name, date,
+                                      slot_minute)
+            # the procedure cancels one dose; a first dose takes its follow-ups with it
+            Queries.APPOINTMENT_ORPHANED_FOLLOW_UPS.execute(tx.cursor, (patient_username, vaccine_name, date))
+            rows = [tuple(row) for row in tx.cursor.fetchall()]
+            if rows:
+                appointment.follow_ups = list(Appointment._cancel_rows(tx, rows).values())
+            Appointment._backfill_freed(tx, [appointment] + appointment.follow_ups, backfilled)
+            return appointment
+
+        def statements(tx):
+            Queries.BATCH_FIND.execute(tx.cursor, (appointment_id,) * 2, ids="%d")
+            rows = [tuple(row) for row in tx.cursor.fetchall()]
+            if not rows:
+                return None
+            if len(rows) > 1:
+                # a first dose and its follow-ups
+                canceled = Appointment._cancel_rows(tx, rows)
+                Appointment._backfill_freed(tx, list(canceled.values()), backfilled)
+                return canceled[appointment_id]
+            _, patient_username, caregiver_username, vaccine_name, date, slot_minute, lot, shard, dose_number, _ = \
+                rows[0]
+
+            Queries.APPOINTMENT_DELETE.execute(tx.cursor, (appointment_id,))
+            if tx.cursor.rowcount != 1:
+                # another session canceled it first; don't restore the slot twice
+                return None
+            Queries.APPOINTMENT_RELEASE_SLOT.execute(tx.cursor, (date, caregiver_username))
+            # the dose goes back to the lot shard it came from
+            if lot is None:
+                lot, shard = Vaccine.INITIAL_LOT, 0
+            vaccine_row = Vaccine.add_to_shard(tx.cursor, vaccine_name, lot, shard, None, 1)
+            tx.after_commit(lambda: Vaccine.cache_store(*vaccine_row))
+            appointment = Appointment(appointment_id, patient_username, caregiver_username, vaccine_name, date,
+                                      slot_minute, dose_number)
+            Appointment._backfill_freed(tx, [appointment], backfilled)
+            return appointment
+
+        return Appointment._transaction(Appointment._choose("cancel", procedure, statements))
+
+    @staticmethod
+    def _cancel_rows(tx, rows):
+        # Cancels the BATCH_FIND rows inside tx: one DELETE, one UPDATE of the
+        # freed windows and one dose return per lot shard. Returns the
+        # Appointments by ID; a follow-up whose first dose is among them is
+        # attached to its follow_ups as well.
+        ids = [row[0] for row in rows]
+        Queries.BATCH_DELETE.execute(tx.cursor, tuple(ids), ids=Queries.placeholders(len(ids), "%d"))
+        if tx.cursor.rowcount != len(ids):
+            raise ReservationConflict()  # another session canceled some of them first
+
+        freed = Counter((row[4], row[2]) for row in rows)
+        text, types = Queries.values(("DATE", Queries.USERNAME, "INT"), len(freed))
+        Queries.BATCH_RELEASE_WINDOWS.execute(
+            tx.cursor, tuple(v for (date, caregiver_username), count in freed.items()
+                             for v in (date, caregiver_username, count)), types, rows=text)
+
+        # doses go back to the lot shards they came from
+        returned = Counter((row[3], row[6], row[7]) if row[6] is not None else (row[3], Vaccine.INITIAL_LOT, 0)
+                           for row in rows)
+        for (vaccine_name, lot, shard), count in returned.items():
+            vaccine_row = Vaccine.add_to_shard(tx.cursor, vaccine_name, lot, shard, None, count)
+            tx.after_commit(lambda vaccine_row=vaccine_row: Vaccine.cache_store(*vaccine_row))
+
+        canceled, first_doses = {}, {}
+        for appointment_id, patient_username, caregiver_username, vaccine_name, date, slot_minute, _, _, \
+                dose_number, series_start in rows:
+            appointment = Appointment(appointment_id, patient_username, caregiver_username, vaccine_name, date,
+                                      slot_minute, dose_number)
+            canceled[appointment_id] = appointment
+            if series_start is None:
+                first_doses[(patient_username.lower(), vaccine_name.lower(), date)] = appointment
+        for appointment_id, patient_username, _, vaccine_name, _, _, _, _, _, series_start in rows:
+            first_dose = first_doses.get((patient_username.lower(), vaccine_name.lower(), series_start))
+            if first_dose is not None:
+                first_dose.follow_ups.append(canceled[appointment_id])
+        return canceled
+
+    @staticmethod
+    def _backfill_freed(tx, appointments, backfilled):
+        # Books waiting patients into the dates and vaccines the canceled
+        # appointments freed
+        booked = []
+        dates = sorted({appointment.date for appointment in appointments})
+        for vaccine_name in {a.vaccine_name.lower(): a.vaccine_name for a in appointments}.values():
+            booked += Appointment.backfill(tx, dates, vaccine_name)
+        if backfilled is not None:
+            tx.after_commit(lambda: backfilled.extend(booked))
+
+    @staticmethod
+    def reserve_batch(items, strategy=None):
+        # Books every (patient, date, vaccine) item in one transaction, or
+        # none of them: raises BatchFailed with the reason for each item that
+        # cannot be booked. Items of a multi-dose vaccine book the whole
+        # series, and every dose counts against BATCH_MAX. Returns the first
+        # doses in item order, with their follow-ups.
+        strategy = strategy or Assignment.get_strategy()
+        Appointment._check_batch(items)
+        doses, series, owner = Appointment._series_items(items)
+        if len(doses) > Appointment.BATCH_MAX:
+            raise ValueError(f"At most {Appointment.BATCH_MAX} doses per batch!")
+
+        def book(tx):
+            try:
+                booked = Appointment._book_batch(tx, doses, strategy, series)
+            except BatchFailed as e:
+                errors = {}
+                for i, error in sorted(e.errors.items()):
+                    errors.setdefault(owner[i], error if series[i][0] == 1
+                                      else Appointment._dose_error(doses[i], series[i], error))
+                raise BatchFailed(errors, len(items))
+            first_doses = []
+            for appointment in booked:
+                if appointment.dose_number == 1:
+                    first_doses.append(appointment)
+                else:
+                    first_doses[-1].follow_ups.append(appointment)
+            return first_doses
+
+        return Appointment._transaction(book)
+
+    @staticmethod
+    def cancel_batch(appointment_ids, backfilled=None):
+        # Cancels every appointment in one transaction, or none of them:
+        # raises BatchFailed for IDs that do not exist. A first dose takes its
+        # follow-ups with it, and freed slots and doses go to waiting patients,
+        # as in cancel(). Returns the canceled Appointments in the given order;
+        # follow-ups that were not listed are in their first dose's follow_ups.
+        Appointment._check_batch(appointment_ids)
+        ids = list(appointment_ids)
+        marks = Queries.placeholders(len(ids), "%d")
+
+        def work(tx):
+            Queries.BATCH_FIND.execute(tx.cursor, tuple(ids) * 2, ids=marks)
+            found = {row[0]: tuple(row) for row in tx.cursor.fetchall()}
+            errors = {i: "No such appointment exists." for i, appointment_id in enumerate(ids)
+                      if appointment_id not in found}
+            errors.update({i: "Listed more than once!" for i, appointment_id in enumerate(ids)
+                           if ids.index(appointment_id) != i})
+            if errors:
+                raise BatchFailed(errors, len(ids))
+
+            canceled = Appointment._cancel_rows(tx, list(found.values()))
+            Appointment._backfill_freed(tx, list(canceled.values()), backfilled)
+            # a listed follow-up is returned on its own, not again under its first dose
+            listed = set(ids)
+            for appointment in canceled.values():
+                appointment.follow_ups = [f for f in appointment.follow_ups if f.appointment_id not in listed]
+            return [canceled[appointment_id] for appointment_id in ids]
+
+        return Appointment._transaction(work)
+
+    @staticmethod
+    def _check_batch(items):
+        if not items:
+            raise ValueError("Nothing to do!")
+        if len(items) > Appointment.BATCH_MAX:
+            raise ValueError(f"At most {Appointment.BATCH_MAX} items per batch!")
+
+    @staticmethod
+    def _book_batch(tx, items, strategy, series=None):
+        # Set-based reserve(): the same handful of statements however many
+        # items there are. Raises BatchFailed if any item cannot be booked,
+        # else returns the Appointments in item order. series gives each
+        # item's (dose number, series start), default (1, None).
+        window_of, shard_of, errors = Appointment._allocate(items, *Appointment._read_capacity(tx, items, strategy))
+        if errors:
+            raise BatchFailed(errors, len(items))
+        booked = Appointment._write_batch(tx, items, window_of, shard_of, strategy, series)
+        return [booked[i] for i in range(len(items))]
+
+    @staticmethod
+    def _read_capacity(tx, items, strategy):
+        # Three reads for the items: the patients that exist, the open
+        # windows of their dates (per date, in the strategy's order) as
+        # (date, caregiver, start minute, slot minutes, slots, booked), and
+        # the stocked lot shards of their vaccines (per vaccine, earliest
+        # expiry first) as (vaccine, lot, shard, expires, doses, version).
+        cursor = tx.cursor
+        patients = list({patient_username.lower(): patient_username for patient_username, _, _ in items}.values())
+        Queries.ACCOUNT_USERNAMES_IN["patient"].execute(cursor, tuple(patients),
+                                                        placeholders=Queries.placeholders(len(patients)))
+        known = {row[0].lower() for row in cursor.fetchall()}
+
+        dates = sorted({date for _, date, _ in items})
+        order, params = strategy.order(tx.dialect)
+        Queries.BATCH_OPEN_WINDOWS.execute(cursor, tuple(dates) + params,
+                                           ("DATE",) * len(dates) + (Queries.USERNAME,) * len(params),
+                                           dates=Queries.placeholders(len(dates)), order=order)
+        windows = {}
+        for row in cursor.fetchall():
+            windows.setdefault(row[0], []).append(tuple(row))
+
+        names = list({vaccine_name.lower(): vaccine_name for _, _, vaccine_name in items}.values())
+        Queries.BATCH_STOCKED.execute(cursor, tuple(names) + (dates[0],),
+                                      (Queries.USERNAME,) * len(names) + ("DATE",),
+                                      names=Queries.placeholders(len(names)))
+        stock = {}
+        for row in cursor.fetchall():
+            stock.setdefault(row[0].lower(), []).append(tuple(row))
+        return known, windows, stock
+
+    @staticmethod
+    def _allocate(items, known, windows, stock, skip=()):
+        # Picks a window and a lot shard for every item not in skip, without
+        # touching the database. Windows are filled in order, each up to its
+        # last free slot, so a group lands with as few caregivers as
+        # possible; each dose comes from the earliest-expiring lot still good
+        # on its date. Returns (window_of, shard_of, errors), all keyed by
+        # item index.
+        errors, window_of, shard_of = {}, {}, {}
+        taken, drawn = Counter(), Counter()
+        for i, (patient_username, date, _) in enumerate(items):
+            if i in skip:
+                continue
+            if patient_username.lower() not in known:
+                errors[i] = "No such patient!"
+                continue
+            window = next((w for w in windows.get(date, ()) if w[5] + taken[w] < w[4]), None)
+            if window is None:
+                errors[i] = Appointment.NO_CAREGIVER
+                continue
+            taken[window] += 1
+            window_of[i] = window
+
+        for i in sorted(window_of, key=lambda i: items[i][1]):
+            _, date, vaccine_name = items[i]
+            shard = next((s for s in stock.get(vaccine_name.lower(), ())
+                          if drawn[s] < s[4] and (s[3] is None or s[3] >= date)), None)
+            if shard is None:
+                errors[i] = Appointment.NO_DOSES
+                continue
+            drawn[shard] += 1
+            shard_of[i] = shard
+        for i in errors:
+            window_of.pop(i, None)
+        return window_of, shard_of, errors
+
+    @staticmethod
+    def _write_batch(tx, items, window_of, shard_of, strategy, series=None):
+        # Books the allocated items (the keys of window_of): one read of the
+        # slot times in use if needed, one guarded UPDATE for the windows and
+        # one for the shards, one multi-row INSERT. Returns the Appointments
+        # by item index.
+        cursor = tx.cursor
+        indexes = sorted(window_of)
+        taken = Counter(window_of[i] for i in indexes)
+        drawn = Counter(shard_of[i] for i in indexes)
+
+        # Slot times: only windows that already had bookings can have holes
+        used = set()
+        busy = [w for w in taken if w[5]]
+        if busy:
+            busy_dates = sorted({w[0] for w in busy})
+            busy_names = list({w[1].lower(): w[1] for w in busy}.values())
+            Queries.BATCH_USED_SLOTS.execute(cursor, tuple(busy_dates) + tuple(busy_names),
+                                             ("DATE",) * len(busy_dates) + (Queries.USERNAME,) * len(busy_names),
+                                             dates=Queries.placeholders(len(busy_dates)),
+                                             names=Queries.placeholders(len(busy_names)))
+            used = {(date, caregiver_username.lower(), minute) for date, caregiver_username, minute in cursor}
+        minute_of = {}
+        for i in indexes:
+            date, caregiver_username, start_minute, slot_minutes, slots, _ = window_of[i]
+            minute = next((m for m in range(start_minute, start_minute + slots * slot_minutes, slot_minutes)
+                           if (date, caregiver_username.lower(), m) not in used), None)
+            if minute is None:
+                raise ReservationConflict()  # Booked disagreed with the appointments
+            used.add((date, caregiver_username.lower(), minute))
+            minute_of[i] = minute
+
+        text, types = Queries.values(("DATE", Queries.USERNAME, "INT", "INT"), len(taken))
+        Queries.BATCH_BOOK_WINDOWS.execute(cursor, tuple(v for w, count in taken.items()
+                                                         for v in (w[0], w[1], count, w[5])), types, rows=text)
+        if cursor.rowcount != len(taken):
+            raise ReservationConflict()
+
+        text, types = Queries.values((Queries.USERNAME, Queries.LOT, "INT", "INT", "INT"), len(drawn))
+        Queries.BATCH_TAKE_DOSES.execute(cursor, tuple(v for s, count in drawn.items()
+                                                       for v in (s[0], s[1], s[2], count, s[5])), types, rows=text)
+        if cursor.rowcount != len(drawn):
+            raise ReservationConflict()
+
+        series = series or [(1, None)] * len(items)
+        text, types = Queries.values((Queries.USERNAME, Queries.USERNAME, Queries.USERNAME, "DATE", "INT",
+                                      Queries.LOT, "INT", "INT", "DATE"), len(indexes))
+        try:
+            Queries.BATCH_INSERT.execute(cursor, tuple(v for i in indexes
+                                                       for v in (items[i][0], window_of[i][1], items[i][2],
+                                                                 items[i][1], minute_of[i], shard_of[i][1],
+                                                                 shard_of[i][2]) + series[i]),
+                                         types, rows=text)
+        except DB_ERRORS as e:
+            # UX_Appointments_Series: a follow-up of this series is booked
+            if is_duplicate_key(e):
+                raise SeriesUnavailable("This series is already booked!")
+            raise
+        ids = {(date, caregiver_username.lower(), minute): appointment_id
+               for appointment_id, date, caregiver_username, minute in cursor.fetchall()}
+
+        for s, count in drawn.items():
+            vaccine_row = (s[0], s[1], s[2], s[3], s[4] - count, s[5] + 1)
+            tx.after_commit(lambda vaccine_row=vaccine_row: Vaccine.cache_store(*vaccine_row))
+        for w in taken:
+            tx.after_commit(lambda caregiver_username=w[1]: strategy.claimed(caregiver_username))
+        return {i: Appointment(ids[(items[i][1], window_of[i][1].lower(), minute_of[i])], items[i][0],
+                               window_of[i][1], items[i][2], items[i][1], minute_of[i], series[i][0])
+                for i in indexes}
+
+    @staticmethod
+    def plan_follow_ups(first_date, last_date, strategy=None):
+        # Bulk follow-up booking: the missing follow-ups of every series
+        # whose first dose is between the dates, for first doses booked
+        # before their vaccine had a series. Works through them in
+        # Appointment_ID order, one transaction per chunk, each read,
+        # allocated and written with the batch statements. A patient's
+        # follow-ups are booked together or not at all. Returns (booked
+        # follow-ups, [(first dose Appointment_ID, reason)] for the rest).
+        strategy = strategy or Assignment.get_strategy()
+        booked, skipped = [], []
+        after = 0
+        while True:
+            after, chunk_booked, chunk_skipped, more = Appointment._transaction(
+                lambda tx, after=after: Appointment._plan_chunk(tx, after, first_date, last_date, strategy))
+            booked += chunk_booked
+            skipped += chunk_skipped
+            if not more:
+                return booked, skipped
+
+    @staticmethod
+    def _plan_chunk(tx, after, first_date, last_date, strategy):
+        # Returns (last first dose handled, booked, skipped, more to do)
+        Queries.APPOINTMENT_SERIES_MISSING.execute(tx.cursor, (after, first_date, last_date)
+                                                   + Queries.page(Appointment.PLAN_CHUNK))
+        rows = tx.cursor.fetchall()
+        more = len(rows) == Appointment.PLAN_CHUNK
+
+        items, series, first_of = [], [], []
+        for appointment_id, patient_username, vaccine_name, date, doses, interval_days in rows:
+            if len(items) + doses - 1 > Appointment.BATCH_MAX:
+                more = True  # the rest go in the next chunk
+                break
+            for n in range(1, doses):
+                items.append((patient_username, date + datetime.timedelta(days=n * interval_days), vaccine_name))
+                series.append((n + 1, date))
+                first_of.append(appointment_id)
+            after = appointment_id
+        if not items:
+            return after, [], [], more
+
+        # drop every patient with a follow-up that does not fit, then
+        # allocate the rest again
+        capacity = Appointment._read_capacity(tx, items, strategy)
+        skip, reasons = set(), {}
+        while True:
+            window_of, shard_of, errors = Appointment._allocate(items, *capacity, skip=skip)
+            if not errors:
+                break
+            for i, error in sorted(errors.items()):
+                reasons.setdefault(first_of[i], Appointment._dose_error(items[i], series[i], error))
+            skip |= {i for i, first in enumerate(first_of) if first in reasons}
+
+        try:
+            booked = Appointment._write_batch(tx, items, window_of, shard_of, strategy, series) if window_of else {}
+        except SeriesUnavailable:
+            raise ReservationConflict()  # another planner booked some of them first; read again
+        return after, [booked[i] for i in sorted(booked)], sorted(reasons.items()), more
+
+    @staticmethod
+    def backfill(tx, dates=(), vaccine_name=None, strategy=None):
+        # Books waiting patients for any of dates, or for vaccine_name, inside
+        # tx, until their date has no open slot or their vaccine no dose left
+        # for it. Each booking runs under a savepoint, so one that comes up
+        # short is undone on its own and the patient keeps their place; a lost
+        # race stops the backfill and leaves the rest for the next change.
+        # Waiters left in place stay ahead in the queue, so each page starts
+        # after them instead of at the head. Each waiter's series comes with
+        # their row rather than from the vaccine cache, which may need a
+        # reload. Returns the booked Appointments.
+        strategy = strategy or Assignment.get_strategy()
+        first, last = (min(dates), max(dates)) if dates else (datetime.date.max, datetime.date.min)
+        order = Appointment.waitlist_order()
+        booked = []
+        full_dates, empty = set(), set()  # what ran out: dates, (vaccine, date)
+        skipped = 0  # waiters left in place ahead of the next page
+        while True:
+            Queries.WAITLIST_NEXT.execute(tx.cursor, (datetime.date.today(), first, last, vaccine_name or "")
+                                          + Queries.page(Appointment.BACKFILL_BATCH, skipped), order=order)
+            rows = tx.cursor.fetchall()
+            for waitlist_id, patient_username, waiting_vaccine, date, series_doses, interval_days in rows:
+                if date in full_dates or (waiting_vaccine.lower(), date) in empty:
+                    skipped += 1
+                    continue
+                Queries.SAVEPOINT.execute(tx.cursor)
+                # taking the row first keeps a concurrent backfill from
+                # booking the same patient
+                Queries.WAITLIST_DELETE.execute(tx.cursor, (waitlist_id,))
+                try:
+                    if tx.cursor.rowcount == 1:
+                        booked.append(Appointment._book_series(tx, strategy, patient_username, waiting_vaccine,
+                                                               date, (series_doses, interval_days)))
+                except NoCaregiverAvailable:
+                    Queries.SAVEPOINT_ROLLBACK.execute(tx.cursor)
+                    full_dates.add(date)
+                    skipped += 1
+                except NoDosesAvailable:
+                    Queries.SAVEPOINT_ROLLBACK.execute(tx.cursor)
+                    empty.add((waiting_vaccine.lower(), date))
+                    skipped += 1
+                except SeriesUnavailable:
+                    Queries.SAVEPOINT_ROLLBACK.execute(tx.cursor)
+                    skipped += 1
+                except ReservationConflict:
+                    Queries.SAVEPOINT_ROLLBACK.execute(tx.cursor)
+                    Appointment._release_savepoint(tx)
+                    return booked
+                Appointment._release_savepoint(tx)
+            if len(rows) < Appointment.BACKFILL_BATCH or (dates and not vaccine_name and full_dates >= set(dates)):
+                return booked
+
+    @staticmethod
+    def waitlist_order():
+        if Appointment.WAITLIST_ORDER not in Appointment.WAITLIST_ORDERS:
+            raise ValueError(f"Unknown waitlist order: {Appointment.WAITLIST_ORDER}")
+        return Appointment.WAITLIST_ORDERS[Appointment.WAITLIST_ORDER]
+
+    @staticmethod
+    def _release_savepoint(tx):
+        if Queries.SAVEPOINT_RELEASE.supports(tx.dialect):
+            Queries.SAVEPOINT_RELEASE.execute(tx.cursor)
+
+    @staticmethod
+    def _choose(name, procedure, statements):
+        dialect = ConnectionManager.get_backend().dialect
+        if Appointment.USE_PROCEDURES and Appointment._PROCEDURES[name].supports(dialect):
+            return procedure
+        return statements
+
+    @staticmethod
+    def _insert(cursor, dialect, patient_username, caregiver_username, vaccine_name, date, slot_minute, lot,
+                shard):
+        Queries.APPOINTMENT_INSERT.execute(cursor, (patient_username, caregiver_username, vaccine_name, date,
+                                                    slot_minute, lot, shard))
+        if dialect == "mssql":
+            return cursor.fetchone()[0]
+        return cursor.lastrowid
+
+    @staticmethod
+    def _transaction(work):
+        # Runs work(tx) in one transaction and commits it. Lost races
+        # (ReservationConflict) and transient database errors roll back and
+        # retry with backoff; any other exception rolls back and propagates.
+        for attempt in range(Appointment.MAX_ATTEMPTS):
+            cm = ConnectionManager()
+            conn = cm.create_connection()
+            tx = Transaction(conn.cursor(), cm.dialect)
+            try:
+                result = work(tx)
+                conn.commit()
+                tx.committed()
+                Appointment._count("transactions")
+                return result
+            except ReservationConflict:
+                conn.rollback()
+                Appointment._count("conflicts")
+            except DB_ERRORS as e:
+                conn.rollback()
+                if not is_transient(e):
+                    raise
+                Appointment._count("transient_errors")
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cm.close_connection()
+            Appointment._backoff(attempt)
+        raise ReservationConflict("Too many concurrent reservations, please try again!")
+
+    @staticmethod
+    def _claim_slot(cursor, dialect, date, strategy):
+        # Takes one slot from an open window on date. Returns the window as
+        # (caregiver, start minute, slot minutes, slots), or None if every
+        # window is full.
+        order, params = strategy.order(dialect)
+        types = ("DATE",) + (Queries.USERNAME,) * len(params)
+        if Queries.APPOINTMENT_CLAIM_SLOT.supports(dialect):
+            Queries.APPOINTMENT_CLAIM_SLOT.execute(cursor, (date,) + params, types,
+                                                   hints=strategy.lock_hints, order=order)
+            row = cursor.fetchone()
+            return tuple(row) if row else None
+
+        # Portable path: pick candidates, then claim the first that is still free
+        Queries.APPOINTMENT_FIND_SLOT.execute(cursor, (date,) + params + Queries.page(strategy.candidates),
+                                              types + Queries.PAGE_TYPES, order=order)
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        for row in rows:
+            Queries.APPOINTMENT_CLAIM_FOUND_SLOT.execute(cursor, (date, row[0]))
+            if cursor.rowcount == 1:
+                return tuple(row)
+        raise ReservationConflict()
+
+    @staticmethod
+    def _claim_dose(cursor, dialect, vaccine_name, date):
+        # Takes one dose that is still good on date from a shard of the
+        # vaccine's lots. Returns the shard row after the change, or None if
+        # there is no such dose.
+        if Queries.LOT_CLAIM_DOSE.supports(dialect):
+            Queries.LOT_CLAIM_DOSE.execute(cursor, (vaccine_name, date))
+            row = cursor.fetchone()
+            if row:
+                return tuple(row)
+            # READPAST skipped shards that other reservations hold
+            Queries.LOT_HAS_STOCK.execute(cursor, (vaccine_name, date))
+            if cursor.fetchone():
+                raise ReservationConflict()
+            return None
+
+        # Portable path: pick candidate shards, then take from the first that
+        # still has stock
+        Queries.LOT_STOCKED.execute(cursor, (vaccine_name, date) + Queries.page(Appointment.DOSE_CANDIDATES))
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        for lot, shard, _ in rows:
+            Queries.LOT_TAKE_DOSES.execute(cursor, (1, vaccine_name, lot, shard, 1))
+            row = cursor.fetchone()
+            if row:
+                return tuple(row)
+        raise ReservationConflict()
+
+    @staticmethod
+    def _free_slot(cursor, date, caregiver_username, start_minute, slot_minutes, slots):
+        # Earliest slot start in the window without an appointment. Only
+        # called once the window's Booked counter has been claimed.
+        Queries.APPOINTMENT_USED_SLOTS.execute(cursor, (date, caregiver_username))
+        used = {row[0] for row in cursor.fetchall()}
+        for minute in range(start_minute, start_minute + slots * slot_minutes, slot_minutes):
+            if minute not in used:
+                return minute
+        # Booked disagreed with the appointments; let the retry look again
+        raise ReservationConflict()
+
+    @staticmethod
+    def retry_stats():
+        # Committed transactions and the retries (lost races, transient
+        # errors) it took to get them through
+        with Appointment._stats_lock:
+            return dict(Appointment._stats)
+
+    @staticmethod
+    def _count(name):
+        with Appointment._stats_lock:
+            Appointment._stats[name] += 1
+
+    @staticmethod
+    def _backoff(attempt):
+        delay = min(Appointment.BACKOFF_CAP, Appointment.BACKOFF_BASE * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+
+    def __str__(self):
+        text = f"Appointment ID: {self.appointment_id}, Caregiver username: {self.caregiver_username}"
+        if self.slot_minute is not None:
+            text += f", Time: {Util.format_time_of_day(self.slot_minute)}"
+        return text
@@ -0,0 +1,118 @@
+import os
+import threading
+
+
+class AssignmentStrategy:
+    # Decides which open caregiver slot reserve() claims. A strategy only
+    # supplies the ORDER BY for the open slots of a date (over Availabilities
+    # aliased as "a"); Appointment._claim_slot runs the claim itself.
+    name = None
+    # Table hints for the single-statement Azure SQL claim
+    lock_hints = "UPDLOCK, ROWLOCK"
+    # How many candidates the portable path tries before treating the attempt
+    # as a lost race
+    candidates = 1
+
+    def order(self, dialect):
+        # Returns (ORDER BY expression, params)
+        raise NotImplementedError
+
+    def claimed(self, caregiver_username):
+        pass
+
+    def procedure_params(self):
+        # (@Strategy, @After) for dbo.ReserveAppointment
+        return self.name, ""
+
+    def __str__(self):
+        return self.name
+
+
+class FirstAvailable(AssignmentStrategy):
+    # Alphabetically first open caregiver. Deterministic, but every booking
+    # for a date lands on the same rows, so concurrent reservations queue up
+    # behind each other.
+    name = "first"
+
+    def order(self, dialect):
+        return "a.Username", ()
+
+
+class LeastLoaded(AssignmentStrategy):
+    # Caregiver with the fewest appointments overall, which evens out the work
+    # between caregivers. The count is served by IX_Appointments_Caregiver.
+    name = "least_loaded"
+    candidates = 4
+
+    def order(self, dialect):
+        return """(SELECT COUNT(*) FROM Appointments ap
+                   WHERE ap.Caregiver_Username = a.Username), a.Username""", ()
+
+
+class RoundRobin(AssignmentStrategy):
+    # The next open caregiver after the one this process assigned last,
+    # wrapping around to the start of the alphabet.
+    name = "round_robin"
+    candidates = 4
+
+    def __init__(self):
+        self._last = ""
+        self._lock = threading.Lock()
+
+    def order(self, dialect):
+        with self._lock:
+            last = self._last
+        return "CASE WHEN a.Username > %s THEN 0 ELSE 1 END, a.Username", (last,)
+
+    def claimed(self, caregiver_username):
+        with self._lock:
+            self._last = caregiver_username
+
+    def procedure_params(self):
+        with self._lock:
+            return self.name, self._last
+
+
+class RandomSkipLocked(AssignmentStrategy):
+    # A random open caregiver. On Azure SQL, READPAST skips slots another
+    # transaction is claiming instead of waiting for it; SQLite has no row
+    # locks, so the portable path falls through to the next candidate when
+    # a claim loses the race.
+    name = "random"
+    lock_hints = "UPDLOCK, ROWLOCK, READPAST"
+    candidates = 4
+
+    _RANDOM = {"mssql": "NEWID()", "sqlite": "RANDOM()"}
+
+    def order(self, dialect):
+        return RandomSkipLocked._RANDOM[dialect], ()
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (FirstAvailable, LeastLoaded, RoundRobin, RandomSkipLocked)}
+
+_current = None
+_current_lock = threading.Lock()
+
+
+def get_strategy():
+    # CaregiverAssignment selects the strategy (default "first")
+    global _current
+    if _current is None:
+        with _current_lock:
+            if _current is None:
+                _current = create(os.getenv("CaregiverAssignment") or "first")
+    return _current
+
+
+def configure(name):
+    global _current
+    strategy = create(name)
+    with _current_lock:
+        _current = strategy
+    return strategy
+
+
+def create(name):
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown caregiver assignment strategy: {name}")
+    return STRATEGIES[name]()
@@ -1,88 +1,92 @@
 import sys
+import time
+import zlib
 sys.path.append("../util/*")
 sys.path.append("../db/*")
 from util.Util import Util
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db import Queries
+from db.Backend import DB_ERRORS, is_duplicate_key
+from db.Transaction import Transaction
+from model.Usernames import Usernames
 
 
 class Caregiver:
-    def __init__(self, username, password=None, salt=None, hash=None):
+    # Each availability row adds its open slots to one of OPEN_DAY_SHARDS
+    # per-day counters (OpenDays, migration 0008), picked from the username
+    OPEN_DAY_SHARDS = 8
+
+    def __init__(self, username, password=None, salt=None, hash=None, kdf=None):
         self.username = username
         self.password = password
         self.salt = salt
         self.hash = hash
+        self.kdf = kdf
 
     @staticmethod
     def create_caregiver(username, password):
         # Generate a salt and hash for the password
-        salt = Util.generate_salt()
-        hash = Util.generate_hash(password, salt)
+        salt, hash, kdf = Util.hash_password(password)
 
         # Create the Caregiver object
-        caregiver = Caregiver(username, salt=salt, hash=hash)
+        caregiver = Caregiver(username, salt=salt, hash=hash, kdf=kdf)
 
         # Save to the database
         try:
             caregiver.save_to_db()
-        except pymssql.Error as e:
+            Usernames.added("caregiver", username)
+        except DB_ERRORS as e:
+            if is_duplicate_key(e):
+                raise ValueError("Username taken, try again!")
             print("Error occurred while creating caregiver.")
             raise e
 
+    # create_caregiver() for many (username, password) accounts in one
+    # transaction, hashing on the KdfPool in parallel. Returns the usernames
+    # that were taken.
+    @staticmethod
+    def create_caregivers(accounts):
+        credentials = Util.hash_passwords([password for _, password in accounts])
+        return Usernames.create_accounts("caregiver", [(username,) + credential for (username, _), credential
+                                                       in zip(accounts, credentials)])
+
     # Method to authenticate caregiver login
     @staticmethod
     def login_caregiver(username, password):
-        cm = ConnectionManager()
-        conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
-
-        get_caregiver_details = "SELECT Salt, Hash FROM Caregivers WHERE Username = %s"
         try:
-            cursor.execute(get_caregiver_details, username)
-            result = cursor.fetchone()
-
-            if not result:
-                # Username does not exist
-                return False
-
-            stored_salt = result['Salt']
-            stored_hash = result['Hash']
-            calculated_hash = Util.generate_hash(password, stored_salt)
-
-            # Compare calculated hash with stored hash
-            return calculated_hash == stored_hash
-        except pymssql.Error as e:
+            return Caregiver(username, password).get() is not None
+        except DB_ERRORS as e:
             print("Database error occurred:", e)
             return False
-        finally:
-            cm.close_connection()
 
-    # Get caregiver object
+    # Get caregiver object, or None if the password does not match
     def get(self):
+        # the lookup returns its connection before the KDF runs
+        row = Usernames.credentials("caregiver", self.username)
+        if row is None or not Util.verify_password(self.password, *row):
+            return None
+        self.salt, self.hash, self.kdf = row
+        if Util.needs_rehash(self.kdf):
+            try:
+                self.update_password_hash()
+            except DB_ERRORS:
+                pass  # the old hash still works; try again next login
+        return self
+
+    # Re-hash the password with the current KDF parameters
+    def update_password_hash(self):
+        salt, hash, kdf = Util.hash_password(self.password)
+
         cm = ConnectionManager()
         conn = cm.create_connection()
-        cursor = conn.cursor(as_dict=True)
+        cursor = conn.cursor()
 
-        get_caregiver_details = "SELECT Salt, Hash FROM Caregivers WHERE Username = %s"
         try:
-            cursor.execute(get_caregiver_details, self.username)
-            for row in cursor:
-                curr_salt = row['Salt']
-                curr_hash = row['Hash']
-                calculated_hash = Util.generate_hash(self.password, curr_salt)
-                if not curr_hash == calculated_hash:
-                    cm.close_connection()
-                    return None
-                else:
-                    self.salt = curr_salt
-                    self.hash = calculated_hash
-                    cm.close_connection()
-                    return self
-        except pymssql.Error as e:
-            raise e
+            Queries.ACCOUNT_UPDATE_HASH["caregiver"].execute(cursor, (salt, hash, kdf, self.username))
+            conn.commit()
+            self.salt, self.hash, self.kdf = salt, hash, kdf
         finally:
             cm.close_connection()
-        return None
 
     # Getters
     def get_username(self):
@@ -100,26 +104,76 @@ class Caregiver:
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        add_caregivers = "INSERT INTO Caregivers VALUES (%s, %s, %s)"
         try:
-            cursor.execute(add_caregivers, (self.username, self.salt, self.hash))
+            Queries.ACCOUNT_INSERT["caregiver"].execute(cursor, (self.username, self.salt, self.hash, self.kdf))
             conn.commit()
-        except pymssql.Error:
+        except DB_ERRORS:
             raise
         finally:
             cm.close_connection()
 
+    @staticmethod
+    def open_day_shard(username):
+        return zlib.crc32(username.lower().encode()) % Caregiver.OPEN_DAY_SHARDS
+
     # Insert availability with parameter date d
     def upload_availability(self, d):
+        inserted, duplicates, _ = self.upload_availabilities([d])
+        return len(inserted) == 1
+
+    # Insert many availability dates in one transaction. Dates this caregiver
+    # already has are skipped rather than failing the batch; a date another
+    # session inserts between the read and the inserts starts the upload over,
+    # so it is reported as a duplicate too. Each date gets
+    # `slots` slots of slot_minutes each, the first at start_minute (minutes
+    # after midnight); the default is one 09:00-17:00 slot. Returns
+    # (inserted dates, duplicate dates, [(batch size, seconds), ...]).
+    # before_commit, if given, is called with the Transaction before it
+    # commits when any date was inserted.
+    def upload_availabilities(self, dates, batch_size=500, start_minute=540, slot_minutes=480, slots=1,
+                              before_commit=None):
+        if slots <= 0 or slot_minutes <= 0 or start_minute < 0:
+            raise ValueError("Slot count and length must be positive!")
+        if start_minute + slots * slot_minutes > 24 * 60:
+            raise ValueError("Slots must end by midnight!")
+        dates = sorted(set(dates))
+        if not dates:
+            return [], [], []
+
         cm = ConnectionManager()
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        add_availability = "INSERT INTO Availabilities VALUES (%s , %s)"
+        shard = Caregiver.open_day_shard(self.username)
         try:
-            cursor.execute(add_availability, (d, self.username))
-            conn.commit()
-        except pymssql.Error:
+            # every retry finds at least one more existing date, so this ends
+            while True:
+                timings = []
+                Queries.AVAILABILITY_EXISTING.execute(cursor, (self.username, dates[0], dates[-1]))
+                existing = {row[0] for row in cursor.fetchall()}
+                duplicates = [d for d in dates if d in existing]
+                new_dates = [d for d in dates if d not in existing]
+
+                try:
+                    for i in range(0, len(new_dates), batch_size):
+                        batch = new_dates[i:i + batch_size]
+                        started = time.perf_counter()
+                        Queries.AVAILABILITY_INSERT.executemany(
+                            cursor, [(d, self.username, start_minute, slot_minutes, slots, shard) for d in batch])
+                        timings.append((len(batch), time.perf_counter() - started))
+                except DB_ERRORS as e:
+                    if not is_duplicate_key(e):
+                        raise
+                    conn.rollback()
+                    continue
+                tx = Transaction(cursor, cm.dialect)
+                if new_dates and before_commit is not None:
+                    before_commit(tx)
+                conn.commit()
+                tx.committed()
+                return new_dates, duplicates, timings
+        except Exception:
+            conn.rollback()
             raise
         finally:
             cm.close_connection()
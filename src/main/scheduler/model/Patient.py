@@ -1,62 +1,78 @@
-from scheduler.db.ConnectionManager import ConnectionManager
-import hashlib, os
-import pymssql
+from db.ConnectionManager import ConnectionManager
+from db import Queries
+from util.Util import Util
+from db.Backend import DB_ERRORS, is_duplicate_key
+from model.Usernames import Usernames
 
 class Patient:
-    def __init__(self, username, salt=None, hash_value=None):
+    def __init__(self, username, salt=None, hash_value=None, kdf=None):
         self.username = username
         self.salt = salt
         self.hash = hash_value
+        self.kdf = kdf
 
     @staticmethod
     def create_patient(username, password):
         # Generate a salt and hash for the password
-        salt = os.urandom(16)
-        hash_value = hashlib.pbkdf2_hmac(
-            'sha256', password.encode('utf-8'), salt, 100000, dklen=16
-        )
+        salt, hash_value, kdf = Util.hash_password(password)
 
         cm = ConnectionManager()
         conn = cm.create_connection()
         cursor = conn.cursor()
 
         try:
-            insert_patient = """
-                INSERT INTO Patients (Username, Salt, Hash) VALUES (%s, %s, %s)
-            """
-            cursor.execute(insert_patient, (username, salt, hash_value))
+            Queries.ACCOUNT_INSERT["patient"].execute(cursor, (username, salt, hash_value, kdf))
             conn.commit()
-            return True  # Just return True/False, don't print
-        except pymssql.Error as e:
-            if "PRIMARY KEY" in str(e):
-                return False
-            return False
+            Usernames.added("patient", username)
+        except DB_ERRORS as e:
+            if is_duplicate_key(e):
+                raise ValueError("Username taken, try again!")
+            raise
         finally:
             cm.close_connection()
 
+    @staticmethod
+    def create_patients(accounts):
+        # create_patient() for many (username, password) accounts in one
+        # transaction, hashing on the KdfPool in parallel. Returns the
+        # usernames that were taken.
+        credentials = Util.hash_passwords([password for _, password in accounts])
+        return Usernames.create_accounts("patient", [(username,) + credential for (username, _), credential
+                                                     in zip(accounts, credentials)])
+
     @staticmethod
     def login_patient(username, password):
+        try:
+            # the lookup returns its connection before the KDF runs
+            result = Usernames.credentials("patient", username)
+        except DB_ERRORS:
+            return False
+
+        if not result:
+            return False
+
+        salt, stored_hash, kdf = result
+        if not Util.verify_password(password, salt, stored_hash, kdf):
+            return False
+
+        if Util.needs_rehash(kdf):
+            try:
+                Patient.update_password_hash(username, password)
+            except DB_ERRORS:
+                pass  # the old hash still works; try again next login
+        return True
+
+    # Re-hash the password with the current KDF parameters
+    @staticmethod
+    def update_password_hash(username, password):
+        salt, hash_value, kdf = Util.hash_password(password)
+
         cm = ConnectionManager()
         conn = cm.create_connection()
         cursor = conn.cursor()
 
         try:
-            get_user = """
-                SELECT Salt, Hash FROM Patients WHERE Username = %s
-            """
-            cursor.execute(get_user, username)
-            result = cursor.fetchone()
-
-            if not result:
-                return False
-
-            salt, stored_hash = result
-            input_hash = hashlib.pbkdf2_hmac(
-                'sha256', password.encode('utf-8'), salt, 100000, dklen=16
-            )
-
-            return input_hash == stored_hash
-        except pymssql.Error:
-            return False
+            Queries.ACCOUNT_UPDATE_HASH["patient"].execute(cursor, (salt, hash_value, kdf, username))
+            conn.commit()
         finally:
             cm.close_connection()
@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+from db.ConnectionManager import ConnectionManager
+from db import Queries
+from db.Backend import DB_ERRORS, is_duplicate_key, stream_rows
+from util.BloomFilter import BloomFilter
+
+
+class Usernames:
+    # Username existence and credential lookups for both roles. exists() is a
+    # keys-only EXISTS probe answered from the primary key index.
+    #
+    # Signup paths can also consult a per-role Bloom filter of every username
+    # (UsernameFilterTTL > 0 enables it and sets how many seconds a loaded
+    # filter is trusted). A filter miss means the name was free when the
+    # filter was loaded, so the probe is skipped; names taken since then by
+    # another process are still caught by the INSERT's duplicate key error.
+    TABLES = Queries.ACCOUNT_TABLES
+    FILTER_TTL = float(os.getenv("UsernameFilterTTL") or 0)
+    FILTER_ERROR_RATE = 0.01
+    # Names per IN list probe, well under Azure SQL's 2100 parameters
+    PROBE_CHUNK = 1000
+
+    _filters = {}  # role -> (BloomFilter, loaded_at)
+    _lock = threading.Lock()
+    _stats = {"probes": 0, "filter_skips": 0, "filter_loads": 0}
+
+    @staticmethod
+    def exists(role, username, use_filter=False):
+        # DB errors propagate so the caller can report them
+        if use_filter and Usernames.FILTER_TTL > 0:
+            if not Usernames._filter(role).might_contain(username.lower()):
+                Usernames._count("filter_skips")
+                return False
+
+        Usernames._count("probes")
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        try:
+            cursor = conn.cursor()
+            Queries.ACCOUNT_EXISTS[role].execute(cursor, (username,))
+            return cursor.fetchone() is not None
+        finally:
+            cm.close_connection()
+
+    @staticmethod
+    def existing(role, usernames):
+        # The lowercased usernames among usernames that are taken, probed
+        # PROBE_CHUNK names at a time
+        taken = set()
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        try:
+            cursor = conn.cursor()
+            for i in range(0, len(usernames), Usernames.PROBE_CHUNK):
+                chunk = tuple(usernames[i:i + Usernames.PROBE_CHUNK])
+                Queries.ACCOUNT_USERNAMES_IN[role].execute(cursor, chunk,
+                                                           placeholders=Queries.placeholders(len(chunk)))
+                taken.update(row[0].lower() for row in cursor.fetchall())
+        finally:
+            cm.close_connection()
+        return taken
+
+    @staticmethod
+    def credentials(role, username):
+        # (salt, hash, kdf) for username, or None if there is no such account
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        try:
+            cursor = conn.cursor()
+            Queries.ACCOUNT_CREDENTIALS[role].execute(cursor, (username,))
+            row = cursor.fetchone()
+            return tuple(row) if row else None
+        finally:
+            cm.close_connection()
+
+    @staticmethod
+    def create_accounts(role, accounts):
+        # Inserts (username, salt, hash, kdf) accounts in one transaction.
+        # Returns the usernames that were taken; the rest are created.
+        if not accounts:
+            return []
+        insert = Queries.ACCOUNT_INSERT[role]
+        taken = []
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+        try:
+            try:
+                insert.executemany(cursor, accounts)
+                conn.commit()
+            except DB_ERRORS as e:
+                conn.rollback()
+                if not is_duplicate_key(e):
+                    raise
+                # someone took one of the names; insert one by one to find out which
+                for account in accounts:
+                    try:
+                        insert.execute(cursor, account)
+                    except DB_ERRORS as e:
+                        if not is_duplicate_key(e):
+                            raise
+                        taken.append(account[0])
+                conn.commit()
+        finally:
+            cm.close_connection()
+        for username, _, _, _ in accounts:
+            Usernames.added(role, username)
+        return taken
+
+    @staticmethod
+    def added(role, username):
+        # Keeps a loaded filter current with accounts created by this process
+        with Usernames._lock:
+            entry = Usernames._filters.get(role)
+            if entry is not None:
+                entry[0].add(username.lower())
+
+    @staticmethod
+    def invalidate():
+        with Usernames._lock:
+            Usernames._filters.clear()
+
+    @staticmethod
+    def stats():
+        with Usernames._lock:
+            return dict(Usernames._stats)
+
+    @staticmethod
+    def _count(name):
+        with Usernames._lock:
+            Usernames._stats[name] += 1
+
+    @staticmethod
+    def _filter(role):
+        with Usernames._lock:
+            entry = Usernames._filters.get(role)
+            if entry is not None and time.monotonic() - entry[1] < Usernames.FILTER_TTL:
+                return entry[0]
+
+        loaded_at = time.monotonic()
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        try:
+            cursor = conn.cursor()
+            Queries.ACCOUNT_COUNT[role].execute(cursor)
+            # room to grow before the error rate climbs
+            bloom = BloomFilter(cursor.fetchone()[0] * 2 + 1000, Usernames.FILTER_ERROR_RATE)
+            Queries.ACCOUNT_USERNAMES[role].execute(cursor)
+            for (username,) in stream_rows(cursor, 5000):
+                bloom.add(username.lower())
+        finally:
+            cm.close_connection()
+
+        with Usernames._lock:
+            Usernames._filters[role] = (bloom, loaded_at)
+            Usernames._stats["filter_loads"] += 1
+        return bloom
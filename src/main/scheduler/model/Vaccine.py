@@ -1,32 +1,114 @@
 import sys
 sys.path.append("../db/*")
+import datetime
+import os
+import threading
+import time
 from db.ConnectionManager import ConnectionManager
-import pymssql
+from db import Queries
+from db.Backend import DB_ERRORS
+from db.Transaction import Transaction
 
 
 class Vaccine:
+    # A vaccine's doses live in VaccineLots: one row per (lot, shard). Doses
+    # added to a lot are spread over SHARDS shard rows (DoseShards, default 8)
+    # and a reservation takes its dose from any shard with stock, so bookings
+    # of the same vaccine don't all update one row. Lots may expire; expired
+    # stock is not counted or booked.
+    #
+    # Reads are served from a process-wide cache of lot shard rows plus a
+    # running total per vaccine, so available doses are an O(1) lookup no
+    # matter how many lots and shards there are. Every write bumps the shard's
+    # Version and writes the new row through to the cache; a cached row is
+    # only replaced by one with a version at least as new, and the total moves
+    # by the difference. Everything is reloaded once VaccineCacheTTL seconds
+    # have passed, which bounds how stale another scheduler process's writes
+    # (and lots expiring at midnight) can look. A name missing from a fresh
+    # cache is unknown until then, so lookups of a bad name stay O(1) too.
+    CACHE_TTL = float(os.getenv("VaccineCacheTTL") or 5.0)
+    SHARDS = int(os.getenv("DoseShards") or 8)
+    DEFAULT_LOT = "default"
+    # Lot of the stock migrated from Vaccines.Doses, where doses of
+    # appointments booked before migration 0007 go back on cancel
+    INITIAL_LOT = "initial"
+    # Longest dose series set_series() accepts (migration 0010)
+    MAX_SERIES_DOSES = 10
+
+    _cache = {}  # name.lower() -> (name, doses)
+    _lots = {}  # (name.lower(), lot.lower(), shard) -> (name, lot, shard, expires, doses, version)
+    _series = {}  # name.lower() -> (doses in the series, days between doses)
+    _cache_loaded_at = None
+    _cache_lock = threading.Lock()
+    _cache_stats = {"hits": 0, "misses": 0, "refreshes": 0, "write_throughs": 0}
+
     def __init__(self, vaccine_name, available_doses):
         self.vaccine_name = vaccine_name
         self.available_doses = available_doses
 
     # getters
     def get(self):
+        row = Vaccine._cached(self.vaccine_name)
+        if row is None:
+            return None
+        self.available_doses = row[1]
+        return self
+
+    @staticmethod
+    def get_all():
+        # Every vaccine, by name, from the cache
+        Vaccine._cached(None)
+        with Vaccine._cache_lock:
+            rows = sorted(Vaccine._cache.values(), key=lambda r: r[0].lower())
+        return [Vaccine(name, doses) for name, doses in rows]
+
+    @staticmethod
+    def last_good_date(vaccine_name):
+        # Last date a dose of the vaccine can be booked for: datetime.date.max
+        # if a lot with stock never expires, None if there is no stock at all
+        if Vaccine._cached(vaccine_name) is None:
+            return None
+        last = None
+        with Vaccine._cache_lock:
+            for name, lot, shard, expires, doses, version in Vaccine._lots.values():
+                if name.lower() == vaccine_name.lower() and doses > 0:
+                    last = max(last or datetime.date.min, expires or datetime.date.max)
+        return last
+
+    @staticmethod
+    def series(vaccine_name):
+        # (doses in the series, days between doses); (1, 0) for a single-dose
+        # or unknown vaccine
+        if Vaccine._cached(vaccine_name) is None:
+            return 1, 0
+        with Vaccine._cache_lock:
+            return Vaccine._series.get(vaccine_name.lower(), (1, 0))
+
+    @staticmethod
+    def set_series(vaccine_name, doses, interval_days):
+        if doses < 1 or doses > Vaccine.MAX_SERIES_DOSES:
+            raise ValueError(f"A series has 1 to {Vaccine.MAX_SERIES_DOSES} doses!")
+        if doses == 1:
+            interval_days = 0
+        elif interval_days < 1:
+            raise ValueError("Doses of a series must be at least a day apart!")
+
         cm = ConnectionManager()
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        get_vaccine = "SELECT Name, Doses FROM Vaccines WHERE Name = %s"
         try:
-            cursor.execute(get_vaccine, self.vaccine_name)
-            for row in cursor:
-                self.available_doses = row[1]
-                return self
-        except pymssql.Error:
-            # print("Error occurred when getting Vaccine")
+            Queries.VACCINE_SET_SERIES.execute(cursor, (doses, interval_days, vaccine_name))
+            if cursor.rowcount != 1:
+                raise ValueError("No such vaccine!")
+            conn.commit()
+            with Vaccine._cache_lock:
+                Vaccine._series[vaccine_name.lower()] = (doses, interval_days)
+        except Exception:
+            conn.rollback()
             raise
         finally:
             cm.close_connection()
-        return None
 
     def get_vaccine_name(self):
         return self.vaccine_name
@@ -34,7 +116,7 @@ class Vaccine:
     def get_available_doses(self):
         return self.available_doses
 
-    def save_to_db(self):
+    def save_to_db(self, lot=DEFAULT_LOT, expires=None):
         if self.available_doses is None or self.available_doses <= 0:
             raise ValueError("Argument cannot be negative!")
 
@@ -42,58 +124,194 @@ class Vaccine:
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        add_doses = "INSERT INTO VACCINES VALUES (%s, %d)"
         try:
-            cursor.execute(add_doses, (self.vaccine_name, self.available_doses))
+            Queries.VACCINE_INSERT.execute(cursor, (self.vaccine_name,))
+            rows = Vaccine.add_to_lot(cursor, self.vaccine_name, lot, expires, self.available_doses)
             # you must call commit() to persist your data if you don't set autocommit to True
             conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when insert Vaccines")
+            Vaccine._cache_vaccine(self.vaccine_name)
+            for row in rows:
+                Vaccine.cache_store(*row)
+        except DB_ERRORS:
+            conn.rollback()
             raise
         finally:
             cm.close_connection()
 
-    # Increment the available doses
-    def increase_available_doses(self, num):
+    # Increment the available doses, in lot (created if new). before_commit,
+    # if given, is called with the Transaction before it commits.
+    def increase_available_doses(self, num, lot=DEFAULT_LOT, expires=None, before_commit=None):
         if num <= 0:
             raise ValueError("Argument cannot be negative!")
-        self.available_doses += num
 
         cm = ConnectionManager()
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        update_vaccine_availability = "UPDATE vaccines SET Doses = %d WHERE name = %s"
         try:
-            cursor.execute(update_vaccine_availability, (self.available_doses, self.vaccine_name))
-            # you must call commit() to persist your data if you don't set autocommit to True
+            tx = Transaction(cursor, cm.dialect)
+            for row in Vaccine.add_to_lot(cursor, self.vaccine_name, lot, expires, num):
+                tx.after_commit(lambda row=row: Vaccine.cache_store(*row))
+            if before_commit is not None:
+                before_commit(tx)
             conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when updating vaccine availability")
+            tx.committed()
+            self.get()
+        except Exception:
+            conn.rollback()
             raise
         finally:
             cm.close_connection()
 
-    # Decrement the available doses
+    # Decrement the available doses, earliest expiring lot first
     def decrease_available_doses(self, num):
-        if self.available_doses - num < 0:
-            ValueError("Not enough available doses!")
-        self.available_doses -= num
+        if num <= 0:
+            raise ValueError("Argument cannot be negative!")
 
         cm = ConnectionManager()
         conn = cm.create_connection()
         cursor = conn.cursor()
 
-        update_vaccine_availability = "UPDATE vaccines SET Doses = %d WHERE name = %s"
         try:
-            cursor.execute(update_vaccine_availability, (self.available_doses, self.vaccine_name))
-            # you must call commit() to persist your data if you don't set autocommit to True
+            rows = []
+            Queries.LOT_STOCKED.execute(cursor, (self.vaccine_name, datetime.date.today()) + Queries.page())
+            for lot, shard, doses in cursor.fetchall():
+                if num == 0:
+                    break
+                take = min(num, doses)
+                Queries.LOT_TAKE_DOSES.execute(cursor, (take, self.vaccine_name, lot, shard, take))
+                row = cursor.fetchone()
+                if row is None:
+                    continue  # a reservation took some since the SELECT
+                rows.append(tuple(row))
+                num -= take
+            if num > 0:
+                raise ValueError("Not enough available doses!")
             conn.commit()
-        except pymssql.Error:
-            # print("Error occurred when updating vaccine availability")
+            for row in rows:
+                Vaccine.cache_store(*row)
+            self.get()
+        except Exception:
+            conn.rollback()
             raise
         finally:
             cm.close_connection()
 
+    @staticmethod
+    def add_to_lot(cursor, vaccine_name, lot, expires, num):
+        # Spreads num doses over the lot's shards inside the caller's
+        # transaction; a new expiry applies to every shard of the lot, not
+        # just the ones the doses went to. Returns the changed rows for
+        # cache_store() after commit.
+        shards = min(Vaccine.SHARDS, num)
+        rows = {}
+        for shard in range(shards):
+            rows[shard] = Vaccine.add_to_shard(cursor, vaccine_name, lot, shard, expires,
+                                               num // shards + (1 if shard < num % shards else 0))
+        if expires is not None:
+            Queries.LOT_SET_EXPIRES.execute(cursor, (expires, vaccine_name, lot, expires))
+            rows.update({row[2]: tuple(row) for row in cursor.fetchall()})
+        return list(rows.values())
+
+    @staticmethod
+    def add_to_shard(cursor, vaccine_name, lot, shard, expires, num):
+        Queries.LOT_ADD_DOSES.execute(cursor, (num, expires, vaccine_name, lot, shard))
+        row = cursor.fetchone()
+        if row:
+            return tuple(row)
+        Queries.LOT_INSERT.execute(cursor, (vaccine_name, lot, shard, expires, num))
+        return vaccine_name, lot, shard, expires, num, 0
+
+    @staticmethod
+    def cache_store(name, lot, shard, expires, doses, version):
+        row = (name, lot, shard, expires, doses, version)
+        with Vaccine._cache_lock:
+            key = (name.lower(), lot.lower(), shard)
+            cached = Vaccine._lots.get(key)
+            if cached is None or cached[5] <= version:
+                Vaccine._lots[key] = row
+                total = Vaccine._cache.get(name.lower(), (name, 0))
+                change = Vaccine._countable(row) - (Vaccine._countable(cached) if cached else 0)
+                Vaccine._cache[name.lower()] = (total[0], total[1] + change)
+            Vaccine._cache_stats["write_throughs"] += 1
+
+    @staticmethod
+    def _cache_vaccine(name):
+        with Vaccine._cache_lock:
+            Vaccine._cache.setdefault(name.lower(), (name, 0))
+
+    @staticmethod
+    def _countable(row):
+        # Doses of a shard row that can still be booked
+        expires = row[3]
+        return row[4] if expires is None or expires >= datetime.date.today() else 0
+
+    @staticmethod
+    def refresh_cache():
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        cursor = conn.cursor()
+
+        try:
+            Queries.VACCINE_ALL.execute(cursor, (datetime.date.today(),))
+            rows = cursor.fetchall()
+        finally:
+            cm.close_connection()
+
+        with Vaccine._cache_lock:
+            totals, lots, series = {}, {}, {}
+            for name, lot, shard, expires, doses, version, series_doses, interval_days in rows:
+                totals.setdefault(name.lower(), (name, 0))
+                series[name.lower()] = (series_doses, interval_days)
+                if lot is None:
+                    continue
+                key = (name.lower(), lot.lower(), shard)
+                cached = Vaccine._lots.get(key)
+                # a write-through may have landed after the SELECT
+                row = cached if cached is not None and cached[5] > version else (name, lot, shard, expires,
+                                                                                 doses, version)
+                lots[key] = row
+                totals[name.lower()] = (totals[name.lower()][0], totals[name.lower()][1] + Vaccine._countable(row))
+            Vaccine._cache = totals
+            Vaccine._lots = lots
+            Vaccine._series = series
+            Vaccine._cache_loaded_at = time.monotonic()
+            Vaccine._cache_stats["refreshes"] += 1
+
+    @staticmethod
+    def invalidate_cache():
+        with Vaccine._cache_lock:
+            Vaccine._cache_loaded_at = None
+
+    @staticmethod
+    def clear_cache():
+        # Forgets every cached row, e.g. after switching to another database,
+        # whose shard versions may be older than the cached ones
+        with Vaccine._cache_lock:
+            Vaccine._cache, Vaccine._lots, Vaccine._series = {}, {}, {}
+            Vaccine._cache_loaded_at = None
+
+    @staticmethod
+    def cache_stats():
+        with Vaccine._cache_lock:
+            return dict(Vaccine._cache_stats, size=len(Vaccine._cache), lot_shards=len(Vaccine._lots))
+
+    @staticmethod
+    def _cached(vaccine_name):
+        # Returns the cached (name, doses) for vaccine_name, or None when it
+        # is unknown or vaccine_name is None, reloading only when stale
+        with Vaccine._cache_lock:
+            loaded_at = Vaccine._cache_loaded_at
+            if loaded_at is not None and time.monotonic() - loaded_at < Vaccine.CACHE_TTL:
+                Vaccine._cache_stats["hits"] += 1
+                return Vaccine._cache.get(vaccine_name.lower()) if vaccine_name else None
+            Vaccine._cache_stats["misses"] += 1
+
+        Vaccine.refresh_cache()
+        if vaccine_name is None:
+            return None
+        with Vaccine._cache_lock:
+            return Vaccine._cache.get(vaccine_name.lower())
+
     def __str__(self):
         return f"(Vaccine Name: {self.vaccine_name}, Available Doses: {self.available_doses})"
@@ -0,0 +1,82 @@
+import datetime
+from db.ConnectionManager import ConnectionManager
+from db import Queries
+from db.Backend import DB_ERRORS, is_duplicate_key
+from model.Appointment import Appointment
+from model.Vaccine import Vaccine
+
+
+class Waitlist:
+    # Patients waiting for a date and vaccine that had no caregiver or dose
+    # left (reserve --wait), instead of re-running reserve until something
+    # frees up. Appointment.backfill() books them, in WaitlistOrder, inside
+    # the transaction that adds capacity; a booked patient's entry is gone and
+    # the appointment shows up in show_appointments.
+
+    @staticmethod
+    def join(patient_username, date, vaccine_name):
+        # Queues the patient and backfills the date in the same transaction:
+        # capacity may have appeared since their reservation failed, and
+        # anyone queued earlier goes first. Returns (waitlist_id, appointment),
+        # where appointment is the patient's booking if that happened at once.
+        if date < datetime.date.today():
+            raise ValueError("Cannot wait for a past date!")
+        if Vaccine(vaccine_name, None).get() is None:
+            raise ValueError("No such vaccine!")
+
+        def work(tx):
+            Queries.WAITLIST_INSERT.execute(tx.cursor, (patient_username, vaccine_name, date))
+            waitlist_id = tx.cursor.fetchone()[0] if tx.dialect == "mssql" else tx.cursor.lastrowid
+            mine = [a for a in Appointment.backfill(tx, [date])
+                    if a.patient_username.lower() == patient_username.lower()
+                    and a.vaccine_name.lower() == vaccine_name.lower()]
+            return waitlist_id, mine[0] if mine else None
+
+        try:
+            return Appointment._transaction(work)
+        except DB_ERRORS as e:
+            if is_duplicate_key(e):
+                raise ValueError("You are already waiting for this date and vaccine!")
+            raise
+
+    @staticmethod
+    def leave(patient_username, waitlist_id):
+        # False if the patient has no such entry (it may have been booked)
+        return Waitlist._update(Queries.WAITLIST_LEAVE, (waitlist_id, patient_username))
+
+    @staticmethod
+    def prioritize(waitlist_id, priority):
+        # Only changes who goes first under WaitlistOrder=priority
+        return Waitlist._update(Queries.WAITLIST_PRIORITIZE, (priority, waitlist_id))
+
+    @staticmethod
+    def entries(role, username):
+        # Upcoming entries as (waitlist_id, patient, vaccine, date, priority),
+        # in booking order per date: the patient's own, or all for caregivers
+        params = (datetime.date.today(),)
+        if role == "patient":
+            params = (username,) + params
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        try:
+            cursor = conn.cursor()
+            Queries.WAITLIST_LIST[role].execute(cursor, params, order=Appointment.waitlist_order())
+            return [tuple(row) for row in cursor.fetchall()]
+        finally:
+            cm.close_connection()
+
+    @staticmethod
+    def _update(query, params):
+        cm = ConnectionManager()
+        conn = cm.create_connection()
+        try:
+            cursor = conn.cursor()
+            query.execute(cursor, params)
+            changed = cursor.rowcount == 1
+            conn.commit()
+            return changed
+        except DB_ERRORS:
+            conn.rollback()
+            raise
+        finally:
+            cm.close_connection()
@@ -0,0 +1,94 @@
+# python -m unittest discover -s tests -t .   (from src/main/scheduler)
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from model import Assignment
+from model.Appointment import Appointment, ReservationConflict
+from model.Vaccine import Vaccine
+from model.Waitlist import Waitlist
+from benchmark import Seed
+
+
+class CancelBackfillTest(unittest.TestCase):
+    def setUp(self):
+        ConnectionManager.configure(SQLiteBackend(":memory:"), max_size=2)
+        Seed.seed(caregivers=1, patients=2, doses=10, days=1)
+        Vaccine.clear_cache()
+        self.vaccine_name = Seed.vaccine_name(0)
+
+    def tearDown(self):
+        ConnectionManager.get_pool().close()
+
+    def test_cancel_books_a_waiter_after_the_cache_expired(self):
+        booked = Appointment.reserve(Seed.patient_name(0), Seed.START_DATE, self.vaccine_name)
+        Waitlist.join(Seed.patient_name(1), Seed.START_DATE, self.vaccine_name)
+        Vaccine.invalidate_cache()
+
+        backfilled = []
+        self.assertIsNotNone(Appointment.cancel(booked.get_appointment_id(), backfilled))
+        self.assertEqual([a.patient_username for a in backfilled], [Seed.patient_name(1)])
+
+
+
+class ConcurrentReserveTest(unittest.TestCase):
+    # Patients race for the last dose or the last slot of a date, under each
+    # assignment strategy; exactly one of them may get it
+    THREADS = 8
+    PATIENTS = 24
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        ConnectionManager.get_pool().close()
+        self.tmp.cleanup()
+
+    def race(self, strategy, caregivers, doses):
+        ConnectionManager.configure(SQLiteBackend(os.path.join(self.tmp.name, f"{strategy}.db")),
+                                    max_size=self.THREADS)
+        Seed.seed(caregivers=caregivers, patients=self.PATIENTS, doses=doses, days=1)
+        Vaccine.clear_cache()
+
+        def book(i):
+            try:
+                return Appointment.reserve(Seed.patient_name(i), Seed.START_DATE, Seed.vaccine_name(0), strategy)
+            except (ValueError, ReservationConflict):
+                return None
+
+        with ThreadPoolExecutor(max_workers=self.THREADS) as pool:
+            booked = [a for a in pool.map(book, range(self.PATIENTS)) if a is not None]
+
+        self.assertEqual(len(booked), 1)
+        self.assertEqual(self.query("SELECT Appointment_ID FROM Appointments"),
+                         [(booked[0].get_appointment_id(),)])
+        (lowest, remaining), = self.query("SELECT MIN(Doses), SUM(Doses) FROM VaccineLots")
+        self.assertGreaterEqual(lowest, 0)
+        self.assertEqual(remaining, doses - 1)
+        self.assertEqual(self.query("SELECT SUM(Booked) FROM Availabilities"), [(1,)])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM Availabilities WHERE Booked > Slots"), [(0,)])
+
+    def query(self, sql):
+        cm = ConnectionManager()
+        cursor = cm.create_connection().cursor()
+        try:
+            cursor.execute(sql)
+            return [tuple(row) for row in cursor.fetchall()]
+        finally:
+            cm.close_connection()
+
+    def test_last_dose(self):
+        for name in sorted(Assignment.STRATEGIES):
+            with self.subTest(strategy=name):
+                self.race(Assignment.create(name), caregivers=self.PATIENTS, doses=1)
+
+    def test_last_slot(self):
+        for name in sorted(Assignment.STRATEGIES):
+            with self.subTest(strategy=name):
+                self.race(Assignment.create(name), caregivers=1, doses=self.PATIENTS)
+
+
+if __name__ == "__main__":
+    unittest.main()
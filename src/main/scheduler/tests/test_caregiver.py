@@ -0,0 +1,47 @@
+# python -m unittest discover -s tests -t .   (from src/main/scheduler)
+import datetime
+import unittest
+from unittest import mock
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from db import Queries
+from model.Caregiver import Caregiver
+from benchmark import Seed
+
+
+class UploadAvailabilityTest(unittest.TestCase):
+    def setUp(self):
+        ConnectionManager.configure(SQLiteBackend(":memory:"), max_size=2)
+        Seed.seed(caregivers=1, patients=0, vaccines=0, doses=0, days=0)
+        self.caregiver = Caregiver(Seed.caregiver_name(0))
+
+    def tearDown(self):
+        ConnectionManager.get_pool().close()
+
+    def test_returns_true_when_inserted(self):
+        self.assertIs(self.caregiver.upload_availability(datetime.date(2027, 1, 5)), True)
+
+    def test_returns_false_for_a_date_already_uploaded(self):
+        self.caregiver.upload_availability(datetime.date(2027, 1, 5))
+        self.assertIs(self.caregiver.upload_availability(datetime.date(2027, 1, 5)), False)
+
+    def test_reports_a_date_another_session_inserted_during_the_upload(self):
+        dates = [datetime.date(2027, 1, 5), datetime.date(2027, 1, 6)]
+        existing = Queries.AVAILABILITY_EXISTING.execute
+
+        def read_then_race(cursor, params):
+            result = existing(cursor, params)
+            if not raced:
+                raced.append(True)
+                Caregiver(Seed.caregiver_name(0)).upload_availability(dates[1])
+            return result
+
+        raced = []
+        with mock.patch.object(Queries.AVAILABILITY_EXISTING, "execute", read_then_race):
+            inserted, duplicates, _ = self.caregiver.upload_availabilities(dates)
+        self.assertEqual(inserted, [dates[0]])
+        self.assertEqual(duplicates, [dates[1]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+# python -m unittest discover -s tests -t .   (from src/main/scheduler)
+import unittest
+from db import Queries
+from db.Backend import SQLiteBackend
+from db.ConnectionManager import ConnectionManager
+from model.Vaccine import Vaccine
+from benchmark import Seed
+
+
+class VaccineCacheTest(unittest.TestCase):
+    def setUp(self):
+        ConnectionManager.configure(SQLiteBackend(":memory:"), max_size=1)
+        Seed.seed(caregivers=0, patients=0, doses=10, days=0)
+        Vaccine.clear_cache()
+
+    def tearDown(self):
+        ConnectionManager.get_pool().close()
+
+    def test_unknown_names_do_not_reload_a_fresh_cache(self):
+        Queries.reset_stats()
+        for _ in range(5):
+            self.assertIsNone(Vaccine("nosuchvaccine", None).get())
+        self.assertEqual(Queries.stats()["vaccine.all"][0], 1)
+        self.assertEqual(Vaccine(Seed.vaccine_name(0), None).get().get_available_doses(), 10)
+
+    def test_a_vaccine_added_here_is_known_at_once(self):
+        self.assertIsNone(Vaccine("novavax", None).get())
+        Vaccine("novavax", 5).save_to_db()
+        self.assertEqual(Vaccine("novavax", None).get().get_available_doses(), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,29 @@
+import hashlib
+import math
+
+
+class BloomFilter:
+    # Set membership with no false negatives: might_contain() is False only for
+    # keys that were never added, and True for about `error_rate` of the rest.
+    # Uses double hashing over one blake2b digest per key.
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def add(self, key):
+        for bit in self._positions(key):
+            self._bits[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+
+    def might_contain(self, key):
+        return all(self._bits[bit >> 3] & (1 << (bit & 7)) for bit in self._positions(key))
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
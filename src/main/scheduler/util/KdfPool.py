@@ -0,0 +1,72 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class KdfPoolBusy(Exception):
+    pass
+
+
+class KdfPool:
+    # Bounded executor for password hashing. hashlib.pbkdf2_hmac releases the
+    # GIL, so the default thread pool already spreads hashes over every core;
+    # kind="process" is there for interpreters where it does not. At most
+    # max_pending hashes are queued or running; further callers block for up
+    # to `timeout` seconds and then get KdfPoolBusy, which keeps a sign-in
+    # storm from piling up unbounded work.
+
+    def __init__(self, workers=None, kind="thread", max_pending=None, timeout=10.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.kind = kind
+        self.max_pending = max_pending or self.workers * 4
+        self.timeout = timeout
+        if kind == "thread":
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="kdf")
+        elif kind == "process":
+            self._executor = ProcessPoolExecutor(self.workers)
+        else:
+            raise ValueError(f"Unknown KDF pool kind: {kind}")
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise KdfPoolBusy("Too many sign-ins in progress, please try again!")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # KdfWorkers (default: CPU count), KdfPoolKind ("thread" or "process")
+    # and KdfQueue (max queued hashes) size the shared pool
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = KdfPool(workers=int(os.getenv("KdfWorkers") or 0) or None,
+                                kind=os.getenv("KdfPoolKind") or "thread",
+                                max_pending=int(os.getenv("KdfQueue") or 0) or None)
+    return _pool
+
+
+def configure(**options):
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = KdfPool(**options)
+    return _pool
@@ -0,0 +1,228 @@
+import cProfile
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+
+
+class LatencyStats:
+    # Per-command latency samples and error counts for scripted runs
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, command, seconds, error=False):
+        self.samples[command].append(seconds)
+        if error:
+            self.errors[command] += 1
+
+    @staticmethod
+    def percentile(sorted_samples, p):
+        if not sorted_samples:
+            return 0.0
+        index = min(len(sorted_samples) - 1, int(round(p / 100 * (len(sorted_samples) - 1))))
+        return sorted_samples[index]
+
+    def to_dict(self):
+        result = {}
+        for command in sorted(self.samples):
+            samples = sorted(self.samples[command])
+            result[command] = {
+                "count": len(samples),
+                "errors": self.errors[command],
+                "mean_ms": sum(samples) / len(samples) * 1000,
+                "p50_ms": self.percentile(samples, 50) * 1000,
+                "p95_ms": self.percentile(samples, 95) * 1000,
+                "p99_ms": self.percentile(samples, 99) * 1000,
+                "max_ms": samples[-1] * 1000,
+            }
+        return result
+
+    def summary(self):
+        lines = [f"{'command':<28}{'count':>8}{'errors':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"]
+        total = total_errors = 0
+        for command in sorted(self.samples):
+            samples = sorted(self.samples[command])
+            errors = self.errors[command]
+            total += len(samples)
+            total_errors += errors
+            lines.append(f"{command:<28}{len(samples):>8}{errors:>8}"
+                         f"{sum(samples) / len(samples) * 1000:>10.2f}"
+                         f"{self.percentile(samples, 50) * 1000:>10.2f}"
+                         f"{self.percentile(samples, 95) * 1000:>10.2f}"
+                         f"{self.percentile(samples, 99) * 1000:>10.2f}"
+                         f"{samples[-1] * 1000:>10.2f}")
+        lines.append(f"{'total':<28}{total:>8}{total_errors:>8}")
+        return "\n".join(lines)
+
+
+class Histogram:
+    # Log-bucketed latency histogram: fixed memory, percentiles accurate to
+    # one 8% bucket, cheap enough to leave on in a long-running process
+    BASE = 1e-6
+    GROWTH = 1.08
+
+    def __init__(self):
+        self.buckets = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        index = 0 if seconds <= self.BASE else int(math.log(seconds / self.BASE, self.GROWTH)) + 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.max, self.BASE * self.GROWTH ** index)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+PHASES = ("connect", "query", "kdf", "commit")
+
+
+class CommandTiming:
+
+    def __init__(self, name):
+        self.name = name
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.rows = 0
+        self.connections_opened = 0
+
+
+class Instrumentation:
+    # Per-command wall time split into connect / query / KDF / commit time,
+    # plus rows fetched and connections opened, kept as histograms. The hooks
+    # in ConnectionManager and Util report into the timing of the command
+    # running on the current thread; they are no-ops unless enabled.
+    # Selected commands can also run under cProfile, and tracemalloc can
+    # record each command's peak allocation.
+
+    def __init__(self):
+        self.enabled = False
+        self.profile_commands = set()
+        self.trace_memory = False
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(lambda: {key: Histogram() for key in ("total",) + PHASES})
+        self._rows = defaultdict(int)
+        self._connections = defaultdict(int)
+        self._peak_memory = defaultdict(int)
+
+    def current(self):
+        return getattr(self._local, "timing", None)
+
+    @contextmanager
+    def command(self, name):
+        if not self.enabled or self.current() is not None:
+            yield
+            return
+        timing = CommandTiming(name)
+        self._local.timing = timing
+        profiler = cProfile.Profile() if name in self.profile_commands else None
+        baseline = 0
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            elapsed = time.perf_counter() - started
+            self._local.timing = None
+            peak = tracemalloc.get_traced_memory()[1] - baseline if self.trace_memory else 0
+            self._record(timing, elapsed, peak)
+            if profiler:
+                print(f"--- cProfile: {name} ---", file=sys.stderr)
+                pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(15)
+
+    @contextmanager
+    def phase(self, name):
+        timing = self.current()
+        if timing is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing.phases[name] += time.perf_counter() - started
+
+    def add_rows(self, count):
+        timing = self.current()
+        if timing is not None:
+            timing.rows += count
+
+    def connection_opened(self):
+        timing = self.current()
+        if timing is not None:
+            timing.connections_opened += 1
+
+    def _record(self, timing, elapsed, peak):
+        with self._lock:
+            histograms = self._histograms[timing.name]
+            histograms["total"].record(elapsed)
+            for phase in PHASES:
+                histograms[phase].record(timing.phases[phase])
+            self._rows[timing.name] += timing.rows
+            self._connections[timing.name] += timing.connections_opened
+            self._peak_memory[timing.name] = max(self._peak_memory[timing.name], peak)
+
+    def report(self):
+        header = f"{'command':<28}{'count':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+        header += "".join(f"{phase + ' ms':>12}" for phase in PHASES)
+        header += f"{'rows':>9}{'conns':>7}"
+        if self.trace_memory:
+            header += f"{'peak KiB':>10}"
+        lines = [header]
+        with self._lock:
+            for name in sorted(self._histograms):
+                histograms = self._histograms[name]
+                total = histograms["total"]
+                line = (f"{name:<28}{total.count:>7}"
+                        f"{total.percentile(50) * 1000:>9.2f}"
+                        f"{total.percentile(95) * 1000:>9.2f}"
+                        f"{total.percentile(99) * 1000:>9.2f}")
+                # phases are shown as mean time per command
+                line += "".join(f"{histograms[phase].mean() * 1000:>12.2f}" for phase in PHASES)
+                line += f"{self._rows[name]:>9}{self._connections[name]:>7}"
+                if self.trace_memory:
+                    line += f"{self._peak_memory[name] / 1024:>10.1f}"
+                lines.append(line)
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._rows.clear()
+            self._connections.clear()
+            self._peak_memory.clear()
+
+
+# Process-wide instance used by the hooks; SchedulerStats=1 turns it on
+instrumentation = Instrumentation()
+instrumentation.enabled = os.getenv("SchedulerStats") == "1"
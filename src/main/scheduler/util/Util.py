@@ -1,17 +1,99 @@
 import hashlib
+import hmac
 import os
+from util import KdfPool
+from util.Stats import instrumentation
+
+
+def _derive(digest, password, salt, iterations, dklen):
+    # Module level so it can be sent to a process pool
+    return hashlib.pbkdf2_hmac(digest, password.encode('utf-8'), salt, iterations, dklen=dklen)
 
 
 class Util:
+    # Password hashes are stored with a parameter string such as
+    # "pbkdf2_sha256$100000" (the Kdf column) so the algorithm and iteration
+    # count can change without invalidating existing accounts. Rows written
+    # before the column existed have Kdf = NULL and use LEGACY_PARAMS.
+    LEGACY_PARAMS = "pbkdf2_sha256$100000"
+    ALGORITHMS = {"pbkdf2_sha256": "sha256", "pbkdf2_sha512": "sha512"}
+    HASH_LENGTH = 16  # Hash is BINARY(16)
+
+    @staticmethod
     def generate_salt():
         return os.urandom(16)
 
-    def generate_hash(password, salt):
-        key = hashlib.pbkdf2_hmac(
-            'sha256',
-            password.encode('utf-8'),
-            salt,
-            100000,
-            dklen=16
-        )
-        return key
+    @staticmethod
+    def generate_hash(password, salt, params=None):
+        with instrumentation.phase("kdf"):
+            return Util.submit_hash(password, salt, params).result()
+
+    @staticmethod
+    def submit_hash(password, salt, params=None):
+        # Runs the KDF on the shared KdfPool and returns a Future of the hash
+        algorithm, iterations = Util.parse_params(params or Util.LEGACY_PARAMS)
+        return KdfPool.get_pool().submit(_derive, Util.ALGORITHMS[algorithm], password, salt,
+                                         iterations, Util.HASH_LENGTH)
+
+    @staticmethod
+    def current_params():
+        # KdfAlgorithm / KdfIterations tune the parameters for new hashes
+        algorithm = os.getenv("KdfAlgorithm") or "pbkdf2_sha256"
+        iterations = int(os.getenv("KdfIterations") or 100000)
+        return Util.format_params(algorithm, iterations)
+
+    @staticmethod
+    def format_params(algorithm, iterations):
+        if algorithm not in Util.ALGORITHMS:
+            raise ValueError(f"Unsupported password hash algorithm: {algorithm}")
+        if iterations <= 0:
+            raise ValueError("Iteration count must be positive!")
+        return f"{algorithm}${iterations}"
+
+    @staticmethod
+    def parse_params(params):
+        algorithm, iterations = params.split("$")
+        if algorithm not in Util.ALGORITHMS:
+            raise ValueError(f"Unsupported password hash algorithm: {algorithm}")
+        return algorithm, int(iterations)
+
+    @staticmethod
+    def hash_password(password, params=None):
+        # Returns (salt, hash, params) for a new credential
+        params = params or Util.current_params()
+        salt = Util.generate_salt()
+        return salt, Util.generate_hash(password, salt, params), params
+
+    @staticmethod
+    def hash_passwords(passwords, params=None):
+        # hash_password() for many passwords: every hash is queued on the
+        # KdfPool before any is awaited
+        params = params or Util.current_params()
+        pending = []
+        for password in passwords:
+            salt = Util.generate_salt()
+            pending.append((salt, Util.submit_hash(password, salt, params)))
+        with instrumentation.phase("kdf"):
+            return [(salt, future.result(), params) for salt, future in pending]
+
+    @staticmethod
+    def verify_password(password, salt, stored_hash, params=None):
+        calculated_hash = Util.generate_hash(password, salt, params)
+        return hmac.compare_digest(calculated_hash, bytes(stored_hash))
+
+    @staticmethod
+    def needs_rehash(params):
+        return (params or Util.LEGACY_PARAMS) != Util.current_params()
+
+    @staticmethod
+    def parse_time_of_day(text):
+        # "HH:MM" -> minutes after midnight
+        hours, minutes = text.split(":")
+        hours, minutes = int(hours), int(minutes)
+        if not (0 <= hours <= 24 and 0 <= minutes < 60) or hours * 60 + minutes > 24 * 60:
+            raise ValueError(f"Invalid time of day: {text}")
+        return hours * 60 + minutes
+
+    @staticmethod
+    def format_time_of_day(minute):
+        return f"{minute // 60:02d}:{minute % 60:02d}"